@@ -0,0 +1,131 @@
+"""
+自适应视觉模式
+只在需要时发送截图：首次访问页面、上一步动作失败、可交互元素缺少文本标签、或模型主动请求截图
+"""
+
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+from browser_use.agent.views import ActionResult
+from browser_use.browser.views import BrowserState
+
+from src.agent.browser_use.replay import normalize_url
+from src.browser.dom_delta import snapshot_elements
+
+logger = logging.getLogger(__name__)
+
+REQUEST_SCREENSHOT_ACTION = "request_screenshot"
+LABEL_ATTRIBUTES = ("aria-label", "title", "placeholder", "alt", "value", "name")
+
+REASON_FIRST_VISIT = "first_visit"
+REASON_ACTION_FAILED = "action_failed"
+REASON_FEW_LABELS = "few_text_labels"
+REASON_REQUESTED = "requested"
+
+
+@dataclass
+class AdaptiveVisionSettings:
+    """自适应视觉配置"""
+    enabled: bool = True
+    min_labelled_ratio: float = 0.5  # 有文本标签的元素占比低于该值时发送截图
+    min_labelled_elements: int = 3  # 有文本标签的元素少于该数量时发送截图
+
+
+@dataclass
+class AdaptiveVisionStats:
+    """截图统计；节省的字节与延迟按已发送截图的平均值估算"""
+    screenshots_sent: int = 0
+    screenshots_skipped: int = 0
+    bytes_sent: int = 0
+    capture_seconds: float = 0.0
+    reasons: Dict[str, int] = field(default_factory=dict)
+
+    def bytes_saved(self) -> int:
+        if not self.screenshots_sent:
+            return 0
+        return int(self.bytes_sent / self.screenshots_sent * self.screenshots_skipped)
+
+    def latency_saved(self) -> float:
+        if not self.screenshots_sent:
+            return 0.0
+        return self.capture_seconds / self.screenshots_sent * self.screenshots_skipped
+
+    def summary(self) -> str:
+        reasons = ", ".join(f"{reason} {count}" for reason, count in self.reasons.items()) or "无"
+        return (
+            f"发送 {self.screenshots_sent} 张截图, 跳过 {self.screenshots_skipped} 张, "
+            f"节省约 {self.bytes_saved() / 1024:.0f} KB / {self.latency_saved():.2f}s (发送原因: {reasons})"
+        )
+
+
+def count_labelled_elements(state: BrowserState) -> int:
+    """统计带文本或可读标签属性的可交互元素数"""
+    labelled = 0
+    for snapshot in snapshot_elements(state.selector_map or {}).values():
+        attributes = dict(snapshot.attributes)
+        if snapshot.text or any(attributes.get(name) for name in LABEL_ATTRIBUTES):
+            labelled += 1
+    return labelled
+
+
+class AdaptiveVisionPolicy:
+    """
+    作为 CustomBrowserContext 的截图策略使用：每步开始时 begin_step 记录失败与请求信号，
+    该步第一次 get_state 时结合 DOM 决定是否截图；同一步内后续的 get_state 不截图
+    """
+
+    def __init__(self, settings: Optional[AdaptiveVisionSettings] = None):
+        self.settings = settings or AdaptiveVisionSettings()
+        self.stats = AdaptiveVisionStats()
+        self.visited_urls: Set[str] = set()
+        self._pending = False
+        self._step_reason: Optional[str] = None
+
+    def reset(self) -> None:
+        self.stats = AdaptiveVisionStats()
+        self.visited_urls = set()
+        self._pending = False
+        self._step_reason = None
+
+    def begin_step(self, last_result: Optional[List[ActionResult]], last_actions: List[str]) -> None:
+        self._pending = True
+        self._step_reason = None
+        if REQUEST_SCREENSHOT_ACTION in last_actions:
+            self._step_reason = REASON_REQUESTED
+        elif last_result and any(r.error for r in last_result):
+            self._step_reason = REASON_ACTION_FAILED
+
+    def _reason(self, state: BrowserState) -> Optional[str]:
+        url = normalize_url(state.url)
+        first_visit = url not in self.visited_urls
+        self.visited_urls.add(url)
+        if self._step_reason:
+            return self._step_reason
+        if first_visit:
+            return REASON_FIRST_VISIT
+        total = len(state.selector_map or {})
+        labelled = count_labelled_elements(state)
+        if labelled < self.settings.min_labelled_elements or labelled < self.settings.min_labelled_ratio * total:
+            return REASON_FEW_LABELS
+        return None
+
+    def should_capture(self, state: BrowserState) -> bool:
+        if not self._pending:
+            return False
+        self._pending = False
+        reason = self._reason(state)
+        if reason is None:
+            self.stats.screenshots_skipped += 1
+            logger.debug(f"🖼️ 本步不发送截图 ({state.url})")
+            return False
+        self.stats.reasons[reason] = self.stats.reasons.get(reason, 0) + 1
+        logger.debug(f"🖼️ 本步发送截图: {reason}")
+        return True
+
+    def record_capture(self, screenshot: Optional[str], seconds: float) -> None:
+        if not screenshot:
+            return
+        self.stats.screenshots_sent += 1
+        self.stats.bytes_sent += len(screenshot)
+        self.stats.capture_seconds += seconds
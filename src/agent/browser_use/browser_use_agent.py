@@ -1,25 +1,63 @@
 from __future__ import annotations
 
 import asyncio
+import inspect
+import json
 import logging
 import os
+import time
 from dataclasses import dataclass
 from typing import Dict, Optional
 
 # from lmnr.sdk.decorators import observe
-from browser_use.agent.gif import create_history_gif
 from browser_use.agent.service import Agent, AgentHookFunc
 from browser_use.agent.views import (
     ActionResult,
     AgentHistory,
     AgentHistoryList,
+    AgentOutput,
     AgentStepInfo,
+    StepMetadata,
     ToolCallingMethod,
 )
 from browser_use.browser.views import BrowserStateHistory
 from browser_use.utils import time_execution_async
 from dotenv import load_dotenv
 from browser_use.agent.message_manager.utils import is_model_without_tool_support
+from langchain_core.messages import HumanMessage
+
+from src.agent.browser_use.adaptive_vision import AdaptiveVisionPolicy, AdaptiveVisionSettings
+from src.agent.browser_use.checkpoint import (
+    AgentCheckpoint,
+    CheckpointWriter,
+    load_checkpoint,
+    load_message_manager_state,
+)
+from src.agent.browser_use.history_compaction import HistoryCompactionSettings, HistoryCompactor
+from src.agent.browser_use.planner_scheduler import (
+    PlannerScheduler,
+    PlannerScheduleSettings,
+    append_planner_run,
+)
+from src.agent.browser_use.loop_detection import LoopDetection, LoopDetectionSettings, LoopDetector
+from src.agent.browser_use.message_manager import CustomMessageManager, DomDeltaSettings
+from src.agent.browser_use.replay import ReplayStore, is_done_step, verify_replay_step
+from src.agent.browser_use.tool_selection import ToolSelectionSettings, ToolSelector
+from src.utils.content_cache import get_content_cache
+from src.utils.recording import schedule_history_recording
+from src.browser.custom_context import CustomBrowserContext, use_screenshot_policy
+from src.browser.screenshot_crop import ScreenshotCropSettings
+from src.utils.screenshot_store import ScreenshotStore
+from src.utils.performance_monitor import (
+    PHASE_ACTION_EXECUTION,
+    PHASE_LLM,
+    PHASE_PLANNER,
+    PerformanceMonitor,
+    TaskMetrics,
+    phase_span,
+    reset_current_step,
+    set_current_step,
+)
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -70,10 +108,230 @@ class BrowserUseAgent(Agent):
     def __init__(self, *args, **kwargs):
         # 兼容 webui 传递 extraction_llm 参数
         self.extraction_llm = kwargs.pop('extraction_llm', None)
+        # 录制/回放缓存：命中时直接回放已验证的动作序列，跳过 LLM 调用
+        self.replay_store: Optional[ReplayStore] = kwargs.pop('replay_store', None)
+        # 截图落盘存储：历史中只保留路径引用，避免长期持有 base64 截图
+        self.screenshot_store: Optional[ScreenshotStore] = kwargs.pop('screenshot_store', None)
+        # 历史压缩：用廉价模型把旧步骤总结为记忆块，控制长任务的提示词长度
+        history_compaction: Optional[HistoryCompactionSettings] = kwargs.pop('history_compaction', None)
+        compaction_llm = kwargs.pop('compaction_llm', None)
+        # DOM 增量编码：页面变化较小时只向 LLM 发送元素差异
+        dom_delta: Optional[DomDeltaSettings] = kwargs.pop('dom_delta', None)
+        # 循环检测：按 (URL, DOM 指纹, 动作) 哈希检测重复循环，先注入恢复提示，仍循环则提前停止
+        loop_detection: Optional[LoopDetectionSettings] = kwargs.pop('loop_detection', LoopDetectionSettings())
+        # 自适应视觉：只在首次访问页面、动作失败、元素缺少文本标签或模型请求时发送截图
+        adaptive_vision: Optional[AdaptiveVisionSettings] = kwargs.pop('adaptive_vision', None)
+        # 截图聚焦裁剪：把截图裁剪到最近交互或新出现的元素区域，可附带整页缩略图
+        screenshot_crop: Optional[ScreenshotCropSettings] = kwargs.pop('screenshot_crop', None)
+        # 规划器调度：每隔 N 步或在失败/新域名/子目标停滞时才重新规划，其余步骤复用上一次计划
+        planner_schedule: Optional[PlannerScheduleSettings] = kwargs.pop('planner_schedule', None)
+        # 工具子集选择：按任务与页面相关性只发送前 K 个工具加核心浏览器动作，模型可用 request_tools 追加
+        tool_selection: Optional[ToolSelectionSettings] = kwargs.pop('tool_selection', None)
+        # 每次运行追加一条规划统计，用于比较不同间隔下的成功率
+        self.planner_stats_path: Optional[str] = kwargs.pop('planner_stats_path', None)
+        # 断点文件：每步结束后追加写入，进程重启后可用 restore_checkpoint 继续执行
+        self.checkpoint_path: Optional[str] = kwargs.pop('checkpoint_path', None)
         super().__init__(*args, **kwargs)
+        self._message_manager = CustomMessageManager(
+            task=self.task,
+            system_message=self._message_manager.system_prompt,
+            settings=self._message_manager.settings,
+            state=self.state.message_manager_state,
+        )
+        self.configure_dom_delta(dom_delta)
+        self.history_compactor: Optional[HistoryCompactor] = None
+        if history_compaction and history_compaction.enabled:
+            self.history_compactor = HistoryCompactor(
+                compaction_llm or self.extraction_llm or self.llm, history_compaction
+            )
+        self.loop_detector: Optional[LoopDetector] = None
+        self._detected_loop: Optional[LoopDetection] = None
+        self.configure_loop_detection(loop_detection)
+        self.vision_policy: Optional[AdaptiveVisionPolicy] = None
+        self.configure_adaptive_vision(adaptive_vision)
+        self.configure_screenshot_crop(screenshot_crop)
+        self.planner_scheduler: Optional[PlannerScheduler] = None
+        self.configure_planner_schedule(planner_schedule)
+        self.tool_selector: Optional[ToolSelector] = None
+        self.configure_tool_selection(tool_selection)
+        self._checkpoint_writer: Optional[CheckpointWriter] = None
+        self._resumed_steps: int = 0  # 从断点恢复的已完成步数
+        self.replayed_steps: int = 0  # 本次运行由回放完成的步数
+        self._replay_start_url: str = ''
+        # 后台录像任务，完成时结果为录像路径；UI 可 await 它获知录像就绪
+        self.recording_task: Optional[asyncio.Task] = None
+        # 每步分阶段计时（DOM 提取、截图、提示词组装、LLM、动作执行、动作后等待）
+        self.performance_monitor = PerformanceMonitor()
+        self.task_metrics: Optional[TaskMetrics] = None
         # 初始化重试策略
         self.retry_strategy = RetryStrategy()
         self.error_retry_count: Dict[str, int] = {}  # 追踪每个错误的重试次数
+        # 暂停/恢复/停止的事件驱动控制，agent 与 webui 共享，避免 sleep 轮询
+        self._resumed_event = asyncio.Event()  # set 表示未暂停
+        self._stopped_event = asyncio.Event()
+        self._control_changed_event = asyncio.Event()
+        self._paused_by_signal = False  # 区分 Ctrl+C 暂停（需终端确认）与 UI 暂停
+        self._sync_control_events()
+
+    def configure_dom_delta(self, dom_delta: Optional[DomDeltaSettings]) -> None:
+        """启用或关闭 DOM 增量编码；更换 browser_context 后需要重新调用"""
+        if dom_delta and isinstance(self.browser_context, CustomBrowserContext):
+            self._message_manager.enable_dom_delta(self.browser_context, dom_delta)
+        else:
+            self._message_manager.dom_delta_context = None
+
+    def configure_loop_detection(self, loop_detection: Optional[LoopDetectionSettings]) -> None:
+        """启用或关闭状态哈希循环检测"""
+        self.loop_detector = LoopDetector(loop_detection) if loop_detection and loop_detection.enabled else None
+
+    def configure_adaptive_vision(self, adaptive_vision: Optional[AdaptiveVisionSettings]) -> None:
+        """启用或关闭自适应视觉；仅在 use_vision 开启时生效"""
+        self.vision_policy = (
+            AdaptiveVisionPolicy(adaptive_vision) if adaptive_vision and adaptive_vision.enabled else None
+        )
+        # request_screenshot 只对自适应视觉有意义，其余情况不进入动作 schema
+        if hasattr(self.controller, 'set_screenshot_requests'):
+            self.controller.set_screenshot_requests(self.vision_policy is not None and self.settings.use_vision)
+            self._setup_action_models()
+
+    def configure_screenshot_crop(self, screenshot_crop: Optional[ScreenshotCropSettings]) -> None:
+        """启用或关闭截图聚焦裁剪；仅在 use_vision 开启时生效"""
+        viewport_width = getattr(getattr(self.browser_context, 'config', None), 'window_width', None) or 1280
+        self._message_manager.enable_screenshot_crop(screenshot_crop, viewport_width)
+
+    def configure_planner_schedule(self, planner_schedule: Optional[PlannerScheduleSettings]) -> None:
+        """启用或关闭规划器调度；启用时由调度器逐步决定是否规划，browser_use 的固定间隔设为 1"""
+        if planner_schedule and planner_schedule.enabled:
+            self.planner_scheduler = PlannerScheduler(planner_schedule)
+            self.settings.planner_interval = 1
+        else:
+            self.planner_scheduler = None
+
+    def configure_tool_selection(self, tool_selection: Optional[ToolSelectionSettings]) -> None:
+        """启用或关闭工具子集选择；controller 的 request_tools 动作共享同一个选择器"""
+        self.tool_selector = ToolSelector(tool_selection) if tool_selection and tool_selection.enabled else None
+        if hasattr(self.controller, 'set_tool_selector'):
+            self.controller.set_tool_selector(self.tool_selector)
+            self._setup_action_models()
+
+    async def _tool_selection_query(self, page) -> str:
+        """排序用的查询：任务、当前页面 URL 与标题、上一步的目标与记忆"""
+        parts = [self.task, page.url]
+        try:
+            parts.append(await page.title())
+        except Exception:
+            pass
+        if self.state.history.history:
+            model_output = self.state.history.history[-1].model_output
+            if model_output and model_output.current_state:
+                parts += [model_output.current_state.next_goal, model_output.current_state.memory]
+        return '\n'.join(part for part in parts if part)
+
+    async def _update_action_models_for_page(self, page) -> None:
+        if self.tool_selector is None:
+            return await super()._update_action_models_for_page(page)
+        start_time = time.perf_counter()
+        registry = self.controller.registry
+        selected = self.tool_selector.select(registry.registry.actions, await self._tool_selection_query(page))
+        if selected is None:
+            return await super()._update_action_models_for_page(page)
+        self.ActionModel = registry.create_action_model(include_actions=selected, page=page)
+        self.AgentOutput = AgentOutput.type_with_custom_actions(self.ActionModel)
+        self.DoneActionModel = registry.create_action_model(include_actions=['done'], page=page)
+        self.DoneAgentOutput = AgentOutput.type_with_custom_actions(self.DoneActionModel)
+        self.tool_selector.record_step(registry, self.ActionModel, time.perf_counter() - start_time)
+
+    def _recent_goals(self) -> list:
+        n = self.planner_scheduler.settings.stall_steps if self.planner_scheduler else 0
+        goals = []
+        for item in self.state.history.history[-n:] if n > 0 else []:
+            if item.model_output and item.model_output.current_state:
+                goals.append(item.model_output.current_state.next_goal)
+        return goals
+
+    def _last_interacted_xpaths(self) -> set:
+        if not self.state.history.history:
+            return set()
+        return {
+            element.xpath for element in self.state.history.history[-1].state.interacted_element
+            if element is not None and element.xpath
+        }
+
+    def _last_action_names(self) -> list:
+        if not self.state.history.history:
+            return []
+        model_output = self.state.history.history[-1].model_output
+        if not model_output or not model_output.action:
+            return []
+        return [name for action in model_output.action for name in action.model_dump(exclude_unset=True)]
+
+    def _sync_control_events(self) -> None:
+        """根据 state.paused / state.stopped 同步控制事件，并唤醒所有等待者"""
+        if self.state.paused:
+            self._resumed_event.clear()
+        else:
+            self._resumed_event.set()
+        if self.state.stopped:
+            self._stopped_event.set()
+        else:
+            self._stopped_event.clear()
+        # 每次状态变化替换为新事件，已在等待的协程会被唤醒
+        changed_event = self._control_changed_event
+        self._control_changed_event = asyncio.Event()
+        changed_event.set()
+
+    def pause(self) -> None:
+        super().pause()
+        self._sync_control_events()
+
+    def resume(self) -> None:
+        super().resume()
+        self._paused_by_signal = False
+        self._sync_control_events()
+
+    def _pause_from_signal(self) -> None:
+        """Ctrl+C 触发的暂停，需要在终端确认后才恢复"""
+        self._paused_by_signal = True
+        self.pause()
+
+    def stop(self) -> None:
+        super().stop()
+        # 停止时解除暂停，保证等待中的 run 循环能立即退出
+        self.state.paused = False
+        self._sync_control_events()
+
+    def reset_control(self) -> None:
+        """任务结束后清除暂停/停止标志，供下一个任务复用同一个 agent"""
+        self.state.paused = False
+        self.state.stopped = False
+        self._paused_by_signal = False
+        self._sync_control_events()
+
+    async def wait_until_resumed(self) -> None:
+        """暂停期间挂起，直到恢复或停止；未暂停时立即返回，不占用 CPU"""
+        if self._resumed_event.is_set() or self._stopped_event.is_set():
+            return
+        waiters = [
+            asyncio.ensure_future(self._resumed_event.wait()),
+            asyncio.ensure_future(self._stopped_event.wait()),
+        ]
+        try:
+            await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+
+    async def wait_for_control_change(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待下一次暂停/恢复/停止状态变化。
+        返回: True 表示状态发生变化，False 表示超时
+        """
+        changed_event = self._control_changed_event
+        try:
+            await asyncio.wait_for(changed_event.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
     
     def _set_tool_calling_method(self) -> ToolCallingMethod | None:
         tool_calling_method = self.settings.tool_calling_method
@@ -268,6 +526,389 @@ class BrowserUseAgent(Agent):
 
 
 
+    def _make_history_item(self, model_output, state, result, metadata=None) -> None:
+        super()._make_history_item(model_output, state, result, metadata)
+        if self.loop_detector and model_output and model_output.action:
+            try:
+                actions = [action.model_dump(exclude_unset=True) for action in model_output.action]
+                self._detected_loop = self.loop_detector.observe(state, actions) or self._detected_loop
+            except Exception as e:
+                logger.debug(f'循环检测失败: {e}')
+        if self.screenshot_store and self.state.history.history:
+            history_state = self.state.history.history[-1].state
+            if history_state.screenshot:
+                try:
+                    history_state.screenshot = self.screenshot_store.put(history_state.screenshot)
+                except Exception as e:
+                    logger.warning(f'⚠️ 截图写入存储失败，保留在内存中: {e}')
+
+    async def step(self, step_info: Optional[AgentStepInfo] = None) -> None:
+        """执行一步并记录各阶段耗时；阶段由 phase_span 在浏览器上下文、消息管理器等处记录"""
+        policy = self.vision_policy if self.settings.use_vision else None
+        if policy is not None:
+            policy.begin_step(self.state.last_result, self._last_action_names())
+        if isinstance(self.browser_context, CustomBrowserContext):
+            # 每步都发送截图时始终放行视觉资源，自适应视觉只在截图前恢复被拦截的资源
+            self.browser_context.set_vision(self.settings.use_vision and policy is None)
+        if self._message_manager.crop_settings is not None:
+            self._message_manager.set_focus_elements(self._last_interacted_xpaths())
+        with use_screenshot_policy(policy):
+            await self._timed_step(step_info)
+
+    async def _timed_step(self, step_info: Optional[AgentStepInfo] = None) -> None:
+        if self.performance_monitor.current_task is None:
+            return await super().step(step_info)
+
+        step_number = step_info.step_number + 1 if step_info else self.state.n_steps
+        step_metrics = self.performance_monitor.start_step(step_number)
+        token = set_current_step(step_metrics)
+        try:
+            await super().step(step_info)
+        finally:
+            reset_current_step(token)
+            results = self.state.last_result or []
+            errors = [r.error for r in results if r.error]
+            step_metrics.action_count = len(results)
+            self.performance_monitor.finish_step(
+                step_metrics,
+                'failed' if errors else 'success',
+                str(errors[0]).split('\n')[0][:100] if errors else None,
+            )
+
+    async def get_next_action(self, input_messages):
+        with phase_span(PHASE_LLM):
+            return await super().get_next_action(input_messages)
+
+    async def _run_planner(self):
+        if self.planner_scheduler is None or not self.settings.planner_llm:
+            with phase_span(PHASE_PLANNER):
+                return await super()._run_planner()
+
+        url = await self._get_current_url()
+        reason = self.planner_scheduler.replan_reason(
+            self.state.n_steps, self.state.last_result, url, self._recent_goals()
+        )
+        if reason is None:
+            # 返回 None 时不添加新的计划消息，上一次的计划仍保留在消息历史中
+            self.planner_scheduler.record_skip()
+            logger.debug(f'🗺️ 步骤 {self.state.n_steps} 复用上一次计划')
+            return None
+        with phase_span(PHASE_PLANNER):
+            plan = await super()._run_planner()
+        self.planner_scheduler.record_plan(self.state.n_steps, url, reason)
+        logger.info(f'🗺️ 步骤 {self.state.n_steps} 重新规划: {reason}')
+        return plan
+
+    async def multi_act(self, actions, check_for_new_elements: bool = True):
+        """
+        连续的 MCP 工具动作互不依赖，并发执行（受连接池的按服务器并发上限与超时约束）；
+        浏览器动作仍按原逻辑顺序执行。结果按动作顺序返回
+        """
+        with phase_span(PHASE_ACTION_EXECUTION):
+            results = []
+            for is_mcp, segment in self._split_mcp_segments(actions):
+                if is_mcp and len(segment) > 1:
+                    segment_results = await self._act_concurrently(segment)
+                else:
+                    segment_results = await super().multi_act(segment, check_for_new_elements=check_for_new_elements)
+                results.extend(segment_results)
+                # 与 browser_use 相同：出错、完成或页面变化导致动作被截断时不再执行后续动作
+                if any(r.is_done or r.error for r in segment_results) or self._segment_truncated(segment, segment_results):
+                    break
+            return results
+
+    @staticmethod
+    def _segment_truncated(segment, segment_results) -> bool:
+        if len(segment_results) < len(segment):
+            return True
+        last = segment_results[-1].extracted_content if segment_results else None
+        # browser_use 在页面变化后中断剩余动作时追加的提示
+        return bool(last) and last.startswith(('Element index changed after action', 'Something new appeared after action'))
+
+    @staticmethod
+    def _split_mcp_segments(actions) -> list:
+        segments = []
+        for action in actions:
+            is_mcp = any(name.startswith('mcp.') for name in action.model_dump(exclude_unset=True))
+            if segments and segments[-1][0] == is_mcp:
+                segments[-1][1].append(action)
+            else:
+                segments.append((is_mcp, [action]))
+        return segments
+
+    async def _act_concurrently(self, actions) -> list:
+        await self._raise_if_stopped_or_paused()
+
+        async def act(action):
+            try:
+                return await self.controller.act(
+                    action,
+                    self.browser_context,
+                    self.settings.page_extraction_llm,
+                    self.sensitive_data,
+                    self.settings.available_file_paths,
+                    context=self.context,
+                )
+            except Exception as e:
+                # 单个工具失败或超时不影响同批的其他调用
+                return ActionResult(error=str(e), include_in_memory=True)
+
+        logger.info(f'🛠️ 并发执行 {len(actions)} 个 MCP 工具调用')
+        return list(await asyncio.gather(*(act(action) for action in actions)))
+
+    def save_step_timings(self, filepath: str) -> None:
+        """把本次运行的分阶段计时保存为 JSON（通常与历史 JSON 放在一起）"""
+        if self.task_metrics is not None:
+            self.task_metrics.save_to_file(filepath)
+
+    def _handle_detected_loop(self, detection: LoopDetection, step: int, max_steps: int) -> bool:
+        """
+        处理检测到的循环：未超过恢复次数时注入恢复提示，否则提前停止。
+        返回: True 表示应停止运行
+        """
+        stats = self.loop_detector.stats
+        logger.warning(
+            f'🔁 检测到长度为 {detection.cycle_length} 的循环（已重复 {detection.repeats} 次，步骤 {step + 1}）'
+        )
+        if stats.recoveries < self.loop_detector.settings.max_recoveries:
+            stats.recoveries += 1
+            self.state.last_result = (self.state.last_result or []) + [
+                ActionResult(extracted_content=LoopDetector.recovery_prompt(detection), include_in_memory=True)
+            ]
+            logger.info('🔁 已注入恢复提示，要求 agent 更换策略')
+            return False
+
+        stats.stopped_early = True
+        stats.steps_saved = max_steps - step - 1
+        error_message = (
+            f'检测到长度为 {detection.cycle_length} 的重复循环且恢复提示无效，提前停止'
+            f'（节省 {stats.steps_saved} 步）'
+        )
+        logger.error(f'🔁 {error_message}')
+        self.state.history.history.append(
+            AgentHistory(
+                model_output=None,
+                result=[ActionResult(error=error_message, include_in_memory=True)],
+                state=BrowserStateHistory(url='', title='', tabs=[], interacted_element=[], screenshot=None),
+                metadata=None,
+            )
+        )
+        return True
+
+    async def _write_checkpoint(self) -> None:
+        """追加一条断点记录；浏览器状态读取失败时仍保存历史与消息状态"""
+        if self._checkpoint_writer is None:
+            return
+        url, tabs, storage_state = '', [], None
+        try:
+            url = await self._get_current_url()
+            tabs = [tab.model_dump() for tab in await self.browser_context.get_tabs_info()]
+            session = await self.browser_context.get_session()
+            storage_state = await session.context.storage_state()
+        except Exception as e:
+            logger.debug(f'读取浏览器状态失败，断点中不包含存储状态: {e}')
+        try:
+            await asyncio.to_thread(
+                self._checkpoint_writer.write_step,
+                self.state.history,
+                self.state.message_manager_state,
+                self.state.n_steps,
+                self.state.consecutive_failures,
+                self.state.last_result,
+                url,
+                tabs,
+                storage_state,
+            )
+        except Exception as e:
+            logger.warning(f'⚠️ 写入断点失败: {e}')
+
+    async def restore_checkpoint(self, path: str) -> Optional[AgentCheckpoint]:
+        """
+        从断点文件恢复：还原历史、消息管理器状态与步数，恢复 cookies/localStorage 并打开最后的 URL 与标签页。
+        之后调用 run() 会从下一步继续，不重复已完成的步骤。
+        """
+        checkpoint = load_checkpoint(path)
+        if checkpoint is None or not checkpoint.history_items:
+            logger.warning(f'⚠️ 没有可恢复的断点: {path}')
+            return None
+
+        self.state.history = checkpoint.build_history(self.AgentOutput)
+        if checkpoint.message_manager_state:
+            self.state.message_manager_state = load_message_manager_state(checkpoint.message_manager_state)
+            self._message_manager.state = self.state.message_manager_state
+        self.state.n_steps = checkpoint.n_steps
+        self.state.consecutive_failures = checkpoint.consecutive_failures
+        self.state.last_result = [ActionResult.model_validate(r) for r in checkpoint.last_result]
+        self._resumed_steps = checkpoint.completed_steps
+        self.checkpoint_path = path
+
+        await self._restore_browser_state(checkpoint)
+        logger.info(f'♻️ 已从断点恢复 {self._resumed_steps} 步，最后页面: {checkpoint.url or "未知"}')
+        return checkpoint
+
+    async def _restore_browser_state(self, checkpoint: AgentCheckpoint) -> None:
+        session = await self.browser_context.get_session()
+        storage_state = checkpoint.storage_state or {}
+        if storage_state.get('cookies'):
+            await session.context.add_cookies(storage_state['cookies'])
+        local_storage = {
+            origin['origin']: {item['name']: item['value'] for item in origin.get('localStorage', [])}
+            for origin in storage_state.get('origins', [])
+            if origin.get('localStorage')
+        }
+        if local_storage:
+            # 每个标签页只在首次加载该源时写入一次，避免覆盖页面之后的修改
+            await session.context.add_init_script(
+                '(() => { const data = ' + json.dumps(local_storage) + ';'
+                ' const items = data[location.origin];'
+                " if (!items || sessionStorage.getItem('__checkpoint_restored')) return;"
+                ' for (const [k, v] of Object.entries(items)) localStorage.setItem(k, v);'
+                " sessionStorage.setItem('__checkpoint_restored', '1'); })()"
+            )
+
+        other_urls = [
+            tab.get('url') for tab in checkpoint.tabs
+            if tab.get('url') and tab.get('url') != checkpoint.url and tab.get('url') != 'about:blank'
+        ]
+        page = await self.browser_context.get_current_page()
+        if other_urls:
+            await page.goto(other_urls[0])
+            for url in other_urls[1:]:
+                await self.browser_context.create_new_tab(url)
+            if checkpoint.url:
+                await self.browser_context.create_new_tab(checkpoint.url)
+        elif checkpoint.url:
+            await page.goto(checkpoint.url)
+            await page.wait_for_load_state()
+
+    async def _get_current_url(self) -> str:
+        """获取当前页面 URL，失败时返回空字符串"""
+        try:
+            page = await self.browser_context.get_current_page()
+            return page.url
+        except Exception as e:
+            logger.debug(f"无法获取当前页面 URL: {e}")
+            return ''
+
+    async def _replay_recorded_steps(self, recorded: AgentHistoryList, max_steps: int) -> int:
+        """
+        逐步回放录制的动作序列，每步执行前校验 URL、标题与交互元素是否存在。
+        在第一次偏离或执行失败时停止，把控制权交还给 LLM。
+        返回: 回放执行的步数（包括执行失败的那一步，它同样占用了 max_steps）
+        """
+        replayed = 0
+        for item in recorded.history:
+            # 至少给 LLM 留一步用于产出最终结果
+            if replayed >= max_steps - 1:
+                break
+            if not item.model_output or not item.model_output.action:
+                continue
+            if item.result and any(r.error for r in item.result):
+                # 录制中失败的步骤不回放
+                continue
+            if is_done_step(item):
+                break
+            if self.state.stopped:
+                break
+
+            step_start_time = time.time()
+            state = await self.browser_context.get_state(cache_clickable_elements_hashes=False)
+            divergence = verify_replay_step(item, state)
+
+            updated_actions = []
+            if divergence is None:
+                for i, action in enumerate(item.model_output.action):
+                    historical_element = (
+                        item.state.interacted_element[i] if i < len(item.state.interacted_element) else None
+                    )
+                    updated_action = await self._update_action_indices(historical_element, action, state)
+                    if updated_action is None:
+                        divergence = f"找不到录制时交互的元素 (动作 {i})"
+                        break
+                    updated_actions.append(updated_action)
+
+            if divergence is not None:
+                logger.info(f'📼 回放在第 {replayed + 1} 步偏离，交还 LLM 处理: {divergence}')
+                break
+
+            self._add_replayed_step_to_memory(item.model_output, self.state.last_result)
+            result = await self.multi_act(updated_actions)
+            self.state.n_steps += 1
+            if self.register_new_step_callback:
+                if inspect.iscoroutinefunction(self.register_new_step_callback):
+                    await self.register_new_step_callback(state, item.model_output, self.state.n_steps)
+                else:
+                    self.register_new_step_callback(state, item.model_output, self.state.n_steps)
+            self._make_history_item(
+                item.model_output,
+                state,
+                result,
+                StepMetadata(
+                    step_number=self.state.n_steps,
+                    step_start_time=step_start_time,
+                    step_end_time=time.time(),
+                    input_tokens=0,
+                ),
+            )
+            self.state.last_result = result
+            replayed += 1
+            if any(r.error for r in result):
+                logger.info(f'📼 回放第 {replayed} 步执行失败，交还 LLM 处理')
+                break
+            logger.info(f'📼 回放步骤 {replayed} 完成 ({item.state.url})')
+
+        if replayed:
+            self.state.last_result = (self.state.last_result or []) + [
+                ActionResult(
+                    extracted_content=f'前 {replayed} 步已按之前成功的记录自动执行，请从当前页面继续完成任务。',
+                    include_in_memory=True,
+                )
+            ]
+        return replayed
+
+    def _add_replayed_step_to_memory(self, model_output, previous_result) -> None:
+        """
+        按正常步骤的顺序把回放步骤写入消息历史：先是上一步需要保留的结果，再是本步的模型输出。
+        最后一步的结果留在 last_result 中，由 LLM 的第一步像平常一样写入
+        """
+        for r in previous_result or []:
+            if not r.include_in_memory:
+                continue
+            if r.extracted_content:
+                self._message_manager._add_message_with_tokens(
+                    HumanMessage(content='Action result: ' + str(r.extracted_content))
+                )
+            if r.error:
+                last_line = r.error.rstrip('\n').split('\n')[-1]
+                self._message_manager._add_message_with_tokens(HumanMessage(content='Action error: ' + last_line))
+        self._message_manager.add_model_output(model_output)
+
+    def _save_replay_recording(self) -> None:
+        """任务成功完成时保存动作序列，供后续相同任务回放"""
+        if not self.replay_store or not self.state.history.is_done():
+            return
+        if not self.state.history.is_successful():
+            return
+        self.replay_store.save(
+            self.task,
+            self._replay_start_url,
+            self.state.history,
+            sensitive_data_keys=list(self.sensitive_data.keys()) if self.sensitive_data else None,
+            browser_config=self.browser.config if self.browser else None,
+            context_config=self.browser_context.config if self.browser_context else None,
+        )
+
+    async def _schedule_recording(self, output_path: str) -> None:
+        """把历史写入临时文件，并在后台进程池中生成 GIF/视频，不阻塞事件循环"""
+        history_path = os.path.splitext(output_path)[0] + '.recording.json'
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(history_path)), exist_ok=True)
+            await asyncio.to_thread(self.state.history.save_to_file, history_path)
+            self.recording_task = schedule_history_recording(history_path, output_path)
+        except Exception as e:
+            logger.error(f'提交录像生成任务失败: {e}', exc_info=True)
+            self.recording_task = None
+
     @time_execution_async("--run (agent)")
     async def run(
             self, max_steps: int = 100, on_step_start: AgentHookFunc | None = None,
@@ -282,13 +923,36 @@ class BrowserUseAgent(Agent):
 
         signal_handler = SignalHandler(
             loop=loop,
-            pause_callback=self.pause,
+            pause_callback=self._pause_from_signal,
             resume_callback=self.resume,
             custom_exit_callback=None,  # No special cleanup needed on forced exit
             exit_on_second_int=True,
         )
         signal_handler.register()
 
+        self.recording_task = None
+        self._detected_loop = None
+        if self.vision_policy:
+            self.vision_policy.reset()
+        if self.planner_scheduler:
+            self.planner_scheduler.reset()
+            self.planner_scheduler.reset_stats()
+        if self.loop_detector:
+            self.loop_detector.reset()
+            self.loop_detector.reset_stats()
+        if self.history_compactor:
+            self.history_compactor.reset_stats()
+        self.task_metrics = self.performance_monitor.start_task(self.state.agent_id)
+        self._checkpoint_writer = None
+        if self.checkpoint_path:
+            try:
+                self._checkpoint_writer = CheckpointWriter(self.checkpoint_path)
+                resumed_items = len(self.state.history.history) if self._resumed_steps else 0
+                self._checkpoint_writer.start(self.task, self.state.agent_id, max_steps, resumed_items=resumed_items)
+            except Exception as e:
+                logger.warning(f'⚠️ 无法创建断点文件，本次运行不保存断点: {e}')
+                self._checkpoint_writer = None
+
         # 监控失败模式以检测循环
         step_failure_history = []
         max_consecutive_same_failures = 3  # 如果相同失败出现3次，则停止
@@ -296,14 +960,26 @@ class BrowserUseAgent(Agent):
         try:
             self._log_agent_run()
 
-            # Execute initial actions if provided
-            if self.initial_actions:
+            # Execute initial actions if provided（从断点恢复时已执行过）
+            if self.initial_actions and not self._resumed_steps:
                 result = await self.multi_act(self.initial_actions, check_for_new_elements=False)
                 self.state.last_result = result
 
-            for step in range(max_steps):
+            # 回放快速路径：命中录制时直接执行已验证的步骤
+            self.replayed_steps = 0
+            if self.replay_store and not self._resumed_steps:
+                self._replay_start_url = await self._get_current_url()
+                recorded = self.replay_store.load(self.task, self._replay_start_url, self.AgentOutput)
+                if recorded:
+                    self.replayed_steps = await self._replay_recorded_steps(recorded, max_steps)
+                    logger.info(f'📼 回放完成 {self.replayed_steps} 步，剩余步骤由 LLM 执行')
+
+            if self.replayed_steps:
+                await self._write_checkpoint()
+
+            for step in range(self._resumed_steps + self.replayed_steps, max_steps):
                 # Check if waiting for user input after Ctrl+C
-                if self.state.paused:
+                if self.state.paused and self._paused_by_signal:
                     signal_handler.wait_for_resume()
                     signal_handler.reset()
 
@@ -312,23 +988,25 @@ class BrowserUseAgent(Agent):
                     logger.error(f'❌ 由于 {self.settings.max_failures} 次连续失败而停止')
                     break
 
+                # 暂停时挂起在事件上，恢复或停止时立即唤醒
+                await self.wait_until_resumed()
+
                 # Check control flags before each step
                 if self.state.stopped:
                     logger.info('✋ Agent 已停止')
                     break
 
-                while self.state.paused:
-                    await asyncio.sleep(0.2)  # Small delay to prevent CPU spinning
-                    if self.state.stopped:  # Allow stopping while paused
-                        break
-
                 if on_step_start is not None:
                     await on_step_start(self)
 
                 step_info = AgentStepInfo(step_number=step, max_steps=max_steps)
                 logger.info(f'📍 步骤 {step + 1}/{max_steps} 开始执行')
+
+                if self.history_compactor:
+                    await self.history_compactor.maybe_compact(self._message_manager, step + 1)
                 
                 await self.step(step_info)
+                await self._write_checkpoint()
                 
                 # 检查action输出的有效性
                 action_valid = self._validate_action_output(step)
@@ -361,6 +1039,12 @@ class BrowserUseAgent(Agent):
                     else:
                         logger.info(f'✅ 步骤 {step + 1} 成功完成')
 
+                # 状态哈希循环检测：覆盖动作成功但页面没有进展的来回跳转
+                if self._detected_loop is not None and not self.state.history.is_done():
+                    detection, self._detected_loop = self._detected_loop, None
+                    if self._handle_detected_loop(detection, step, max_steps):
+                        break
+
                 if on_step_end is not None:
                     await on_step_end(self)
 
@@ -406,6 +1090,85 @@ class BrowserUseAgent(Agent):
             # Unregister signal handlers before cleanup
             signal_handler.unregister()
 
+            if self._checkpoint_writer is not None:
+                try:
+                    self._checkpoint_writer.finish(success=bool(self.state.history.is_successful()))
+                except Exception as e:
+                    logger.warning(f'⚠️ 写入断点结束记录失败: {e}')
+                self._checkpoint_writer = None
+            self._resumed_steps = 0
+
+            dom_delta_stats = getattr(self._message_manager, 'dom_delta_stats', None)
+            if dom_delta_stats and dom_delta_stats.element_tokens_full:
+                logger.info(
+                    f'🧩 DOM 增量: {dom_delta_stats.delta_steps} 步发送增量, {dom_delta_stats.full_steps} 步发送完整列表, '
+                    f'元素 tokens {dom_delta_stats.element_tokens_full} -> {dom_delta_stats.element_tokens_sent} '
+                    f'(减少 {dom_delta_stats.reduction_ratio():.0%})'
+                )
+
+            if self.planner_scheduler and self.settings.planner_llm:
+                logger.info(f'🗺️ 规划器: {self.planner_scheduler.stats.summary()}')
+                if self.planner_stats_path:
+                    try:
+                        append_planner_run(
+                            self.planner_stats_path,
+                            self.task,
+                            self.planner_scheduler.settings,
+                            self.planner_scheduler.stats,
+                            steps=len(self.state.history.history),
+                            success=bool(self.state.history.is_successful()),
+                        )
+                    except Exception as e:
+                        logger.warning(f'⚠️ 保存规划统计失败: {e}')
+
+            if self.vision_policy and self.settings.use_vision:
+                logger.info(f'🖼️ 自适应视觉: {self.vision_policy.stats.summary()}')
+
+            if self.tool_selector:
+                llm_latency = ''
+                if self.task_metrics is not None and self.task_metrics.step_metrics:
+                    llm_seconds = self.task_metrics.get_phase_totals().get(PHASE_LLM, 0.0)
+                    llm_latency = f', LLM 平均 {llm_seconds / len(self.task_metrics.step_metrics):.2f}s/步'
+                logger.info(f'🧰 工具选择: {self.tool_selector.stats.summary()}{llm_latency}')
+
+            crop_stats = getattr(self._message_manager, 'crop_stats', None)
+            if self._message_manager.crop_settings is not None and crop_stats and crop_stats.cropped_steps:
+                logger.info(
+                    f'✂️ 截图裁剪: {crop_stats.cropped_steps} 步发送裁剪截图, {crop_stats.full_steps} 步发送完整截图, '
+                    f'裁剪步骤图片像素减少 {crop_stats.pixel_reduction():.0%}'
+                )
+
+            content_stats = get_content_cache().stats
+            if content_stats.markdown_hits + content_stats.markdown_misses:
+                logger.info(f'📄 内容提取缓存 (进程累计): {content_stats.summary()}')
+
+            if self.loop_detector and self.loop_detector.stats.loops_detected:
+                loop_stats = self.loop_detector.stats
+                logger.info(
+                    f'🔁 循环检测: 检测到 {loop_stats.loops_detected} 次循环 (周期 {loop_stats.cycle_lengths}), '
+                    f'恢复提示 {loop_stats.recoveries} 次, '
+                    + (f'提前停止节省 {loop_stats.steps_saved} 步' if loop_stats.stopped_early else '未提前停止')
+                )
+
+            if self.history_compactor and self.history_compactor.stats.token_curve:
+                stats = self.history_compactor.stats
+                logger.info(
+                    f'🗜️ 历史压缩 {stats.compactions} 次，累计节省 {stats.tokens_saved()} 输入 tokens；'
+                    f'每步输入 tokens (压缩前->压缩后): {stats.format_token_curve()}'
+                )
+
+            if self.performance_monitor.current_task is not None:
+                run_errors = [e for e in self.state.history.errors() if e]
+                self.performance_monitor.finish_task(
+                    success=bool(self.state.history.is_successful()),
+                    error_summary=str(run_errors[-1])[:200] if run_errors else None,
+                )
+
+            try:
+                self._save_replay_recording()
+            except Exception as replay_err:
+                logger.error(f'保存回放录制失败: {replay_err}', exc_info=True)
+
             if self.settings.save_playwright_script_path:
                 logger.info(
                     f'Agent run finished. Attempting to save Playwright script to: {self.settings.save_playwright_script_path}'
@@ -431,4 +1194,4 @@ class BrowserUseAgent(Agent):
                 if isinstance(self.settings.generate_gif, str):
                     output_path = self.settings.generate_gif
 
-                create_history_gif(task=self.task, history=self.state.history, output_path=output_path)
+                await self._schedule_recording(output_path)
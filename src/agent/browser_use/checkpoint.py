@@ -0,0 +1,268 @@
+"""
+运行中断点保存模块
+每步结束后向只追加的 JSONL 文件写入新增历史、消息管理器状态的增量（保留前 k 条消息 + 新增消息）、当前 URL 与标签页；
+浏览器存储状态（cookies/localStorage）变化时用与登录缓存相同的 Fernet 密钥加密，原子替换到旁边的 .storage.bin 文件。
+进程重启后可从最后一步继续执行
+"""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Type
+
+from browser_use.agent.message_manager.views import ManagedMessage, MessageManagerState, MessageMetadata
+from browser_use.agent.views import AgentHistory, AgentHistoryList, AgentOutput
+from cryptography.fernet import Fernet, InvalidToken
+from langchain_core.load import dumpd, load
+
+from src.browser.storage_state_cache import default_key_path, load_storage_key
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_SUFFIX = ".checkpoint.jsonl"
+STORAGE_SUFFIX = ".storage.bin"
+
+RECORD_START = "start"
+RECORD_RESUME = "resume"
+RECORD_STEP = "step"
+RECORD_END = "end"
+
+
+def checkpoint_path_for(history_file: str) -> str:
+    """历史 JSON 对应的断点文件路径"""
+    return os.path.splitext(history_file)[0] + CHECKPOINT_SUFFIX
+
+
+def storage_path_for(path: str) -> str:
+    """断点文件对应的加密存储状态文件路径"""
+    return path[:-len(".jsonl")] + STORAGE_SUFFIX if path.endswith(".jsonl") else path + STORAGE_SUFFIX
+
+
+def _dump_message(managed: ManagedMessage) -> Dict[str, Any]:
+    return {"message": dumpd(managed.message), "metadata": managed.metadata.model_dump()}
+
+
+def dump_message_manager_state(state: MessageManagerState) -> Dict[str, Any]:
+    """序列化消息管理器状态；LangChain 消息用 dumpd 保存以便原样恢复"""
+    return {
+        "messages": [_dump_message(managed) for managed in state.history.messages],
+        "current_tokens": state.history.current_tokens,
+        "tool_id": state.tool_id,
+    }
+
+
+def load_message_manager_state(data: Dict[str, Any]) -> MessageManagerState:
+    state = MessageManagerState()
+    state.history.messages = [
+        ManagedMessage(message=load(item["message"]), metadata=MessageMetadata(**item["metadata"]))
+        for item in data.get("messages", [])
+    ]
+    state.history.current_tokens = data.get("current_tokens", 0)
+    state.tool_id = data.get("tool_id", 1)
+    return state
+
+
+@dataclass
+class AgentCheckpoint:
+    """从断点文件重建的最后状态"""
+    path: str
+    task: str = ""
+    agent_id: str = ""
+    max_steps: Optional[int] = None
+    history_items: List[Dict[str, Any]] = field(default_factory=list)
+    message_manager_state: Optional[Dict[str, Any]] = None
+    n_steps: int = 1
+    consecutive_failures: int = 0
+    last_result: List[Dict[str, Any]] = field(default_factory=list)
+    url: str = ""
+    tabs: List[Dict[str, Any]] = field(default_factory=list)
+    storage_state: Optional[Dict[str, Any]] = None
+    finished: bool = False
+    updated_at: str = ""
+
+    @property
+    def completed_steps(self) -> int:
+        return max(self.n_steps - 1, 0)
+
+    def build_history(self, output_model: Type[AgentOutput]) -> AgentHistoryList:
+        """与 AgentHistoryList.load_from_file 相同的方式还原历史"""
+        items = []
+        for data in self.history_items:
+            data = dict(data)
+            if data.get("model_output") and isinstance(data["model_output"], dict):
+                data["model_output"] = output_model.model_validate(data["model_output"])
+            if "interacted_element" not in data.get("state", {}):
+                data["state"]["interacted_element"] = None
+            items.append(AgentHistory.model_validate(data))
+        return AgentHistoryList(history=items)
+
+
+def _read_storage_state(path: str, key_path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    storage_path = storage_path_for(path)
+    if not os.path.exists(storage_path):
+        return None
+    try:
+        with open(storage_path, "rb") as f:
+            data = Fernet(load_storage_key(key_path or default_key_path())).decrypt(f.read())
+        return json.loads(data)
+    except (OSError, InvalidToken, ValueError) as e:
+        logger.warning(f"⚠️ 断点的存储状态无法解密，恢复时不包含 cookies: {type(e).__name__}")
+        return None
+
+
+def load_checkpoint(path: str, key_path: Optional[str] = None) -> Optional[AgentCheckpoint]:
+    """
+    逐行回放断点文件，得到最后一次完整写入的状态。
+    崩溃时可能残留半行，无法解析的行直接忽略。
+    """
+    if not os.path.exists(path):
+        return None
+    checkpoint = AgentCheckpoint(path=path)
+    messages: List[Dict[str, Any]] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"⚠️ 断点文件存在不完整的记录，已忽略: {path}")
+                continue
+            record_type = record.get("type")
+            checkpoint.updated_at = record.get("time", checkpoint.updated_at)
+            if record_type == RECORD_START:
+                checkpoint.task = record.get("task", "")
+                checkpoint.agent_id = record.get("agent_id", "")
+                checkpoint.max_steps = record.get("max_steps")
+            elif record_type == RECORD_STEP:
+                checkpoint.history_items.extend(record.get("history_items", []))
+                if "messages_added" in record:
+                    messages = messages[:record.get("messages_keep", 0)] + record["messages_added"]
+                    checkpoint.message_manager_state = {
+                        "messages": messages,
+                        "current_tokens": record.get("current_tokens", 0),
+                        "tool_id": record.get("tool_id", 1),
+                    }
+                elif record.get("message_manager_state"):
+                    # 旧格式：每条记录保存完整状态
+                    checkpoint.message_manager_state = record["message_manager_state"]
+                    messages = list(checkpoint.message_manager_state.get("messages", []))
+                checkpoint.n_steps = record.get("n_steps", checkpoint.n_steps)
+                checkpoint.consecutive_failures = record.get("consecutive_failures", 0)
+                checkpoint.last_result = record.get("last_result", [])
+                checkpoint.url = record.get("url", "")
+                checkpoint.tabs = record.get("tabs", [])
+                if record.get("storage_state") is not None:
+                    checkpoint.storage_state = record["storage_state"]  # 旧格式的明文存储状态
+            elif record_type == RECORD_END:
+                checkpoint.finished = True
+            elif record_type == RECORD_RESUME:
+                checkpoint.finished = False
+    checkpoint.storage_state = _read_storage_state(path, key_path) or checkpoint.storage_state
+    return checkpoint
+
+
+def find_latest_checkpoint(root_dir: str) -> Optional[str]:
+    """查找最近更新且未正常结束的断点文件"""
+    candidates = sorted(
+        glob.glob(os.path.join(root_dir, "**", f"*{CHECKPOINT_SUFFIX}"), recursive=True),
+        key=os.path.getmtime,
+        reverse=True,
+    )
+    for path in candidates:
+        checkpoint = load_checkpoint(path)
+        if checkpoint and not checkpoint.finished and checkpoint.history_items:
+            return path
+    return None
+
+
+class CheckpointWriter:
+    """
+    只追加写入断点记录，每条记录写完立即 fsync，进程崩溃最多丢失正在写的一步。
+    每步只写新增的历史与消息，记录大小与步数无关；存储状态只在变化时加密重写
+    """
+
+    def __init__(self, path: str, key_path: Optional[str] = None):
+        self.path = path
+        self.written_items = 0  # 已写入的历史条目数
+        self._written_messages: List[str] = []  # 已写入的消息（序列化后），用于计算增量
+        self._storage_digest: Optional[str] = None
+        self._fernet = Fernet(load_storage_key(key_path or default_key_path()))
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        record["time"] = datetime.now().isoformat()
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def start(self, task: str, agent_id: str, max_steps: int, resumed_items: int = 0) -> None:
+        """新运行写入 start 记录；从断点恢复时继续追加 resume 记录"""
+        self._written_messages = []  # 恢复后的第一条记录写入完整的消息列表
+        if resumed_items and os.path.exists(self.path):
+            self.written_items = resumed_items
+            self._append({"type": RECORD_RESUME, "max_steps": max_steps, "resumed_items": resumed_items})
+        else:
+            self.written_items = 0
+            self._append({"type": RECORD_START, "task": task, "agent_id": agent_id, "max_steps": max_steps})
+
+    def write_step(
+            self,
+            history: AgentHistoryList,
+            message_manager_state: MessageManagerState,
+            n_steps: int,
+            consecutive_failures: int,
+            last_result: List[Any],
+            url: str,
+            tabs: List[Dict[str, Any]],
+            storage_state: Optional[Dict[str, Any]],
+    ) -> None:
+        new_items = history.history[self.written_items:]
+        messages = [_dump_message(managed) for managed in message_manager_state.history.messages]
+        serialized = [json.dumps(message, sort_keys=True, ensure_ascii=False, default=str) for message in messages]
+        # 压缩或改写旧消息时只保留未变化的前缀，其后的消息重新写入
+        keep = 0
+        for old, new in zip(self._written_messages, serialized):
+            if old != new:
+                break
+            keep += 1
+        if storage_state is not None:
+            self._write_storage_state(storage_state)
+        self._append({
+            "type": RECORD_STEP,
+            "n_steps": n_steps,
+            "history_items": [item.model_dump() for item in new_items],
+            "messages_keep": keep,
+            "messages_added": messages[keep:],
+            "current_tokens": message_manager_state.history.current_tokens,
+            "tool_id": message_manager_state.tool_id,
+            "consecutive_failures": consecutive_failures,
+            "last_result": [r.model_dump() for r in last_result or []],
+            "url": url,
+            "tabs": tabs,
+        })
+        self.written_items = len(history.history)
+        self._written_messages = serialized
+
+    def _write_storage_state(self, storage_state: Dict[str, Any]) -> None:
+        data = json.dumps(storage_state, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        if digest == self._storage_digest:
+            return
+        path = storage_path_for(self.path)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(self._fernet.encrypt(data))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self._storage_digest = digest
+
+    def finish(self, success: bool) -> None:
+        self._append({"type": RECORD_END, "success": success})
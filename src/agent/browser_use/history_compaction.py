@@ -0,0 +1,178 @@
+"""
+消息历史滚动压缩模块
+把较早步骤的消息总结为一段紧凑的记忆，只保留最近 N 步的完整消息，使提示词保持在目标预算内
+"""
+
+import logging
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from browser_use.agent.message_manager.service import MessageManager
+from browser_use.agent.message_manager.views import ManagedMessage, MessageMetadata
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+
+from src.agent.browser_use.message_manager import DOM_BASELINE_MESSAGE_TYPE
+
+logger = logging.getLogger(__name__)
+
+MEMORY_MESSAGE_TYPE = "compacted_memory"
+MEMORY_HEADER = "[压缩记忆] 以下是之前步骤的摘要："
+
+
+@dataclass
+class HistoryCompactionSettings:
+    """历史压缩配置"""
+    enabled: bool = True
+    keep_recent_steps: int = 4  # 保留完整消息的最近步数
+    target_tokens: int = 24000  # 提示词超过该预算时触发压缩
+    max_message_chars: int = 1500  # 送入总结模型时每条消息的最大字符数
+    max_summary_chars: int = 4000  # 记忆块的最大字符数
+
+
+@dataclass
+class CompactionStats:
+    """压缩统计，token_curve 记录每步 (步骤, 压缩前 token, 压缩后 token)"""
+    compactions: int = 0
+    summarized_messages: int = 0
+    token_curve: List[Tuple[int, int, int]] = field(default_factory=list)
+
+    def format_token_curve(self) -> str:
+        if not self.token_curve:
+            return "无数据"
+        return ", ".join(
+            f"{step}:{before}" if before == after else f"{step}:{before}->{after}"
+            for step, before, after in self.token_curve
+        )
+
+    def tokens_saved(self) -> int:
+        return sum(before - after for _, before, after in self.token_curve)
+
+
+def _message_text(message: BaseMessage, max_chars: int) -> str:
+    """把消息转为适合总结的文本，忽略图片内容"""
+    content = message.content
+    if isinstance(content, list):
+        content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    text = str(content or "")
+    if isinstance(message, AIMessage) and message.tool_calls:
+        calls = "; ".join(f"{call.get('name')}({call.get('args')})" for call in message.tool_calls)
+        text = f"{text} {calls}".strip()
+    if len(text) > max_chars:
+        text = text[:max_chars] + "...(截断)"
+    role = {AIMessage: "agent", ToolMessage: "tool", HumanMessage: "browser"}.get(type(message), "system")
+    return f"[{role}] {text}"
+
+
+class HistoryCompactor:
+    """在每步开始前检查消息历史，必要时把旧步骤压缩为记忆块"""
+
+    def __init__(self, llm: Optional[BaseChatModel], settings: Optional[HistoryCompactionSettings] = None):
+        self.llm = llm
+        self.settings = settings or HistoryCompactionSettings()
+        self.stats = CompactionStats()
+
+    def reset_stats(self) -> None:
+        self.stats = CompactionStats()
+
+    @staticmethod
+    def _find_memory_index(messages: List[ManagedMessage]) -> Optional[int]:
+        for i, managed in enumerate(messages):
+            if managed.metadata.message_type == MEMORY_MESSAGE_TYPE:
+                return i
+        return None
+
+    def _select_old_messages(self, messages: List[ManagedMessage]) -> List[int]:
+        """返回需要压缩的消息下标：初始消息、记忆块与 DOM 基线之外、最近 N 步之前的全部消息"""
+        body = [
+            i for i, managed in enumerate(messages)
+            if managed.metadata.message_type not in ("init", MEMORY_MESSAGE_TYPE, DOM_BASELINE_MESSAGE_TYPE)
+            and not isinstance(managed.message, SystemMessage)
+        ]
+        # 以模型输出（AIMessage）为步骤边界，保证 tool_call 与 ToolMessage 成对保留
+        step_starts = [i for i in body if isinstance(messages[i].message, AIMessage)]
+        if len(step_starts) <= self.settings.keep_recent_steps:
+            return []
+        cut = step_starts[-self.settings.keep_recent_steps] if self.settings.keep_recent_steps > 0 else len(messages)
+        return [i for i in body if i < cut]
+
+    async def _summarize(self, previous_memory: str, old_texts: List[str]) -> str:
+        joined = "\n".join(old_texts)
+        if self.llm is not None:
+            prompt = (
+                "你在为浏览器自动化 agent 压缩历史记录。请把以下已完成步骤总结为简洁的记忆，"
+                "保留：已访问的关键页面和 URL、已完成的子目标、已提取的关键数据、失败过的操作及原因、尚未完成的事项。"
+                f"不要超过 {self.settings.max_summary_chars} 个字符，只输出摘要本身。\n\n"
+                f"已有记忆：\n{previous_memory or '无'}\n\n新的历史步骤：\n{joined}"
+            )
+            try:
+                response = await self.llm.ainvoke([HumanMessage(content=prompt)])
+                summary = str(response.content).strip()
+                if summary:
+                    return summary[: self.settings.max_summary_chars]
+            except Exception as e:
+                logger.warning(f"⚠️ 历史压缩模型调用失败，改用抽取式摘要: {e}")
+
+        # 抽取式回退：保留已有记忆，再拼接每条旧消息的开头
+        lines = [previous_memory] if previous_memory else []
+        lines += [text[:200] for text in old_texts]
+        summary = "\n".join(lines)
+        return summary[-self.settings.max_summary_chars:]
+
+    async def maybe_compact(self, message_manager: MessageManager, step_number: int) -> bool:
+        """
+        在提示词超过目标预算时压缩旧步骤，并记录本步压缩前后的 token 数。
+        返回: True 表示执行了压缩
+        """
+        history = message_manager.state.history
+        tokens_before = history.current_tokens
+        compacted = False
+
+        if self.settings.enabled and tokens_before > self.settings.target_tokens:
+            compacted = await self._compact(message_manager)
+
+        self.stats.token_curve.append((step_number, tokens_before, history.current_tokens))
+        return compacted
+
+    async def _compact(self, message_manager: MessageManager) -> bool:
+        history = message_manager.state.history
+        messages = history.messages
+        old_indices = self._select_old_messages(messages)
+        if not old_indices:
+            return False
+
+        memory_index = self._find_memory_index(messages)
+        previous_memory = ""
+        if memory_index is not None:
+            previous_memory = str(messages[memory_index].message.content).replace(MEMORY_HEADER, "", 1).strip()
+
+        old_texts = [_message_text(messages[i].message, self.settings.max_message_chars) for i in old_indices]
+        summary = await self._summarize(previous_memory, old_texts)
+
+        remove_indices = set(old_indices)
+        if memory_index is not None:
+            remove_indices.add(memory_index)
+        removed_tokens = sum(messages[i].metadata.tokens for i in remove_indices)
+
+        # 记忆块插入在初始消息之后，即第一条被移除消息的位置
+        insert_at = min(remove_indices)
+        memory_message = HumanMessage(content=f"{MEMORY_HEADER}\n{summary}")
+        memory_tokens = message_manager._count_tokens(memory_message)
+        kept = [managed for i, managed in enumerate(messages) if i not in remove_indices]
+        kept.insert(
+            insert_at,
+            ManagedMessage(
+                message=memory_message,
+                metadata=MessageMetadata(tokens=memory_tokens, message_type=MEMORY_MESSAGE_TYPE),
+            ),
+        )
+        history.messages = kept
+        history.current_tokens = history.current_tokens - removed_tokens + memory_tokens
+
+        self.stats.compactions += 1
+        self.stats.summarized_messages += len(old_indices)
+        logger.info(
+            f"🗜️ 已压缩 {len(old_indices)} 条旧消息为记忆块: "
+            f"{removed_tokens} -> {memory_tokens} tokens (当前 {history.current_tokens})"
+        )
+        return True
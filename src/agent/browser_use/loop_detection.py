@@ -0,0 +1,125 @@
+"""
+状态哈希循环检测模块
+对每步的 (URL, DOM 指纹, 动作) 计算哈希，以 O(1) 的代价检测任意长度的重复循环
+"""
+
+import hashlib
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from browser_use.browser.views import BrowserState
+
+from src.agent.browser_use.replay import normalize_url
+from src.browser.dom_delta import dom_fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LoopDetectionSettings:
+    """循环检测配置"""
+    enabled: bool = True
+    min_repeats: int = 3  # 同一循环连续出现的次数达到该值时判定为循环
+    max_cycle_length: int = 10  # 超过该长度的周期不视为循环
+    max_recoveries: int = 1  # 注入恢复提示的次数，之后再次检测到循环则提前停止
+
+
+@dataclass
+class LoopDetection:
+    """一次循环检测结果"""
+    step: int
+    cycle_length: int
+    repeats: int
+    urls: List[str]
+
+
+@dataclass
+class LoopDetectionStats:
+    """循环检测统计，steps_saved 为提前停止时剩余未执行的步数"""
+    loops_detected: int = 0
+    recoveries: int = 0
+    stopped_early: bool = False
+    steps_saved: int = 0
+    cycle_lengths: List[int] = field(default_factory=list)
+
+
+def step_hash(state: BrowserState, actions: List[dict]) -> str:
+    """计算一步的状态哈希：规范化 URL + 可交互元素指纹 + 动作"""
+    payload = json.dumps(
+        [normalize_url(state.url), dom_fingerprint(state.selector_map), actions],
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class LoopDetector:
+    """
+    维护步骤哈希序列，增量地跟踪当前候选周期 p：
+    若 h[i] == h[i-p] 则连续匹配数加一，否则以该哈希最近一次出现的位置重新确定周期。
+    连续匹配数达到 (min_repeats - 1) * p 即说明最近 min_repeats 个周期完全相同。
+    """
+
+    def __init__(self, settings: Optional[LoopDetectionSettings] = None):
+        self.settings = settings or LoopDetectionSettings()
+        self.stats = LoopDetectionStats()
+        self.reset()
+
+    def reset(self) -> None:
+        self.hashes: List[str] = []
+        self.urls: List[str] = []
+        self.last_seen: Dict[str, int] = {}
+        self.period = 0
+        self.run = 0
+
+    def reset_stats(self) -> None:
+        self.stats = LoopDetectionStats()
+
+    def observe(self, state: BrowserState, actions: List[dict]) -> Optional[LoopDetection]:
+        """记录一步，检测到循环时返回 LoopDetection"""
+        if not self.settings.enabled:
+            return None
+        h = step_hash(state, actions)
+        i = len(self.hashes)
+        if self.period and self.hashes[i - self.period] == h:
+            self.run += 1
+        else:
+            previous = self.last_seen.get(h)
+            if previous is not None and i - previous <= self.settings.max_cycle_length:
+                self.period = i - previous
+                self.run = 1
+            else:
+                self.period = 0
+                self.run = 0
+        self.hashes.append(h)
+        self.urls.append(state.url or "")
+        self.last_seen[h] = i
+
+        if not self.period or self.run < (self.settings.min_repeats - 1) * self.period:
+            return None
+
+        detection = LoopDetection(
+            step=i + 1,
+            cycle_length=self.period,
+            repeats=self.run // self.period + 1,
+            urls=self.urls[-self.period:],
+        )
+        self.stats.loops_detected += 1
+        self.stats.cycle_lengths.append(self.period)
+        # 重新计数：恢复提示之后需要再出现完整的 min_repeats 个周期才会再次触发
+        self.period = 0
+        self.run = 0
+        return detection
+
+    @staticmethod
+    def recovery_prompt(detection: LoopDetection) -> str:
+        pages = " -> ".join(dict.fromkeys(url for url in detection.urls if url)) or "当前页面"
+        return (
+            f"⚠️ 检测到循环：最近 {detection.cycle_length * detection.repeats} 步在重复同一个长度为 "
+            f"{detection.cycle_length} 的操作序列（{pages}），页面状态没有任何进展。"
+            "不要再重复这些操作。请重新审视任务目标，换一种方法（例如使用搜索、直接访问其他 URL、"
+            "检查之前的提取结果），如果任务已无法完成，请调用 done 并说明原因。"
+        )
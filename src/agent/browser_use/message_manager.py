@@ -0,0 +1,242 @@
+"""
+自定义消息管理器
+在 browser_use 的 MessageManager 基础上支持 DOM 增量编码：页面变化较小时只发送元素差异
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import List, Optional, Set
+
+from browser_use.agent.message_manager.service import MessageManager
+from browser_use.agent.views import ActionResult, AgentStepInfo
+from browser_use.browser.views import BrowserState
+from langchain_core.messages import HumanMessage
+
+from src.browser.custom_context import CustomBrowserContext
+from src.browser.screenshot_crop import ScreenshotCropSettings, crop_screenshot, element_box
+from src.utils.performance_monitor import PHASE_PROMPT_ASSEMBLY, phase_span
+
+logger = logging.getLogger(__name__)
+
+DOM_BASELINE_MESSAGE_TYPE = "dom_baseline"
+DOM_BASELINE_HEADER = "[DOM 基线] 以下是页面的完整可交互元素列表，之后的步骤可能只给出相对该基线的增量："
+DOM_BASELINE_POINTER = "(可交互元素与上方 DOM 基线完全一致)"
+
+
+@dataclass
+class DomDeltaSettings:
+    """DOM 增量编码配置"""
+    max_ratio: float = 0.3  # 差异元素占比超过该值时发送完整列表
+    max_elements: int = 40  # 差异元素数超过该值时发送完整列表
+
+
+@dataclass
+class DomDeltaStats:
+    """增量编码统计：element_tokens_full 为始终发送完整列表时的 token 数"""
+    full_steps: int = 0
+    delta_steps: int = 0
+    element_tokens_full: int = 0
+    element_tokens_sent: int = 0
+
+    def reduction_ratio(self) -> float:
+        if not self.element_tokens_full:
+            return 0.0
+        return 1 - self.element_tokens_sent / self.element_tokens_full
+
+
+@dataclass
+class ScreenshotCropStats:
+    """裁剪统计：像素为发送给模型的图片像素（含缩略图）"""
+    cropped_steps: int = 0
+    full_steps: int = 0
+    full_pixels: int = 0
+    sent_pixels: int = 0
+
+    def pixel_reduction(self) -> float:
+        if not self.full_pixels:
+            return 0.0
+        return 1 - self.sent_pixels / self.full_pixels
+
+
+def _content_text(content) -> str:
+    if isinstance(content, list):
+        return "\n".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return str(content or "")
+
+
+def _replace_in_content(content, old: str, new: str):
+    if isinstance(content, list):
+        return [
+            {**part, "text": part["text"].replace(old, new, 1)}
+            if isinstance(part, dict) and part.get("type") == "text" else part
+            for part in content
+        ]
+    return content.replace(old, new, 1)
+
+
+class CustomMessageManager(MessageManager):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 每个 agent 独立的增量编码状态
+        self.dom_delta_context: Optional[CustomBrowserContext] = None
+        self.dom_delta_settings = DomDeltaSettings()
+        self.dom_delta_stats = DomDeltaStats()
+        # 截图裁剪状态同样按实例保存，聚焦元素不能在 agent 之间串用
+        self.crop_settings: Optional[ScreenshotCropSettings] = None
+        self.crop_viewport_width = 1280
+        self.crop_stats = ScreenshotCropStats()
+        self.focus_xpaths: Set[str] = set()
+
+    def enable_dom_delta(self, browser_context: CustomBrowserContext, settings: Optional[DomDeltaSettings] = None):
+        self.dom_delta_context = browser_context
+        self.dom_delta_settings = settings or DomDeltaSettings()
+        self.dom_delta_stats = DomDeltaStats()
+        browser_context.dom_delta_tracker.reset()
+
+    def enable_screenshot_crop(self, settings: Optional[ScreenshotCropSettings], viewport_width: int = 1280):
+        """启用截图聚焦裁剪；settings 为 None 时关闭"""
+        self.crop_settings = settings if settings and settings.enabled else None
+        self.crop_viewport_width = viewport_width
+        self.crop_stats = ScreenshotCropStats()
+
+    def set_focus_elements(self, xpaths: Set[str]) -> None:
+        """设置下一步截图需要聚焦的元素（通常是上一步交互过的元素）"""
+        self.focus_xpaths = set(xpaths)
+
+    def add_state_message(
+            self,
+            state: BrowserState,
+            result: Optional[List[ActionResult]] = None,
+            step_info: Optional[AgentStepInfo] = None,
+            use_vision=True,
+    ) -> None:
+        with phase_span(PHASE_PROMPT_ASSEMBLY):
+            super().add_state_message(state, result, step_info, use_vision)
+            if use_vision and state.screenshot and self.crop_settings is not None:
+                try:
+                    self._apply_screenshot_crop(state)
+                except Exception as e:
+                    logger.warning(f"⚠️ 截图裁剪失败，本步发送完整截图: {e}")
+            if self.dom_delta_context is None or state.element_tree is None:
+                return
+            try:
+                self._apply_dom_delta(state)
+            except Exception as e:
+                logger.warning(f"⚠️ DOM 增量编码失败，本步发送完整元素列表: {e}")
+
+    def _find_baseline_index(self) -> Optional[int]:
+        for i, managed in enumerate(self.state.history.messages):
+            if managed.metadata.message_type == DOM_BASELINE_MESSAGE_TYPE:
+                return i
+        return None
+
+    def _rewrite_last_message(self, old: str, new: str) -> None:
+        history = self.state.history
+        managed = history.messages[-1]
+        message = HumanMessage(content=_replace_in_content(managed.message.content, old, new))
+        new_tokens = self._count_tokens(message)
+        history.current_tokens += new_tokens - managed.metadata.tokens
+        managed.message = message
+        managed.metadata.tokens = new_tokens
+
+    def _focus_boxes(self, state: BrowserState) -> list:
+        """聚焦目标：上一步交互过的元素，以及相对 DOM 基线新出现的元素（如弹窗、表单）"""
+        xpaths = set(self.focus_xpaths)
+        delta = self.dom_delta_context.last_dom_delta if self.dom_delta_context is not None else None
+        if delta is not None and delta.url == delta.baseline_url:
+            xpaths.update(snapshot.xpath for snapshot in delta.added)
+        boxes = []
+        for node in (state.selector_map or {}).values():
+            if getattr(node, "xpath", None) in xpaths:
+                box = element_box(node)
+                if box is not None:
+                    boxes.append(box)
+        return boxes
+
+    def _apply_screenshot_crop(self, state: BrowserState) -> None:
+        history = self.state.history
+        managed = history.messages[-1] if history.messages else None
+        if managed is None or not isinstance(managed.message.content, list):
+            return
+        image_parts = [
+            part for part in managed.message.content
+            if isinstance(part, dict) and part.get("type") == "image_url"
+        ]
+        if len(image_parts) != 1:
+            return
+
+        cropped = None
+        boxes = self._focus_boxes(state)
+        if boxes:
+            cropped = crop_screenshot(state.screenshot, boxes, self.crop_viewport_width, self.crop_settings)
+        if cropped is None:
+            self.crop_stats.full_steps += 1
+            return
+
+        left, top, right, bottom = (int(v) for v in cropped.box)
+        content = []
+        for part in managed.message.content:
+            if part is image_parts[0]:
+                content.append({
+                    "type": "text",
+                    "text": f"截图已裁剪到视口区域 ({left},{top})-({right},{bottom})，聚焦最近交互或新出现的元素"
+                            + ("，随后附整页缩略图。" if cropped.thumbnail_b64 else "。"),
+                })
+                crop_url = f"data:image/png;base64,{cropped.crop_b64}"
+                content.append({**part, "image_url": {**part["image_url"], "url": crop_url}})
+                if cropped.thumbnail_b64:
+                    content.append({
+                        "type": "image_url",
+                        "image_url": {"url": f"data:image/png;base64,{cropped.thumbnail_b64}", "detail": "low"},
+                    })
+            else:
+                content.append(part)
+
+        message = HumanMessage(content=content)
+        new_tokens = self._count_tokens(message)
+        history.current_tokens += new_tokens - managed.metadata.tokens
+        managed.message = message
+        managed.metadata.tokens = new_tokens
+        self.crop_stats.cropped_steps += 1
+        self.crop_stats.full_pixels += cropped.full_pixels
+        self.crop_stats.sent_pixels += cropped.sent_pixels
+
+    def _apply_dom_delta(self, state: BrowserState) -> None:
+        history = self.state.history
+        if not history.messages or not isinstance(history.messages[-1].message, HumanMessage):
+            return
+        full_text = state.element_tree.clickable_elements_to_string(include_attributes=self.settings.include_attributes)
+        if not full_text or full_text not in _content_text(history.messages[-1].message.content):
+            return
+
+        full_tokens = self._count_tokens(HumanMessage(content=full_text))
+        self.dom_delta_stats.element_tokens_full += full_tokens
+
+        delta = self.dom_delta_context.last_dom_delta
+        settings = self.dom_delta_settings
+        if (
+                delta is not None
+                and self._find_baseline_index() is not None
+                and delta.is_small(settings.max_ratio, settings.max_elements)
+        ):
+            delta_text = delta.to_text()
+            self._rewrite_last_message(full_text, delta_text)
+            self.dom_delta_stats.delta_steps += 1
+            self.dom_delta_stats.element_tokens_sent += self._count_tokens(HumanMessage(content=delta_text))
+            logger.debug(f"DOM 增量: {delta.size} 个元素变化 ({state.url})")
+            return
+
+        # 变化过大或页面跳转：发送完整列表作为新基线，保存在历史中供后续增量引用
+        baseline_index = self._find_baseline_index()
+        if baseline_index is not None:
+            removed = history.messages.pop(baseline_index)
+            history.current_tokens -= removed.metadata.tokens
+        self._add_message_with_tokens(
+            HumanMessage(content=f"{DOM_BASELINE_HEADER}\nCurrent url: {state.url}\n{full_text}"),
+            position=len(history.messages) - 1,
+            message_type=DOM_BASELINE_MESSAGE_TYPE,
+        )
+        self._rewrite_last_message(full_text, DOM_BASELINE_POINTER)
+        self.dom_delta_context.dom_delta_tracker.set_baseline(state)
+        self.dom_delta_stats.full_steps += 1
+        self.dom_delta_stats.element_tokens_sent += full_tokens
@@ -0,0 +1,158 @@
+"""
+规划器调度模块
+planner_llm 每隔 N 步或在事件（动作失败、进入新域名、子目标停滞）发生时才重新规划，其余步骤复用上一次的计划
+"""
+
+import json
+import logging
+import os
+import re
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+from browser_use.agent.views import ActionResult
+
+logger = logging.getLogger(__name__)
+
+REASON_INITIAL = "initial"
+REASON_INTERVAL = "interval"
+REASON_FAILURE = "failure"
+REASON_NEW_DOMAIN = "new_domain"
+REASON_STALLED = "stalled_subgoal"
+
+
+@dataclass
+class PlannerScheduleSettings:
+    """规划器调度配置"""
+    enabled: bool = True
+    interval: int = 4  # 距上次规划超过该步数时重新规划
+    replan_on_failure: bool = True
+    replan_on_new_domain: bool = True
+    stall_steps: int = 3  # 连续该步数 next_goal 不变视为子目标停滞，0 表示不检测
+
+
+@dataclass
+class PlannerScheduleStats:
+    """规划器调用统计"""
+    planner_calls: int = 0
+    planner_calls_avoided: int = 0
+    reasons: Dict[str, int] = field(default_factory=dict)
+
+    def summary(self) -> str:
+        reasons = ", ".join(f"{reason} {count}" for reason, count in self.reasons.items()) or "无"
+        return f"调用 {self.planner_calls} 次, 复用计划避免 {self.planner_calls_avoided} 次 (触发原因: {reasons})"
+
+
+def _domain(url: Optional[str]) -> str:
+    try:
+        return urlsplit(url or "").netloc.lower()
+    except ValueError:
+        return ""
+
+
+def _normalize_goal(goal: Optional[str]) -> str:
+    return re.sub(r"\s+", " ", (goal or "").strip()).lower()
+
+
+class PlannerScheduler:
+    """决定当前步骤是否需要重新调用 planner_llm"""
+
+    def __init__(self, settings: Optional[PlannerScheduleSettings] = None):
+        self.settings = settings or PlannerScheduleSettings()
+        self.stats = PlannerScheduleStats()
+        self.reset()
+
+    def reset(self) -> None:
+        self.last_plan_step: Optional[int] = None
+        self.last_plan_domain = ""
+        self.last_stall_goal = ""
+
+    def reset_stats(self) -> None:
+        self.stats = PlannerScheduleStats()
+
+    def _stalled_goal(self, recent_goals: List[str]) -> Optional[str]:
+        n = self.settings.stall_steps
+        if n <= 0 or len(recent_goals) < n:
+            return None
+        goals = {_normalize_goal(goal) for goal in recent_goals[-n:]}
+        if len(goals) != 1:
+            return None
+        goal = goals.pop()
+        # 同一个停滞的子目标只触发一次重新规划
+        if not goal or goal == self.last_stall_goal:
+            return None
+        return goal
+
+    def replan_reason(
+            self,
+            step: int,
+            last_result: Optional[List[ActionResult]],
+            url: str,
+            recent_goals: List[str],
+    ) -> Optional[str]:
+        """返回重新规划的原因；返回 None 表示复用上一次的计划"""
+        if self.last_plan_step is None:
+            return REASON_INITIAL
+        if self.settings.replan_on_failure and last_result and any(r.error for r in last_result):
+            return REASON_FAILURE
+        domain = _domain(url)
+        if self.settings.replan_on_new_domain and domain and domain != self.last_plan_domain:
+            return REASON_NEW_DOMAIN
+        stalled = self._stalled_goal(recent_goals)
+        if stalled:
+            self.last_stall_goal = stalled
+            return REASON_STALLED
+        if step - self.last_plan_step >= max(self.settings.interval, 1):
+            return REASON_INTERVAL
+        return None
+
+    def record_plan(self, step: int, url: str, reason: str) -> None:
+        self.last_plan_step = step
+        self.last_plan_domain = _domain(url)
+        self.stats.planner_calls += 1
+        self.stats.reasons[reason] = self.stats.reasons.get(reason, 0) + 1
+
+    def record_skip(self) -> None:
+        self.stats.planner_calls_avoided += 1
+
+
+def append_planner_run(path: str, task: str, settings: PlannerScheduleSettings, stats: PlannerScheduleStats,
+                       steps: int, success: bool) -> None:
+    """追加一条运行记录，用于比较不同调度间隔下的任务成功率"""
+    record = {
+        "time": datetime.now().isoformat(),
+        "task": task[:200],
+        "settings": asdict(settings),
+        "steps": steps,
+        "success": success,
+        "planner_calls": stats.planner_calls,
+        "planner_calls_avoided": stats.planner_calls_avoided,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def summarize_planner_runs(path: str) -> Dict[int, Dict[str, float]]:
+    """按调度间隔汇总历史运行：运行次数、成功率、平均规划调用与避免次数"""
+    groups: Dict[int, List[dict]] = {}
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            groups.setdefault(int(record["settings"].get("interval", 1)), []).append(record)
+    return {
+        interval: {
+            "runs": len(records),
+            "success_rate": sum(1 for r in records if r["success"]) / len(records) * 100,
+            "avg_planner_calls": sum(r["planner_calls"] for r in records) / len(records),
+            "avg_planner_calls_avoided": sum(r["planner_calls_avoided"] for r in records) / len(records),
+        }
+        for interval, records in sorted(groups.items())
+    }
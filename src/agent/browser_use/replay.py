@@ -0,0 +1,139 @@
+"""
+任务回放缓存模块
+按（规范化任务, 起始 URL）保存成功的动作序列，供重复任务直接回放
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+from datetime import datetime
+from typing import Any, List, Optional, Type
+from urllib.parse import urlsplit, urlunsplit
+
+from browser_use.agent.views import AgentHistory, AgentHistoryList, AgentOutput
+from browser_use.browser.views import BrowserState
+
+logger = logging.getLogger(__name__)
+
+HISTORY_FILENAME = "history.json"
+SCRIPT_FILENAME = "replay_script.py"
+META_FILENAME = "meta.json"
+
+
+def normalize_task(task: str) -> str:
+    """规范化任务文本：去除首尾空白、合并空白并转小写"""
+    return re.sub(r"\s+", " ", (task or "").strip()).lower()
+
+
+def normalize_url(url: Optional[str]) -> str:
+    """规范化 URL：小写 scheme/host，去除 fragment 与末尾斜杠"""
+    if not url:
+        return ""
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url.strip()
+    path = parts.path.rstrip("/")
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, parts.query, ""))
+
+
+def is_done_step(item: AgentHistory) -> bool:
+    """判断历史步骤是否包含 done 动作（最终结果必须由 LLM 生成，不回放）"""
+    if not item.model_output:
+        return False
+    for action in item.model_output.action:
+        if "done" in action.model_dump(exclude_unset=True):
+            return True
+    return False
+
+
+def verify_replay_step(item: AgentHistory, state: BrowserState) -> Optional[str]:
+    """
+    校验当前页面是否与录制时一致（URL 与标题）。
+    返回: None 表示一致，否则返回偏离原因
+    """
+    recorded_url = normalize_url(item.state.url)
+    current_url = normalize_url(state.url)
+    if recorded_url != current_url:
+        return f"URL 不一致: 录制={recorded_url}, 当前={current_url}"
+
+    recorded_title = (item.state.title or "").strip()
+    current_title = (state.title or "").strip()
+    if recorded_title != current_title:
+        return f"标题不一致: 录制={recorded_title!r}, 当前={current_title!r}"
+    return None
+
+
+class ReplayStore:
+    """成功动作序列的磁盘存储，按规范化任务与起始 URL 建立索引"""
+
+    def __init__(self, store_dir: str = "./tmp/replay_cache"):
+        self.store_dir = store_dir
+        os.makedirs(self.store_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(task: str, start_url: Optional[str]) -> str:
+        raw = f"{normalize_task(task)}\n{normalize_url(start_url)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.store_dir, key)
+
+    def load(
+            self, task: str, start_url: Optional[str], output_model: Type[AgentOutput]
+    ) -> Optional[AgentHistoryList]:
+        """加载录制的历史，不存在或损坏时返回 None"""
+        key = self.make_key(task, start_url)
+        history_file = os.path.join(self._entry_dir(key), HISTORY_FILENAME)
+        if not os.path.exists(history_file):
+            return None
+        try:
+            history = AgentHistoryList.load_from_file(history_file, output_model)
+            logger.info(f"📼 找到可回放的录制: {key} ({len(history.history)} 步)")
+            return history
+        except Exception as e:
+            logger.warning(f"⚠️ 回放录制 {key} 无法加载，忽略: {e}")
+            return None
+
+    def save(
+            self,
+            task: str,
+            start_url: Optional[str],
+            history: AgentHistoryList,
+            sensitive_data_keys: Optional[List[str]] = None,
+            browser_config: Any = None,
+            context_config: Any = None,
+    ) -> Optional[str]:
+        """保存成功的历史，同时导出 Playwright 脚本便于人工检查"""
+        key = self.make_key(task, start_url)
+        entry_dir = self._entry_dir(key)
+        os.makedirs(entry_dir, exist_ok=True)
+        try:
+            history.save_to_file(os.path.join(entry_dir, HISTORY_FILENAME))
+        except Exception as e:
+            logger.error(f"❌ 保存回放录制失败: {e}", exc_info=True)
+            return None
+
+        try:
+            history.save_as_playwright_script(
+                os.path.join(entry_dir, SCRIPT_FILENAME),
+                sensitive_data_keys=sensitive_data_keys,
+                browser_config=browser_config,
+                context_config=context_config,
+            )
+        except Exception as e:
+            logger.debug(f"导出回放 Playwright 脚本失败: {e}")
+
+        meta = {
+            "task": normalize_task(task),
+            "start_url": normalize_url(start_url),
+            "steps": len(history.history),
+            "saved_at": datetime.now().isoformat(),
+        }
+        with open(os.path.join(entry_dir, META_FILENAME), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2, ensure_ascii=False)
+
+        logger.info(f"💾 已保存回放录制: {entry_dir}")
+        return entry_dir
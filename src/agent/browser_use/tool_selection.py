@@ -0,0 +1,195 @@
+"""
+动作/工具子集选择
+注册多个 MCP 服务器后，每步的动作 schema 会包含全部工具。这里用本地词法索引（BM25）按任务与当前页面
+给注册表中的动作打分，每步只发送排名前 K 的工具加核心浏览器动作；模型可通过 request_tools 动作按关键词追加工具
+"""
+
+import json
+import logging
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set
+
+from browser_use.controller.registry.views import RegisteredAction
+
+logger = logging.getLogger(__name__)
+
+REQUEST_TOOLS_ACTION = "request_tools"
+
+# 始终发送的核心浏览器动作
+CORE_ACTIONS: FrozenSet[str] = frozenset({
+    "done", "search_google", "go_to_url", "go_back", "wait", "click_element_by_index", "input_text",
+    "switch_tab", "open_tab", "close_tab", "extract_content", "scroll_down", "scroll_up", "send_keys",
+    "scroll_to_text", "get_dropdown_options", "select_dropdown_option", "upload_file",
+    "ask_for_assistant", "request_screenshot", REQUEST_TOOLS_ACTION,
+})
+
+_STOP_WORDS = frozenset({"a", "an", "and", "the", "to", "of", "for", "in", "on", "with", "is", "or", "by", "from", "mcp"})
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_CJK_RE = re.compile(r"[一-鿿]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """英文按单词（拆分驼峰与下划线）切分；中文按单字加相邻二元组切分"""
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text or "").lower()
+    tokens = [word for word in _WORD_RE.findall(text) if word not in _STOP_WORDS]
+    for run in _CJK_RE.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def action_document(action: RegisteredAction) -> str:
+    """用于索引的动作文本：名称、描述、参数名与参数描述"""
+    parts = [action.name.replace(".", " ").replace("_", " "), action.description or ""]
+    try:
+        properties = action.param_model.model_json_schema().get("properties", {})
+    except Exception:
+        properties = {}
+    for name, schema in properties.items():
+        parts.append(name.replace("_", " "))
+        if isinstance(schema, dict):
+            parts.append(str(schema.get("description", "")))
+    return " ".join(parts)
+
+
+class ToolIndex:
+    """BM25 词法索引"""
+
+    def __init__(self, documents: Dict[str, str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = {name: Counter(tokenize(text)) for name, text in documents.items()}
+        self.lengths = {name: sum(freqs.values()) for name, freqs in self.term_freqs.items()}
+        self.avg_length = (sum(self.lengths.values()) / len(self.lengths)) if self.lengths else 0.0
+        doc_freqs: Counter = Counter()
+        for freqs in self.term_freqs.values():
+            doc_freqs.update(freqs.keys())
+        n = len(documents)
+        self.idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freqs.items()}
+
+    def scores(self, query: str) -> Dict[str, float]:
+        terms = set(tokenize(query)) & self.idf.keys()
+        scores = {}
+        for name, freqs in self.term_freqs.items():
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[name] / (self.avg_length or 1))
+            score = sum(
+                self.idf[term] * freqs[term] * (self.k1 + 1) / (freqs[term] + norm)
+                for term in terms if term in freqs
+            )
+            if score > 0:
+                scores[name] = score
+        return scores
+
+    def top(self, query: str, k: int, exclude: Iterable[str] = ()) -> List[str]:
+        exclude = set(exclude)
+        ranked = sorted(self.scores(query).items(), key=lambda item: item[1], reverse=True)
+        return [name for name, _ in ranked if name not in exclude][:k]
+
+
+@dataclass
+class ToolSelectionSettings:
+    """工具子集选择配置"""
+    enabled: bool = True
+    top_k: int = 8  # 每步按相关性发送的非核心工具数
+    max_requested: int = 5  # request_tools 每次最多追加的工具数
+    core_actions: FrozenSet[str] = CORE_ACTIONS
+
+
+@dataclass
+class ToolSelectionStats:
+    """动作 schema 大小与选择耗时统计（schema 按 JSON 字符数计，约 4 字符 1 token）"""
+    steps: int = 0
+    full_schema_chars: int = 0
+    sent_schema_chars: int = 0
+    selection_seconds: float = 0.0
+    tools_requested: int = 0
+
+    def reduction_ratio(self) -> float:
+        if not self.full_schema_chars:
+            return 0.0
+        return 1 - self.sent_schema_chars / self.full_schema_chars
+
+    def summary(self) -> str:
+        if not self.steps:
+            return "未启用选择（工具数未超过 top_k）"
+        return (
+            f"{self.steps} 步动作 schema {self.full_schema_chars // self.steps} -> "
+            f"{self.sent_schema_chars // self.steps} 字符/步 (减少 {self.reduction_ratio():.0%}, "
+            f"约 {(self.full_schema_chars - self.sent_schema_chars) // 4 // self.steps} tokens/步), "
+            f"选择耗时 {self.selection_seconds / self.steps * 1000:.1f}ms/步, 模型追加工具 {self.tools_requested} 个"
+        )
+
+
+def schema_chars(action_model) -> int:
+    return len(json.dumps(action_model.model_json_schema(), ensure_ascii=False))
+
+
+class ToolSelector:
+    """每步选出核心动作 + 页面专属动作 + 相关性前 K 的工具 + 模型已请求的工具"""
+
+    def __init__(self, settings: Optional[ToolSelectionSettings] = None):
+        self.settings = settings or ToolSelectionSettings()
+        self.stats = ToolSelectionStats()
+        self.pinned: Set[str] = set()
+        self._index: Optional[ToolIndex] = None
+        self._index_key: Optional[FrozenSet[str]] = None
+        self._full_chars_key: Optional[FrozenSet[str]] = None
+        self._full_chars = 0
+
+    def reset(self) -> None:
+        self.stats = ToolSelectionStats()
+        self.pinned = set()
+
+    def _candidates(self, actions: Dict[str, RegisteredAction]) -> Dict[str, RegisteredAction]:
+        # 带 page_filter / domains 的动作已由 browser_use 按页面筛选，不参与排序
+        return {
+            name: action for name, action in actions.items()
+            if name not in self.settings.core_actions and action.page_filter is None and action.domains is None
+        }
+
+    def _ensure_index(self, candidates: Dict[str, RegisteredAction]) -> ToolIndex:
+        key = frozenset(candidates)
+        if self._index is None or key != self._index_key:
+            self._index = ToolIndex({name: action_document(action) for name, action in candidates.items()})
+            self._index_key = key
+            logger.debug(f"🧰 重建工具索引: {len(candidates)} 个工具")
+        return self._index
+
+    def select(self, actions: Dict[str, RegisteredAction], query: str) -> Optional[List[str]]:
+        """返回本步要发送的动作名；工具数不超过 top_k 时返回 None，表示发送全部"""
+        candidates = self._candidates(actions)
+        if len(candidates) <= self.settings.top_k:
+            return None
+        ranked = set(self._ensure_index(candidates).top(query, self.settings.top_k))
+        return [
+            name for name in actions
+            if name not in candidates or name in ranked or name in self.pinned
+        ]
+
+    def request(self, actions: Dict[str, RegisteredAction], query: str) -> List[str]:
+        """模型按关键词请求更多工具：追加相关性最高且尚未发送的工具，此后每步都会发送"""
+        candidates = self._candidates(actions)
+        if not candidates:
+            return []
+        names = self._ensure_index(candidates).top(query, self.settings.max_requested, exclude=self.pinned)
+        self.pinned.update(names)
+        self.stats.tools_requested += len(names)
+        return names
+
+    def record_step(self, registry, sent_action_model, seconds: float) -> None:
+        # 全量 schema 只在注册表变化时重新计算
+        key = frozenset(registry.registry.actions)
+        if key != self._full_chars_key:
+            self._full_chars = schema_chars(registry.create_action_model())
+            self._full_chars_key = key
+        self.stats.steps += 1
+        self.stats.full_schema_chars += self._full_chars
+        self.stats.sent_schema_chars += schema_chars(sent_action_model)
+        self.stats.selection_seconds += seconds
+
+
+def describe_actions(actions: Dict[str, RegisteredAction], names: Iterable[str]) -> str:
+    return "\n".join(f"- {name}: {actions[name].description}" for name in names if name in actions)
@@ -1,8 +1,10 @@
 import asyncio
 import json
 import logging
+import math
 import os
 import threading
+import time
 import uuid
 from pathlib import Path
 from typing import Any, Dict, List, Optional, TypedDict
@@ -32,9 +34,13 @@ from pydantic import BaseModel, Field
 from browser_use.browser.context import BrowserContextConfig
 
 from src.agent.browser_use.browser_use_agent import BrowserUseAgent
+from src.browser.browser_pool import BrowserPool, BrowserPoolSettings, close_browser_pools, get_browser_pool
 from src.browser.custom_browser import CustomBrowser
+from src.browser.http_cache import HttpCacheSettings
+from src.browser.resource_blocking import ResourceBlockingSettings
+from src.browser.storage_state_cache import StorageStateCacheSettings, get_storage_state_cache
 from src.controller.custom_controller import CustomController
-from src.utils.mcp_client import setup_mcp_client_and_tools
+from src.utils.mcp_pool import get_mcp_pool
 
 logger = logging.getLogger(__name__)
 
@@ -47,6 +53,74 @@ _AGENT_STOP_FLAGS = {}
 _BROWSER_AGENT_INSTANCES = {}
 
 
+def _make_browser_config(browser_config: Dict[str, Any]) -> BrowserConfig:
+    """Builds the browser launch config for research sub-agents from the agent's config dict"""
+    headless = browser_config.get("headless", False)
+    window_w = browser_config.get("window_width", 1280)
+    window_h = browser_config.get("window_height", 1100)
+    browser_user_data_dir = browser_config.get("user_data_dir", None)
+    use_own_browser = browser_config.get("use_own_browser", False)
+    browser_binary_path = browser_config.get("browser_binary_path", None)
+    wss_url = browser_config.get("wss_url", None)
+    cdp_url = browser_config.get("cdp_url", None)
+
+    extra_args = []
+    if use_own_browser:
+        browser_binary_path = os.getenv("BROWSER_PATH", None) or browser_binary_path
+        if browser_binary_path == "":
+            browser_binary_path = None
+        browser_user_data = browser_user_data_dir or os.getenv("BROWSER_USER_DATA", None)
+        if browser_user_data:
+            extra_args += [f"--user-data-dir={browser_user_data}"]
+    else:
+        browser_binary_path = None
+
+    return BrowserConfig(
+        headless=headless,
+        browser_binary_path=browser_binary_path,
+        extra_browser_args=extra_args,
+        wss_url=wss_url,
+        cdp_url=cdp_url,
+        new_context_config=BrowserContextConfig(
+            window_width=window_w,
+            window_height=window_h,
+        )
+    )
+
+
+def _make_http_cache_settings(browser_config: Dict[str, Any]) -> Optional[HttpCacheSettings]:
+    """Shared HTTP disk cache for research browsers; warm_http_cache keeps it across research runs"""
+    if browser_config.get("warm_http_cache"):
+        return HttpCacheSettings(warm=True)
+    if browser_config.get("http_cache"):
+        return HttpCacheSettings()
+    return None
+
+
+def get_research_browser_pool(
+        browser_config: Dict[str, Any], max_parallel_browsers: int = 1
+) -> Optional[BrowserPool]:
+    """
+    Returns the shared browser pool when browser_config enables use_browser_pool.
+    A user profile (use_own_browser) cannot be opened by several browser processes, so it is never pooled.
+    With contexts_per_browser > 1 parallel sub-agents share browser processes, each in its own context.
+    """
+    if not browser_config.get("use_browser_pool") or browser_config.get("use_own_browser"):
+        return None
+    contexts_per_browser = max(int(browser_config.get("contexts_per_browser") or 1), 1)
+    if contexts_per_browser > 1:
+        max_size = math.ceil(max_parallel_browsers / contexts_per_browser)
+    else:
+        max_size = max(max_parallel_browsers, BrowserPoolSettings.max_size)
+    settings = BrowserPoolSettings(
+        max_size=max_size,
+        contexts_per_browser=contexts_per_browser,
+        memory_budget_mb=browser_config.get("memory_budget_mb") or None,
+        http_cache=_make_http_cache_settings(browser_config),
+    )
+    return get_browser_pool(_make_browser_config(browser_config), settings)
+
+
 async def run_single_browser_task(
         task_query: str,
         task_id: str,
@@ -54,10 +128,14 @@ async def run_single_browser_task(
         browser_config: Dict[str, Any],
         stop_event: threading.Event,
         use_vision: bool = False,
+        browser_pool: Optional[BrowserPool] = None,
 ) -> Dict[str, Any]:
     """
     Runs a single BrowserUseAgent task.
-    Manages browser creation and closing for this specific task.
+    Manages browser creation and closing for this specific task, or leases a warm browser
+    with a fresh context from browser_pool when one is given.
+    With storage_state_cache enabled, saved logins are injected into the new context and the
+    context's state is saved back after a successful run (shared mode, safe for parallel tasks).
     """
     if not BrowserUseAgent:
         return {
@@ -66,53 +144,34 @@ async def run_single_browser_task(
         }
 
     # --- Browser Setup ---
-    # These should ideally come from the main agent's config
-    headless = browser_config.get("headless", False)
     window_w = browser_config.get("window_width", 1280)
     window_h = browser_config.get("window_height", 1100)
-    browser_user_data_dir = browser_config.get("user_data_dir", None)
-    use_own_browser = browser_config.get("use_own_browser", False)
-    browser_binary_path = browser_config.get("browser_binary_path", None)
-    wss_url = browser_config.get("wss_url", None)
-    cdp_url = browser_config.get("cdp_url", None)
-    disable_security = browser_config.get("disable_security", False)
 
     bu_browser = None
     bu_browser_context = None
+    browser_lease = None
+    storage_cache = None
+    if browser_config.get("storage_state_cache"):
+        storage_cache = get_storage_state_cache(StorageStateCacheSettings(shared=True))
     try:
         logger.info(f"Starting browser task for query: {task_query}")
-        extra_args = []
-        if use_own_browser:
-            browser_binary_path = os.getenv("BROWSER_PATH", None) or browser_binary_path
-            if browser_binary_path == "":
-                browser_binary_path = None
-            browser_user_data = browser_user_data_dir or os.getenv("BROWSER_USER_DATA", None)
-            if browser_user_data:
-                extra_args += [f"--user-data-dir={browser_user_data}"]
-        else:
-            browser_binary_path = None
-
-        bu_browser = CustomBrowser(
-            config=BrowserConfig(
-                headless=headless,
-                browser_binary_path=browser_binary_path,
-                extra_browser_args=extra_args,
-                wss_url=wss_url,
-                cdp_url=cdp_url,
-                new_context_config=BrowserContextConfig(
-                    window_width=window_w,
-                    window_height=window_h,
-                )
-            )
-        )
-
         context_config = BrowserContextConfig(
             save_downloads_path="./tmp/downloads",
             window_height=window_h,
             window_width=window_w,
             force_new_context=True,
         )
-        bu_browser_context = await bu_browser.new_context(config=context_config)
+        if browser_pool is not None:
+            browser_lease = await browser_pool.acquire(context_config)
+            bu_browser, bu_browser_context = browser_lease.browser, browser_lease.context
+        else:
+            bu_browser = CustomBrowser(config=_make_browser_config(browser_config))
+            bu_browser.configure_http_cache(_make_http_cache_settings(browser_config))
+            bu_browser_context = await bu_browser.new_context(config=context_config)
+        if storage_cache is not None:
+            await storage_cache.inject(bu_browser_context)
+        resource_blocking = browser_config.get("resource_blocking") or "full"
+        await bu_browser_context.configure_resource_blocking(ResourceBlockingSettings(preset=resource_blocking))
 
         # Simple controller example, replace with your actual implementation if needed
         bu_controller = CustomController()
@@ -160,6 +219,10 @@ async def run_single_browser_task(
         logger.info(f"BrowserUseAgent finished for: {task_query}")
 
         final_data = result.final_result()
+        if bu_browser_context.resource_blocker is not None:
+            logger.info(f"Resource blocking ({resource_blocking}): {bu_browser_context.resource_blocker.stats.summary()}")
+        if storage_cache is not None and not stop_event.is_set():
+            await storage_cache.capture(bu_browser_context, success=bool(result.is_successful()))
 
         if stop_event.is_set():
             logger.info(f"Browser task for '{task_query}' stopped during execution.")
@@ -174,6 +237,14 @@ async def run_single_browser_task(
         )
         return {"query": task_query, "error": str(e), "status": "failed"}
     finally:
+        if browser_lease is not None:
+            # Close this task's context; the browser process stays in the pool
+            try:
+                await browser_lease.release()
+                logger.info("Returned browser to pool.")
+            except Exception as e:
+                logger.error(f"Error returning browser to pool: {e}")
+            bu_browser_context = bu_browser = None
         if bu_browser_context:
             try:
                 await bu_browser_context.close()
@@ -206,6 +277,7 @@ async def _run_browser_search_tool(
         browser_config: Dict[str, Any],
         stop_event: threading.Event,
         max_parallel_browsers: int = 1,
+        browser_pool: Optional[BrowserPool] = None,
 ) -> List[Dict[str, Any]]:
     """
     Internal function to execute parallel browser searches based on LLM-provided queries.
@@ -236,6 +308,7 @@ async def _run_browser_search_tool(
                 browser_config,
                 stop_event,
                 # use_vision could be added here if needed
+                browser_pool=browser_pool,
             )
 
     tasks = [task_wrapper(query) for query in queries]
@@ -274,6 +347,7 @@ def create_browser_search_tool(
         task_id: str,
         stop_event: threading.Event,
         max_parallel_browsers: int = 1,
+        browser_pool: Optional[BrowserPool] = None,
 ) -> StructuredTool:
     """Factory function to create the browser search tool with necessary dependencies."""
     # Use partial to bind the dependencies that aren't part of the LLM call arguments
@@ -286,6 +360,7 @@ def create_browser_search_tool(
         browser_config=browser_config,
         stop_event=stop_event,
         max_parallel_browsers=max_parallel_browsers,
+        browser_pool=browser_pool,
     )
 
     return StructuredTool.from_function(
@@ -606,6 +681,37 @@ Ensure the output is a valid JSON array.
         return {"error_message": f"LLM Error during planning: {e}"}
 
 
+_TOOL_NOT_FOUND = object()
+
+
+async def _execute_tool_call(tool_call: Dict[str, Any], tools: List[Tool]) -> tuple:
+    """
+    Executes one tool call requested by the LLM.
+    Returns (ToolMessage, tool_output, error); errors are reported in the ToolMessage instead of raised,
+    so one failing or timed-out call does not cancel the others running alongside it.
+    """
+    tool_name = tool_call.get("name")
+    tool_args = tool_call.get("args", {})
+    tool_call_id = tool_call.get("id")
+
+    logger.info(f"LLM requested tool call: {tool_name} with args: {tool_args}")
+    selected_tool = next((t for t in tools if t.name == tool_name), None)
+    if not selected_tool:
+        logger.error(f"LLM called tool '{tool_name}' which is not available.")
+        error = f"Error: Tool '{tool_name}' not found."
+        return ToolMessage(content=error, tool_call_id=tool_call_id), _TOOL_NOT_FOUND, error
+
+    try:
+        logger.info(f"Executing tool: {tool_name}")
+        start_time = time.monotonic()
+        tool_output = await selected_tool.ainvoke(tool_args)
+        logger.info(f"Tool '{tool_name}' executed successfully in {time.monotonic() - start_time:.2f}s.")
+        return ToolMessage(content=json.dumps(tool_output), tool_call_id=tool_call_id), tool_output, None
+    except Exception as e:
+        logger.error(f"Error executing tool '{tool_name}': {e}", exc_info=True)
+        return ToolMessage(content=f"Error executing tool {tool_name}: {e}", tool_call_id=tool_call_id), None, str(e)
+
+
 async def research_execution_node(state: DeepResearchState) -> Dict[str, Any]:
     logger.info("--- Entering Research Execution Node ---")
     if state.get("stop_requested"):
@@ -702,52 +808,35 @@ async def research_execution_node(state: DeepResearchState) -> Dict[str, Any]:
             return current_task
             # We still save the plan and advance.
         else:
-            # Process tool calls
-            for tool_call in ai_response.tool_calls:
+            stop_event = _AGENT_STOP_FLAGS.get(task_id)
+            if stop_event and stop_event.is_set():
+                logger.info("Stop requested before executing tools.")
+                current_task["status"] = "pending"  # Or a new "stopped" status
+                _save_plan_to_md(plan, output_dir)
+                return {"stop_requested": True, "research_plan": plan, "current_category_index": cat_idx,
+                        "current_task_index_in_category": task_idx}
+
+            # Process tool calls: independent calls run concurrently, results are kept in call order
+            executed_tool_names = [tool_call.get("name") for tool_call in ai_response.tool_calls]
+            outcomes = await asyncio.gather(
+                *(_execute_tool_call(tool_call, tools) for tool_call in ai_response.tool_calls)
+            )
+            for tool_call, (tool_message, tool_output, error) in zip(ai_response.tool_calls, outcomes):
                 tool_name = tool_call.get("name")
                 tool_args = tool_call.get("args", {})
-                tool_call_id = tool_call.get("id")
-
-                logger.info(f"LLM requested tool call: {tool_name} with args: {tool_args}")
-                executed_tool_names.append(tool_name)
-                selected_tool = next((t for t in tools if t.name == tool_name), None)
-
-                if not selected_tool:
-                    logger.error(f"LLM called tool '{tool_name}' which is not available.")
-                    tool_results.append(
-                        ToolMessage(content=f"Error: Tool '{tool_name}' not found.", tool_call_id=tool_call_id))
-                    continue
-
-                try:
-                    stop_event = _AGENT_STOP_FLAGS.get(task_id)
-                    if stop_event and stop_event.is_set():
-                        logger.info(f"Stop requested before executing tool: {tool_name}")
-                        current_task["status"] = "pending"  # Or a new "stopped" status
-                        _save_plan_to_md(plan, output_dir)
-                        return {"stop_requested": True, "research_plan": plan, "current_category_index": cat_idx,
-                                "current_task_index_in_category": task_idx}
-
-                    logger.info(f"Executing tool: {tool_name}")
-                    tool_output = await selected_tool.ainvoke(tool_args)
-                    logger.info(f"Tool '{tool_name}' executed successfully.")
-
-                    if tool_name == "parallel_browser_search":
-                        current_search_results.extend(tool_output)  # tool_output is List[Dict]
-                    else:  # For other tools, we might need specific handling or just log
-                        logger.info(f"Result from tool '{tool_name}': {str(tool_output)[:200]}...")
-                        # Storing non-browser results might need a different structure or key in search_results
+                tool_results.append(tool_message)
+                if error is not None:
+                    if tool_output is not _TOOL_NOT_FOUND:
                         current_search_results.append(
-                            {"tool_name": tool_name, "args": tool_args, "output": str(tool_output),
-                             "status": "completed"})
-
-                    tool_results.append(ToolMessage(content=json.dumps(tool_output), tool_call_id=tool_call_id))
-
-                except Exception as e:
-                    logger.error(f"Error executing tool '{tool_name}': {e}", exc_info=True)
-                    tool_results.append(
-                        ToolMessage(content=f"Error executing tool {tool_name}: {e}", tool_call_id=tool_call_id))
+                            {"tool_name": tool_name, "args": tool_args, "status": "failed", "error": error})
+                elif tool_name == "parallel_browser_search":
+                    current_search_results.extend(tool_output)  # tool_output is List[Dict]
+                else:  # For other tools, we might need specific handling or just log
+                    logger.info(f"Result from tool '{tool_name}': {str(tool_output)[:200]}...")
+                    # Storing non-browser results might need a different structure or key in search_results
                     current_search_results.append(
-                        {"tool_name": tool_name, "args": tool_args, "status": "failed", "error": str(e)})
+                        {"tool_name": tool_name, "args": tool_args, "output": str(tool_output),
+                         "status": "completed"})
 
             # After processing all tool calls for this task
             step_failed_tool_execution = any("Error:" in str(tr.content) for tr in tool_results)
@@ -1014,12 +1103,17 @@ class DeepResearchAgent:
             ReadFileTool(),
             ListDirectoryTool(),
         ]  # Basic file operations
+        browser_pool = get_research_browser_pool(self.browser_config, max_parallel_browsers)
+        if browser_pool is not None:
+            # Launch browsers in the background during the planning LLM call, so the first searches do not wait for Chromium
+            browser_pool.prewarm(math.ceil(max_parallel_browsers / browser_pool.settings.contexts_per_browser))
         browser_use_tool = create_browser_search_tool(
             llm=self.llm,
             browser_config=self.browser_config,
             task_id=task_id,
             stop_event=stop_event,
             max_parallel_browsers=max_parallel_browsers,
+            browser_pool=browser_pool,
         )
         tools += [browser_use_tool]
         # Add MCP tools if config is provided
@@ -1027,10 +1121,11 @@ class DeepResearchAgent:
             try:
                 logger.info("Setting up MCP client and tools...")
                 if not self.mcp_client:
-                    self.mcp_client = await setup_mcp_client_and_tools(
+                    self.mcp_client = await get_mcp_pool().acquire(
                         self.mcp_server_config
                     )
-                mcp_tools = self.mcp_client.get_tools()
+                # The wrapped tools carry the per-server concurrency limit and timeout
+                mcp_tools = self.mcp_client.get_managed_tools()
                 logger.info(f"Loaded {len(mcp_tools)} MCP tools.")
                 tools.extend(mcp_tools)
             except Exception as e:
@@ -1044,7 +1139,7 @@ class DeepResearchAgent:
 
     async def close_mcp_client(self):
         if self.mcp_client:
-            await self.mcp_client.__aexit__(None, None, None)
+            await self.mcp_client.release()
             self.mcp_client = None
 
     def _compile_graph(self) -> StateGraph:
@@ -1206,12 +1301,18 @@ class DeepResearchAgent:
         finally:
             logger.info(f"Cleaning up resources for task {self.current_task_id}")
             task_id_to_clean = self.current_task_id
+            stop_requested = self.stop_event is not None and self.stop_event.is_set()
 
             self.stop_event = None
             self.current_task_id = None
             self.runner = None  # Mark runner as finished
+            # Only release the lease; the MCP servers stay in the pool for later tasks
             if self.mcp_client:
-                await self.mcp_client.__aexit__(None, None, None)
+                logger.info(f"MCP result cache: {self.mcp_client.result_cache_stats.summary()}")
+            await self.close_mcp_client()
+            # A stopped run shuts the pooled browsers down; a finished run keeps them warm for the next task
+            if stop_requested:
+                await close_browser_pools()
 
             # Return a result dictionary including the status and the final state if available
             return {
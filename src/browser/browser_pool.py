@@ -0,0 +1,399 @@
+"""
+预热浏览器池
+按浏览器启动配置复用 Chromium 进程：池中保持 min_size 个已启动的浏览器，最多 max_size 个，
+每次租用都在复用的进程中新建一个独立的上下文（cookie、存储互不相通），归还时关闭上下文。
+浏览器断开会被丢弃重建，租用次数达到 max_uses 后回收进程，避免长时间运行的内存增长。
+
+contexts_per_browser > 1 时为上下文复用模式：多个并发 agent 共享同一个浏览器进程，各自持有独立上下文，
+新租用优先填满已有浏览器；某个上下文的页面崩溃只影响该租用，整个浏览器断开时只替换该浏览器。
+设置 memory_budget_mb 后，池内浏览器总内存超出预算时新的租用会等待已有租用归还
+"""
+
+import asyncio
+import logging
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from browser_use.browser.browser import BrowserConfig
+from browser_use.browser.context import BrowserContextConfig
+
+from src.utils.hashing import stable_hash
+
+from .custom_browser import CustomBrowser
+from .custom_context import CustomBrowserContext
+from .http_cache import HttpCacheSettings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BrowserPoolSettings:
+    """浏览器池配置"""
+    min_size: int = 1  # 预热并保持的浏览器数
+    max_size: int = 4  # 同时存在的浏览器上限，租用超过时排队等待
+    max_uses: int = 20  # 每个浏览器进程最多租用次数，达到后不再分配新租用，全部归还后关闭
+    idle_timeout: float = 300.0  # 超出 min_size 的浏览器空闲该秒数后关闭
+    reap_interval: float = 30.0
+    launch_timeout: float = 60.0
+    contexts_per_browser: int = 1  # 每个浏览器进程同时承载的上下文数，大于 1 即上下文复用模式
+    memory_budget_mb: Optional[float] = None  # 池内浏览器总内存（RSS）上限，None 表示不限制
+    memory_check_interval: float = 2.0  # 内存采样的最短间隔（秒）
+    http_cache: Optional[HttpCacheSettings] = None  # 池内浏览器使用的共享 HTTP 磁盘缓存
+
+
+@dataclass
+class BrowserPoolStats:
+    """浏览器池统计"""
+    launches: int = 0
+    failed_launches: int = 0
+    reuses: int = 0
+    recycled: int = 0  # 达到 max_uses 后回收
+    unhealthy: int = 0  # 断开或上下文出错后丢弃
+    idle_shutdowns: int = 0
+    context_crashes: int = 0  # 页面崩溃的租用数（浏览器本身仍可用）
+    memory_waits: int = 0  # 因超出内存预算而等待的次数
+    peak_contexts: int = 0
+    launch_seconds: float = 0.0
+    wait_seconds: float = 0.0  # 池满时排队等待的累计时间
+
+    def summary(self) -> str:
+        avg_launch = self.launch_seconds / self.launches if self.launches else 0.0
+        return (
+            f"启动 {self.launches} 次 (平均 {avg_launch:.2f}s, 失败 {self.failed_launches}), 复用 {self.reuses} 次, "
+            f"回收 {self.recycled} 次, 丢弃异常 {self.unhealthy} 次, 空闲关闭 {self.idle_shutdowns} 次, "
+            f"页面崩溃 {self.context_crashes} 次, 并发上下文峰值 {self.peak_contexts}, "
+            f"内存预算等待 {self.memory_waits} 次, 排队等待 {self.wait_seconds:.2f}s"
+        )
+
+
+class _PooledBrowser:
+    def __init__(self, config: BrowserConfig, http_cache: Optional[HttpCacheSettings] = None):
+        self.browser = CustomBrowser(config=config)
+        self.browser.configure_http_cache(http_cache)
+        self.uses = 0
+        self.active = 0  # 当前租出的上下文数
+        self.draining = False  # 已达 max_uses 或已断开，不再分配新租用
+        self.last_used = time.monotonic()
+
+    async def launch(self, timeout: float) -> None:
+        await asyncio.wait_for(self.browser.get_playwright_browser(), timeout=timeout)
+
+    def is_healthy(self) -> bool:
+        playwright_browser = getattr(self.browser, "playwright_browser", None)
+        return playwright_browser is not None and playwright_browser.is_connected()
+
+    async def close(self) -> None:
+        try:
+            await self.browser.close()
+        except Exception as e:
+            logger.debug(f"关闭浏览器出错: {e}")
+
+
+class BrowserLease:
+    """一次租用：复用的浏览器进程 + 新建的独立上下文"""
+
+    def __init__(self, pool: "BrowserPool", pooled: _PooledBrowser, context: CustomBrowserContext):
+        self._pool = pool
+        self._pooled = pooled
+        self.browser: CustomBrowser = pooled.browser
+        self.context: CustomBrowserContext = context
+        self._released = False
+
+    @property
+    def crashed(self) -> bool:
+        """本上下文的页面崩溃过，或所在浏览器已断开"""
+        return self.context.crashed_pages > 0 or not self._pooled.is_healthy()
+
+    async def release(self, discard: bool = False) -> None:
+        """关闭上下文并归还浏览器；discard 为 True 时（例如任务中浏览器崩溃）不再向该浏览器分配租用"""
+        if self._released:
+            return
+        self._released = True
+        await self._pool.release(self._pooled, self.context, discard)
+
+    async def __aenter__(self) -> "BrowserLease":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.release()
+
+
+class BrowserPool:
+    """同一启动配置的浏览器池"""
+
+    def __init__(self, config: BrowserConfig, settings: Optional[BrowserPoolSettings] = None):
+        self.config = config
+        self.settings = settings or BrowserPoolSettings()
+        self.stats = BrowserPoolStats()
+        self._browsers: List[_PooledBrowser] = []
+        self._launching = 0  # 正在启动的浏览器数
+        self._warming_count = 0  # 其中由预热启动的数量，租用方优先等待它们而不是另行启动
+        self._condition = asyncio.Condition()
+        self._warming: Optional[asyncio.Task] = None
+        self._reaper: Optional[asyncio.Task] = None
+        self._memory_mb: Optional[float] = None
+        self._memory_checked_at = 0.0
+        self._closed = False
+
+    @property
+    def size(self) -> int:
+        """已启动或正在启动的浏览器数"""
+        return len(self._browsers) + self._launching
+
+    @property
+    def idle_count(self) -> int:
+        return sum(1 for pooled in self._browsers if not pooled.active and not pooled.draining)
+
+    @property
+    def active_contexts(self) -> int:
+        return sum(pooled.active for pooled in self._browsers)
+
+    async def _launch(self) -> Optional[_PooledBrowser]:
+        """启动一个浏览器；调用前已计入 _launching，完成后由调用方加入 _browsers"""
+        pooled = _PooledBrowser(self.config, self.settings.http_cache)
+        start_time = time.perf_counter()
+        try:
+            await pooled.launch(self.settings.launch_timeout)
+        except Exception as e:
+            self.stats.failed_launches += 1
+            logger.error(f"❌ 浏览器池启动浏览器失败: {e}")
+            await pooled.close()
+            return None
+        self.stats.launches += 1
+        self.stats.launch_seconds += time.perf_counter() - start_time
+        return pooled
+
+    def prewarm(self, count: Optional[int] = None) -> None:
+        """
+        在后台把浏览器数补到 count（默认 min_size），不阻塞调用方。
+        超出 min_size 的预热浏览器空闲 idle_timeout 后会被关闭
+        """
+        if self._closed or (self._warming is not None and not self._warming.done()):
+            return
+        target = min(max(count or 0, self.settings.min_size), self.settings.max_size)
+        self._warming = asyncio.create_task(self._warm(target), name="browser-pool-warm")
+        self._ensure_reaper()
+
+    async def start(self, count: Optional[int] = None) -> None:
+        """预热并等待浏览器启动完成"""
+        self.prewarm(count)
+        if self._warming is not None:
+            await self._warming
+
+    async def _warm(self, target: int) -> None:
+        # 并行启动缺少的浏览器
+        async def launch_one() -> Optional[_PooledBrowser]:
+            pooled = await self._launch()
+            async with self._condition:
+                self._launching -= 1
+                self._warming_count -= 1
+                if pooled is not None:
+                    self._browsers.append(pooled)
+                self._condition.notify_all()
+            return pooled
+
+        async with self._condition:
+            missing = max(target - self.size, 0) if not self._closed else 0
+            self._launching += missing
+            self._warming_count += missing
+        launched = await asyncio.gather(*(launch_one() for _ in range(missing)))
+        if missing:
+            logger.info(f"🔥 浏览器池已预热 {sum(p is not None for p in launched)} 个浏览器, 当前 {self.size} 个")
+
+    def _pick(self) -> Optional[_PooledBrowser]:
+        """优先填满已有租用的浏览器，让上下文集中在尽量少的进程里"""
+        available = [
+            pooled for pooled in self._browsers
+            if not pooled.draining and pooled.active < self.settings.contexts_per_browser
+        ]
+        if not available:
+            return None
+        return max(available, key=lambda pooled: (pooled.active, pooled.last_used))
+
+    async def memory_usage_mb(self, max_age: float = 0.0) -> Optional[float]:
+        """池内全部浏览器的内存总和（MB），max_age 秒内的采样直接复用"""
+        if self._memory_mb is not None and time.monotonic() - self._memory_checked_at < max_age:
+            return self._memory_mb
+        usages = await asyncio.gather(*(pooled.browser.memory_usage_mb() for pooled in list(self._browsers)))
+        known = [usage for usage in usages if usage is not None]
+        self._memory_mb = sum(known) if known else None
+        self._memory_checked_at = time.monotonic()
+        return self._memory_mb
+
+    async def _wait_for_memory(self) -> None:
+        """超出内存预算时等待已有租用归还；没有任何租用时总是放行，避免永久阻塞"""
+        budget = self.settings.memory_budget_mb
+        if not budget:
+            return
+        waited = False
+        while self.active_contexts:
+            usage = await self.memory_usage_mb(max_age=self.settings.memory_check_interval)
+            if usage is None or usage < budget:
+                break
+            if not waited:
+                waited = True
+                self.stats.memory_waits += 1
+                logger.info(f"🧠 浏览器内存 {usage:.0f}MB 超出预算 {budget:.0f}MB，等待已有租用归还")
+            async with self._condition:
+                try:
+                    await asyncio.wait_for(self._condition.wait(), timeout=self.settings.memory_check_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def acquire(self, context_config: Optional[BrowserContextConfig] = None) -> BrowserLease:
+        """租用一个浏览器并新建独立上下文；没有可用浏览器且已达 max_size 时等待归还"""
+        if self._closed:
+            raise RuntimeError("Browser pool is closed")
+        self._ensure_reaper()
+        wait_start = time.perf_counter()
+        await self._wait_for_memory()
+        while True:
+            pooled = None
+            launch = False
+            async with self._condition:
+                while True:
+                    pooled = self._pick()
+                    if pooled is not None or (self.size < self.settings.max_size and not self._warming_count):
+                        break
+                    await self._condition.wait()
+                if pooled is None:
+                    launch = True
+                    self._launching += 1
+                else:
+                    # 先占住名额，健康检查失败时再归还
+                    pooled.active += 1
+            self.stats.wait_seconds += time.perf_counter() - wait_start
+            wait_start = time.perf_counter()
+
+            if launch:
+                pooled = await self._launch()
+                async with self._condition:
+                    self._launching -= 1
+                    if pooled is not None:
+                        pooled.active += 1
+                        self._browsers.append(pooled)
+                    self._condition.notify_all()
+                if pooled is None:
+                    raise RuntimeError("Failed to launch browser for pool")
+                break
+            if pooled.is_healthy():
+                self.stats.reuses += 1
+                break
+            self.stats.unhealthy += 1
+            logger.warning("⚠️ 池中浏览器已断开，不再分配租用")
+            pooled.active -= 1
+            pooled.draining = True
+            await self._close_if_drained(pooled)
+
+        pooled.uses += 1
+        pooled.last_used = time.monotonic()
+        if pooled.uses >= self.settings.max_uses:
+            pooled.draining = True
+        self.stats.peak_contexts = max(self.stats.peak_contexts, self.active_contexts)
+        config = (context_config or BrowserContextConfig()).model_copy(update={"force_new_context": True})
+        try:
+            context = await pooled.browser.new_context(config=config)
+        except Exception:
+            pooled.active -= 1
+            pooled.draining = True
+            await self._close_if_drained(pooled)
+            raise
+        return BrowserLease(self, pooled, context)
+
+    async def release(self, pooled: _PooledBrowser, context: CustomBrowserContext, discard: bool = False) -> None:
+        if context.crashed_pages:
+            # 崩溃只波及本上下文：关闭它即可，浏览器仍健康时继续服务其他租用
+            self.stats.context_crashes += 1
+            logger.warning(f"💥 租用期间有 {context.crashed_pages} 个页面崩溃，已隔离该上下文")
+        try:
+            await context.close()
+        except Exception as e:
+            logger.warning(f"⚠️ 关闭池中浏览器上下文出错，不再向该浏览器分配租用: {e}")
+            discard = True
+        pooled.active = max(pooled.active - 1, 0)
+        pooled.last_used = time.monotonic()
+        if not pooled.draining and (discard or not pooled.is_healthy()):
+            pooled.draining = True
+            if not discard:
+                self.stats.unhealthy += 1
+        if pooled.draining and pooled.uses >= self.settings.max_uses and pooled.is_healthy() and not pooled.active:
+            self.stats.recycled += 1
+            logger.info(f"♻️ 浏览器已租用 {pooled.uses} 次，回收进程")
+        if await self._close_if_drained(pooled):
+            self.prewarm()
+            return
+        async with self._condition:
+            self._condition.notify_all()
+
+    async def _close_if_drained(self, pooled: _PooledBrowser) -> bool:
+        """不再分配的浏览器在最后一个租用归还后关闭；已断开的浏览器立即移出"""
+        if self._closed:
+            pooled.draining = True
+        if not pooled.draining or (pooled.active and pooled.is_healthy()):
+            return False
+        async with self._condition:
+            if pooled not in self._browsers:
+                return False
+            self._browsers.remove(pooled)
+            self._condition.notify_all()
+        await pooled.close()
+        return True
+
+    def _ensure_reaper(self) -> None:
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap_idle(), name="browser-pool-reaper")
+
+    async def _reap_idle(self) -> None:
+        while not self._closed:
+            await asyncio.sleep(self.settings.reap_interval)
+            now = time.monotonic()
+            expired = []
+            async with self._condition:
+                # 从最久未用的开始关闭，保留 min_size 个
+                idle = sorted((p for p in self._browsers if not p.active), key=lambda p: p.last_used)
+                for pooled in idle:
+                    if self.size - len(expired) <= self.settings.min_size:
+                        break
+                    if now - pooled.last_used >= self.settings.idle_timeout:
+                        pooled.draining = True
+                        expired.append(pooled)
+            for pooled in expired:
+                if await self._close_if_drained(pooled):
+                    self.stats.idle_shutdowns += 1
+
+    async def close(self) -> None:
+        self._closed = True
+        for task in (self._warming, self._reaper):
+            if task is not None and not task.done():
+                task.cancel()
+        async with self._condition:
+            browsers, self._browsers = self._browsers, []
+            self._condition.notify_all()
+        for pooled in browsers:
+            await pooled.close()
+        logger.info(f"🔥 浏览器池已关闭: {self.stats.summary()}")
+
+
+# 浏览器与 playwright 连接绑定在创建它们的事件循环上，因此每个事件循环、每种启动配置一个池
+_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, BrowserPool]]" = weakref.WeakKeyDictionary()
+
+
+def get_browser_pool(config: BrowserConfig, settings: Optional[BrowserPoolSettings] = None) -> BrowserPool:
+    """返回当前事件循环中该启动配置的浏览器池；传入的 settings 同样应用到已存在的池"""
+    loop_pools = _pools.setdefault(asyncio.get_running_loop(), {})
+    key = stable_hash(config.model_dump())
+    pool = loop_pools.get(key)
+    if pool is None or pool._closed:
+        pool = loop_pools[key] = BrowserPool(config, settings)
+    elif settings is not None:
+        pool.settings = settings
+    return pool
+
+
+async def close_browser_pools() -> None:
+    """关闭当前事件循环中的所有浏览器池（停止任务或浏览器设置变更时调用），下次租用会重新创建"""
+    loop_pools = _pools.pop(asyncio.get_running_loop(), {})
+    for pool in loop_pools.values():
+        await pool.close()
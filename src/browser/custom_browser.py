@@ -25,13 +25,62 @@ from browser_use.browser.context import BrowserContext, BrowserContextConfig
 from browser_use.browser.utils.screen_resolution import get_screen_resolution, get_window_adjustments
 from browser_use.utils import time_execution_async
 import socket
+from typing import Optional
+
+import psutil
 
 from .custom_context import CustomBrowserContext
+from .http_cache import HttpCacheSettings, HttpDiskCache, open_http_cache
 
 logger = logging.getLogger(__name__)
 
 
 class CustomBrowser(Browser):
+    # Shared by every context of this browser, see configure_http_cache
+    http_cache: Optional[HttpDiskCache] = None
+
+    def configure_http_cache(self, settings: Optional[HttpCacheSettings]) -> None:
+        """
+        Serve cacheable GET responses for all contexts from a bounded disk cache (None disables it).
+        Applies to contexts created afterwards; with settings.warm the cache directory outlives the browser.
+        """
+        if self.http_cache is not None:
+            self.http_cache.close()
+        self.http_cache = open_http_cache(settings) if settings else None
+
+    async def close(self):
+        await super().close()
+        if self.http_cache is not None and not self.config.keep_alive:
+            self.http_cache.close()
+            self.http_cache = None
+
+    async def memory_usage_mb(self, proportional: bool = False) -> Optional[float]:
+        """
+        Resident memory of the browser and all its renderer/GPU/utility processes, in MB.
+        proportional=True sums PSS instead of RSS (shared pages split between processes, slower to read).
+        Returns None when the browser is not running locally (CDP/WSS) or the processes cannot be read.
+        """
+        playwright_browser = getattr(self, 'playwright_browser', None)
+        if playwright_browser is None or not playwright_browser.is_connected():
+            return None
+        try:
+            session = await playwright_browser.new_browser_cdp_session()
+            try:
+                info = await session.send('SystemInfo.getProcessInfo')
+            finally:
+                await session.detach()
+        except Exception as e:
+            logger.debug(f'Failed to read browser process info: {e}')
+            return None
+        total = 0
+        for process in info.get('processInfo', []):
+            try:
+                proc = psutil.Process(process['id'])
+                memory = proc.memory_full_info() if proportional else proc.memory_info()
+                total += getattr(memory, 'pss', memory.rss) if proportional else memory.rss
+            except (psutil.Error, KeyError):
+                continue
+        return total / (1024 * 1024) if total else None
 
     async def new_context(self, config: BrowserContextConfig | None = None) -> CustomBrowserContext:
         """Create a browser context"""
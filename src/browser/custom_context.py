@@ -1,17 +1,54 @@
 import json
 import logging
 import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
 
 from browser_use.browser.browser import Browser, IN_DOCKER
 from browser_use.browser.context import BrowserContext, BrowserContextConfig
+from browser_use.browser.views import BrowserState
 from playwright.async_api import Browser as PlaywrightBrowser
 from playwright.async_api import BrowserContext as PlaywrightBrowserContext
-from typing import Optional
+from typing import Iterator, Optional, Protocol
 from browser_use.browser.context import BrowserContextState
 
+from src.utils.performance_monitor import (
+    PHASE_DOM_EXTRACTION,
+    PHASE_POST_ACTION_WAIT,
+    PHASE_SCREENSHOT,
+    phase_span,
+)
+
+from .dom_delta import DomDelta, DomDeltaTracker
+from .resource_blocking import ResourceBlocker, ResourceBlockingSettings
+
 logger = logging.getLogger(__name__)
 
 
+class ScreenshotPolicy(Protocol):
+    """Decides per state whether get_state should capture a screenshot"""
+
+    def should_capture(self, state: BrowserState) -> bool: ...
+
+    def record_capture(self, screenshot: Optional[str], seconds: float) -> None: ...
+
+
+# Task-local so the UI's live-view screenshots are never affected by an agent's policy
+_screenshot_policy: ContextVar[Optional[ScreenshotPolicy]] = ContextVar("screenshot_policy", default=None)
+_defer_screenshot: ContextVar[bool] = ContextVar("defer_screenshot", default=False)
+
+
+@contextmanager
+def use_screenshot_policy(policy: Optional[ScreenshotPolicy]) -> Iterator[None]:
+    """Apply a screenshot policy to get_state calls made inside this block (None keeps the default)"""
+    token = _screenshot_policy.set(policy)
+    try:
+        yield
+    finally:
+        _screenshot_policy.reset(token)
+
+
 class CustomBrowserContext(BrowserContext):
     def __init__(
             self,
@@ -20,3 +57,87 @@ class CustomBrowserContext(BrowserContext):
             state: Optional[BrowserContextState] = None,
     ):
         super(CustomBrowserContext, self).__init__(browser=browser, config=config, state=state)
+        # Structural diff of interactive elements against the last full state sent to the LLM
+        self.dom_delta_tracker = DomDeltaTracker()
+        self.last_dom_delta: Optional[DomDelta] = None
+        # Renderer crashes in this context; other contexts in the same browser process are unaffected
+        self.crashed_pages = 0
+        self.resource_blocker: Optional[ResourceBlocker] = None
+        self.http_cache = getattr(browser, "http_cache", None)
+
+    async def _create_context(self, browser: PlaywrightBrowser) -> PlaywrightBrowserContext:
+        context = await super()._create_context(browser)
+        for page in context.pages:
+            page.on("crash", self._on_page_crash)
+        context.on("page", lambda page: page.on("crash", self._on_page_crash))
+        # Routes run last-registered first: blocking is decided before the cache is consulted
+        if self.http_cache is not None:
+            await self.http_cache.attach(context)
+        if self.resource_blocker is not None:
+            await self.resource_blocker.attach(context)
+        return context
+
+    async def configure_resource_blocking(self, settings: Optional[ResourceBlockingSettings]) -> None:
+        """Install a request-blocking policy for this context; None or the "full" preset removes it"""
+        old = self.resource_blocker
+        self.resource_blocker = ResourceBlocker(settings) if settings and settings.is_active() else None
+        if self.resource_blocker is not None and self.http_cache is None:
+            # Any Playwright route turns off the browser HTTP cache for the whole context
+            logger.info("Resource blocking disables the browser HTTP cache for this context; "
+                        "enable the shared HTTP cache to keep repeat visits cached")
+        if self.session is not None:
+            if old is not None:
+                await old.detach(self.session.context)
+            if self.resource_blocker is not None:
+                await self.resource_blocker.attach(self.session.context)
+
+    def set_vision(self, enabled: bool) -> None:
+        """Let visual resources through the blocking policy for agents that send a screenshot every step"""
+        if self.resource_blocker is not None:
+            self.resource_blocker.vision = enabled
+
+    async def prepare_for_screenshot(self) -> None:
+        """Reload the visual resources blocked on the current page so the screenshot renders correctly"""
+        if self.resource_blocker is None:
+            return
+        page = await self.get_current_page()
+        await self.resource_blocker.restore_visual_resources(page)
+
+    def _on_page_crash(self, page) -> None:
+        self.crashed_pages += 1
+        logger.error(f"💥 Page crashed in browser context {self.context_id}: {page.url}")
+
+    async def _wait_for_page_and_frames_load(self, *args, **kwargs):
+        with phase_span(PHASE_POST_ACTION_WAIT):
+            return await super()._wait_for_page_and_frames_load(*args, **kwargs)
+
+    async def take_screenshot(self, *args, **kwargs) -> Optional[str]:
+        if _defer_screenshot.get():
+            return None
+        with phase_span(PHASE_SCREENSHOT):
+            return await super().take_screenshot(*args, **kwargs)
+
+    async def get_state(self, *args, **kwargs) -> BrowserState:
+        # Page-load wait and screenshot are recorded as nested spans, the remainder is DOM extraction
+        policy = _screenshot_policy.get()
+        if policy is None and self.resource_blocker is not None and self.resource_blocker.vision:
+            # Pages loaded before vision was enabled (e.g. initial actions) may still miss images
+            await self.prepare_for_screenshot()
+        with phase_span(PHASE_DOM_EXTRACTION):
+            # With a policy the capture is deferred until the DOM is known, so skipped steps cost nothing
+            token = _defer_screenshot.set(policy is not None)
+            try:
+                state = await super().get_state(*args, **kwargs)
+            finally:
+                _defer_screenshot.reset(token)
+        if policy is not None and state.screenshot is None and policy.should_capture(state):
+            await self.prepare_for_screenshot()
+            start = time.time()
+            state.screenshot = await self.take_screenshot()
+            policy.record_capture(state.screenshot, time.time() - start)
+        try:
+            self.last_dom_delta = self.dom_delta_tracker.diff(state)
+        except Exception as e:
+            logger.debug(f"Failed to compute DOM delta: {e}")
+            self.last_dom_delta = None
+        return state
@@ -0,0 +1,136 @@
+"""
+DOM 增量编码模块
+计算相邻步骤之间可交互元素列表的结构差异，变化较小时只把差异发送给 LLM
+"""
+
+import hashlib
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DELTA_ATTRIBUTES = ("id", "name", "type", "value", "placeholder", "aria-label", "role", "href", "title", "alt")
+MAX_ELEMENT_TEXT = 80
+
+
+@dataclass(frozen=True)
+class ElementSnapshot:
+    """元素快照：以 xpath 作为结构身份，签名用于判断内容是否变化"""
+    index: int
+    xpath: str
+    tag_name: str
+    text: str
+    attributes: Tuple[Tuple[str, str], ...]
+
+    @property
+    def signature(self) -> Tuple:
+        return self.tag_name, self.text, self.attributes
+
+    def to_line(self) -> str:
+        attrs = "".join(f' {k}="{v}"' for k, v in self.attributes)
+        return f"[{self.index}]<{self.tag_name}{attrs}>{self.text} />"
+
+
+@dataclass
+class DomDelta:
+    """相对基线的差异：新增、删除与变化（内容或索引变化）的元素"""
+    url: str
+    baseline_url: str
+    total_elements: int
+    added: List[ElementSnapshot] = field(default_factory=list)
+    removed: List[ElementSnapshot] = field(default_factory=list)
+    changed: List[Tuple[ElementSnapshot, ElementSnapshot]] = field(default_factory=list)  # (基线, 当前)
+
+    @property
+    def size(self) -> int:
+        return len(self.added) + len(self.removed) + len(self.changed)
+
+    def is_small(self, max_ratio: float, max_elements: int) -> bool:
+        """差异足够小且页面未跳转时才发送增量"""
+        if self.url != self.baseline_url:
+            return False
+        return self.size <= max_elements and self.size <= max_ratio * max(self.total_elements, 1)
+
+    def to_text(self) -> str:
+        lines = [f"[DOM 增量] 相对于上方 DOM 基线的变化（共 {self.total_elements} 个元素）："]
+        if not self.size:
+            lines.append("无变化，所有元素及索引与基线相同。")
+            return "\n".join(lines)
+        if self.added:
+            lines.append("新增元素:")
+            lines += [snapshot.to_line() for snapshot in self.added]
+        if self.changed:
+            lines.append("变化元素（当前索引/内容）:")
+            lines += [
+                f"{current.to_line()}  (基线索引 {baseline.index})" if baseline.index != current.index
+                else current.to_line()
+                for baseline, current in self.changed
+            ]
+        if self.removed:
+            lines.append("已删除元素（这些基线索引已失效）: " + ", ".join(f"[{s.index}]" for s in self.removed))
+        lines.append("未列出的元素与基线相同，索引不变。")
+        return "\n".join(lines)
+
+
+def snapshot_elements(selector_map: Dict[int, object]) -> Dict[str, ElementSnapshot]:
+    """把 selector_map（highlight_index -> DOMElementNode）转为以 xpath 为键的快照"""
+    snapshots: Dict[str, ElementSnapshot] = {}
+    for index, node in selector_map.items():
+        attributes = getattr(node, "attributes", {}) or {}
+        try:
+            text = node.get_all_text_till_next_clickable_element()
+        except Exception:
+            text = ""
+        text = " ".join(text.split())[:MAX_ELEMENT_TEXT]
+        xpath = getattr(node, "xpath", "") or f"#index-{index}"
+        snapshots[xpath] = ElementSnapshot(
+            index=index,
+            xpath=xpath,
+            tag_name=getattr(node, "tag_name", "") or "",
+            text=text,
+            attributes=tuple((k, str(attributes[k])[:MAX_ELEMENT_TEXT]) for k in DELTA_ATTRIBUTES if k in attributes),
+        )
+    return snapshots
+
+
+class DomDeltaTracker:
+    """维护 DOM 基线并计算当前状态相对基线的差异"""
+
+    def __init__(self):
+        self.baseline: Optional[Dict[str, ElementSnapshot]] = None
+        self.baseline_url: str = ""
+
+    def reset(self) -> None:
+        self.baseline = None
+        self.baseline_url = ""
+
+    def set_baseline(self, state) -> None:
+        self.baseline = snapshot_elements(state.selector_map or {})
+        self.baseline_url = state.url or ""
+
+    def diff(self, state) -> Optional[DomDelta]:
+        """计算当前状态相对基线的差异；没有基线时返回 None"""
+        if self.baseline is None:
+            return None
+        current = snapshot_elements(state.selector_map or {})
+        delta = DomDelta(url=state.url or "", baseline_url=self.baseline_url, total_elements=len(current))
+        for xpath, snapshot in current.items():
+            baseline_snapshot = self.baseline.get(xpath)
+            if baseline_snapshot is None:
+                delta.added.append(snapshot)
+            elif baseline_snapshot.signature != snapshot.signature or baseline_snapshot.index != snapshot.index:
+                delta.changed.append((baseline_snapshot, snapshot))
+        delta.removed = [s for xpath, s in self.baseline.items() if xpath not in current]
+        delta.added.sort(key=lambda s: s.index)
+        delta.changed.sort(key=lambda pair: pair[1].index)
+        delta.removed.sort(key=lambda s: s.index)
+        return delta
+
+
+def dom_fingerprint(selector_map: Dict[int, object]) -> str:
+    """可交互元素的结构指纹：元素集合与内容相同则指纹相同，与索引分配无关"""
+    signatures = sorted(
+        (snapshot.xpath,) + snapshot.signature for snapshot in snapshot_elements(selector_map or {}).values()
+    )
+    return hashlib.sha1(repr(signatures).encode("utf-8")).hexdigest()
@@ -0,0 +1,311 @@
+"""
+共享 HTTP 磁盘缓存
+Playwright 新建的上下文都是无痕上下文，Chromium 的 HTTP 缓存只在内存中且不跨上下文（--disk-cache-dir 对其无效），
+因此在上下文层面拦截 GET 请求，把可公开缓存的响应（脚本、样式、图片、字体、显式可缓存的文档）按 URL 存到磁盘，
+同一浏览器的所有上下文共享；条目新鲜时直接返回，过期时带 If-None-Match / If-Modified-Since 重新验证。
+
+上下文隔离：带 Set-Cookie、Cache-Control private/no-store、或带 cookie/认证请求且未声明 public 的响应不缓存，
+Vary 除 Accept-Encoding 外的响应也不缓存，cookie 与存储仍属于各自的上下文。
+默认每个浏览器使用 cache_dir 下的临时目录，浏览器关闭时删除；warm=True 时直接使用 cache_dir，跨运行保留。
+缓存按 LRU 控制在 max_bytes 以内
+"""
+
+import asyncio
+import email.utils
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from playwright.async_api import BrowserContext as PlaywrightBrowserContext
+from playwright.async_api import Request, Route
+
+logger = logging.getLogger(__name__)
+
+# 从 Playwright 取回的响应体已解压，这些头不能原样返回给浏览器
+_BODY_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive"}
+_DROPPED_HEADERS = _BODY_HEADERS | {"set-cookie"}
+_STATIC_TYPES = {"script", "stylesheet", "image", "font"}
+
+
+@dataclass
+class HttpCacheSettings:
+    """HTTP 磁盘缓存配置"""
+    cache_dir: str = "./tmp/http_cache"
+    max_bytes: int = 256 * 1024 * 1024
+    max_entry_bytes: int = 10 * 1024 * 1024
+    warm: bool = False  # 跨运行保留缓存（研究 agent 反复访问相同的 CDN 与搜索页）
+    cache_documents: bool = True  # 缓存显式声明可缓存（max-age/Expires）的文档
+    heuristic_max_ttl: float = 24 * 3600.0  # 只有 Last-Modified 的静态资源按 10% 启发式新鲜期，上限该秒数
+
+
+@dataclass
+class HttpCacheStats:
+    """HTTP 缓存统计"""
+    hits: int = 0
+    revalidated: int = 0  # 304，复用缓存内容
+    misses: int = 0
+    stored: int = 0
+    uncacheable: int = 0
+    evictions: int = 0
+    bytes_served: int = 0
+
+    def summary(self) -> str:
+        lookups = self.hits + self.revalidated + self.misses
+        hit_rate = (self.hits + self.revalidated) / lookups if lookups else 0.0
+        return (
+            f"命中 {self.hits}, 重新验证 {self.revalidated}, 未命中 {self.misses} (命中率 {hit_rate:.0%}), "
+            f"写入 {self.stored}, 不可缓存 {self.uncacheable}, 淘汰 {self.evictions}, "
+            f"从缓存返回 {self.bytes_served / 1024:.0f} KB"
+        )
+
+
+def _parse_cache_control(value: str) -> Dict[str, Optional[str]]:
+    directives = {}
+    for part in value.split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"') or None
+    return directives
+
+
+def _http_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def freshness_lifetime(headers: Dict[str, str], resource_type: str, settings: HttpCacheSettings) -> Optional[float]:
+    """响应的新鲜期（秒），不可缓存时返回 None；no-cache 返回 0，表示每次使用前都要重新验证"""
+    cache_control = _parse_cache_control(headers.get("cache-control", ""))
+    if "no-store" in cache_control or "private" in cache_control:
+        return None
+    if "no-cache" in cache_control:
+        return 0.0
+    for directive in ("s-maxage", "max-age"):
+        if cache_control.get(directive):
+            try:
+                return max(float(cache_control[directive]), 0.0)
+            except ValueError:
+                return None
+    expires = _http_date(headers.get("expires"))
+    if expires is not None:
+        date = _http_date(headers.get("date")) or time.time()
+        return max(expires - date, 0.0)
+    last_modified = _http_date(headers.get("last-modified"))
+    if last_modified is not None and resource_type in _STATIC_TYPES:
+        date = _http_date(headers.get("date")) or time.time()
+        return min(max(date - last_modified, 0.0) * 0.1, settings.heuristic_max_ttl)
+    return None
+
+
+class HttpDiskCache:
+    """每个条目一个文件：第一行是 JSON 元数据，其后是响应体"""
+
+    def __init__(self, settings: HttpCacheSettings, directory: Optional[str] = None, ephemeral: bool = False):
+        self.settings = settings
+        self.directory = directory or settings.cache_dir
+        self.ephemeral = ephemeral
+        self.stats = HttpCacheStats()
+        self._lock = threading.Lock()
+        self._index: "OrderedDict[str, int]" = OrderedDict()  # key -> 文件大小，按最近使用排序
+        self._total = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self) -> None:
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".entry"):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, name[:-len(".entry")], stat.st_size))
+        for _, key, size in sorted(files):
+            self._index[key] = size
+            self._total += size
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.entry")
+
+    @staticmethod
+    def cache_key(url: str) -> str:
+        return hashlib.sha256(url.split("#", 1)[0].encode("utf-8")).hexdigest()
+
+    def _read(self, key: str, with_body: bool) -> Optional[Tuple[Dict[str, Any], Optional[bytes]]]:
+        try:
+            with open(self._path(key), "rb") as f:
+                meta = json.loads(f.readline())
+                body = f.read() if with_body else None
+        except (OSError, ValueError):
+            with self._lock:
+                self._drop(key)
+            return None
+        with self._lock:
+            if key in self._index:
+                self._index.move_to_end(key)
+        return meta, body
+
+    def _write(self, key: str, meta: Dict[str, Any], body: bytes, new_entry: bool = True) -> None:
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(json.dumps(meta, ensure_ascii=False).encode("utf-8") + b"\n")
+            f.write(body)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._total -= self._index.pop(key, 0)
+            self._index[key] = size
+            self._total += size
+            if new_entry:
+                self.stats.stored += 1
+            while self._total > self.settings.max_bytes and len(self._index) > 1:
+                oldest = next(iter(self._index))
+                self._drop(oldest)
+                self.stats.evictions += 1
+
+    def _drop(self, key: str) -> None:
+        self._total -= self._index.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _touch(self, key: str, meta: Dict[str, Any]) -> None:
+        """304 后只更新元数据中的新鲜期"""
+        loaded = self._read(key, with_body=True)
+        if loaded is not None:
+            self._write(key, meta, loaded[1] or b"", new_entry=False)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._total
+
+    async def attach(self, context: PlaywrightBrowserContext) -> None:
+        await context.route("**/*", self._handle_route)
+
+    def _is_candidate(self, request: Request) -> bool:
+        if request.method != "GET" or not request.url.startswith(("http://", "https://")):
+            return False
+        if request.resource_type in _STATIC_TYPES:
+            return True
+        return self.settings.cache_documents and request.resource_type == "document"
+
+    async def _handle_route(self, route: Route, request: Request) -> None:
+        if not self._is_candidate(request):
+            return await route.fallback()
+        request_headers = await request.all_headers()
+        if "range" in request_headers:
+            return await route.fallback()
+        key = self.cache_key(request.url)
+        cached = await asyncio.to_thread(self._read, key, True) if key in self._index else None
+        if cached is not None and cached[0]["fresh_until"] > time.time():
+            meta, body = cached
+            self.stats.hits += 1
+            self.stats.bytes_served += len(body)
+            return await route.fulfill(status=meta["status"], headers=meta["headers"], body=body)
+
+        fetch_headers = dict(request_headers)
+        if cached is not None:
+            if cached[0].get("etag"):
+                fetch_headers["if-none-match"] = cached[0]["etag"]
+            if cached[0].get("last_modified"):
+                fetch_headers["if-modified-since"] = cached[0]["last_modified"]
+        try:
+            # 不跟随重定向，由浏览器处理 3xx，页面 URL 与相对链接保持正确
+            response = await route.fetch(headers=fetch_headers, max_redirects=0)
+        except Exception as e:
+            logger.debug(f"HTTP 缓存代取失败，交给浏览器直接请求: {request.url} ({e})")
+            return await route.fallback()
+
+        if cached is not None and response.status == 304:
+            meta, body = cached
+            lifetime = freshness_lifetime({**meta["headers"], **response.headers}, request.resource_type, self.settings)
+            meta["fresh_until"] = time.time() + (lifetime or 0.0)
+            await asyncio.to_thread(self._touch, key, meta)
+            self.stats.revalidated += 1
+            self.stats.bytes_served += len(body)
+            return await route.fulfill(status=meta["status"], headers=meta["headers"], body=body)
+
+        self.stats.misses += 1
+        body = await response.body()
+        meta = self._cacheable_meta(request, request_headers, response.status, response.headers, len(body))
+        if meta is None:
+            self.stats.uncacheable += 1
+        else:
+            try:
+                await asyncio.to_thread(self._write, key, meta, body)
+            except OSError as e:
+                logger.debug(f"写入 HTTP 缓存失败: {e}")
+        await route.fulfill(
+            response=response,
+            headers={name: value for name, value in response.headers.items() if name.lower() not in _BODY_HEADERS},
+            body=body,
+        )
+
+    def _cacheable_meta(
+            self, request: Request, request_headers: Dict[str, str], status: int, headers: Dict[str, str], size: int
+    ) -> Optional[Dict[str, Any]]:
+        if status != 200 or size > self.settings.max_entry_bytes or "set-cookie" in headers:
+            return None
+        vary = {part.strip().lower() for part in headers.get("vary", "").split(",") if part.strip()}
+        if vary - {"accept-encoding"}:
+            return None
+        cache_control = _parse_cache_control(headers.get("cache-control", ""))
+        credentialed = "cookie" in request_headers or "authorization" in request_headers
+        if credentialed and "public" not in cache_control:
+            return None
+        lifetime = freshness_lifetime(headers, request.resource_type, self.settings)
+        if lifetime is None:
+            return None
+        etag, last_modified = headers.get("etag"), headers.get("last-modified")
+        if lifetime == 0 and not (etag or last_modified):
+            return None
+        if request.resource_type == "document" and lifetime == 0:
+            return None
+        return {
+            "url": request.url,
+            "status": status,
+            "headers": {name: value for name, value in headers.items() if name.lower() not in _DROPPED_HEADERS},
+            "stored_at": time.time(),
+            "fresh_until": time.time() + lifetime,
+            "etag": etag,
+            "last_modified": last_modified,
+        }
+
+    def close(self) -> None:
+        """临时缓存随浏览器关闭删除，warm 缓存保留"""
+        logger.info(f"🗄️ HTTP 缓存: {self.stats.summary()}")
+        if self.ephemeral:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+_warm_caches: Dict[str, HttpDiskCache] = {}
+_warm_caches_lock = threading.Lock()
+
+
+def open_http_cache(settings: HttpCacheSettings) -> HttpDiskCache:
+    """warm 模式返回进程内按目录共享的缓存，否则在 cache_dir 下为本次浏览器新建临时缓存"""
+    if settings.warm:
+        directory = os.path.abspath(settings.cache_dir)
+        with _warm_caches_lock:
+            cache = _warm_caches.get(directory)
+            if cache is None:
+                cache = _warm_caches[directory] = HttpDiskCache(settings, directory)
+            return cache
+    os.makedirs(settings.cache_dir, exist_ok=True)
+    directory = tempfile.mkdtemp(prefix="run-", dir=settings.cache_dir)
+    return HttpDiskCache(settings, directory, ephemeral=True)
@@ -0,0 +1,265 @@
+"""
+资源拦截模块
+按资源类型、URL 模式或是否第三方拦截上下文中的请求，减少只依赖 DOM 的 agent 下载的图片、字体、视频与跟踪脚本，
+加快页面加载与 networkidle 等待。预设: "full"（不拦截）、"no-media"、"text-only"。
+视觉步骤需要的图片、字体与样式表在视觉模式下放行；自适应视觉在截图前重新请求当前页面被拦截的视觉资源。
+
+代价：Playwright 在上下文注册任何路由后都会对所有请求启用拦截并关闭浏览器的 HTTP 缓存
+（Chromium 下为 Fetch.enable + Network.setCacheDisabled，与路由的 URL 模式无关），
+同一上下文中重复访问的脚本、样式表也会重新下载。按类型或第三方拦截必须看到每个请求，因此只在这两种情况下
+注册 "**/*"；只配置 URL 模式时只为这些模式注册路由，其余请求不经过 Python 处理。
+需要重复访问时应同时开启共享 HTTP 磁盘缓存（http_cache），放行的请求由其路由返回缓存内容；
+tests/test_browser.py 的 test_resource_blocking 测量了三种组合下重复访问的耗时
+"""
+
+import logging
+import re
+import weakref
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from playwright.async_api import BrowserContext as PlaywrightBrowserContext
+from playwright.async_api import Frame, Page, Request, Response, Route
+
+from .storage_state_cache import site_of
+
+logger = logging.getLogger(__name__)
+
+PRESET_FULL = "full"
+PRESET_NO_MEDIA = "no-media"
+PRESET_TEXT_ONLY = "text-only"
+
+# 截图需要这些资源才能正确渲染
+VISUAL_RESOURCE_TYPES = frozenset({"image", "font", "stylesheet"})
+# 第三方拦截不影响页面正常运行所需的文档、脚本与样式表
+THIRD_PARTY_ESSENTIAL_TYPES = frozenset({"document", "script", "stylesheet"})
+
+TRACKER_PATTERNS = (
+    "*://*.google-analytics.com/*",
+    "*://*.googletagmanager.com/*",
+    "*://*.doubleclick.net/*",
+    "*://*.googlesyndication.com/*",
+    "*://*.facebook.net/*",
+    "*://*.hotjar.com/*",
+    "*://*.segment.io/*",
+    "*://*.mixpanel.com/*",
+    "*://*.scorecardresearch.com/*",
+    "*://hm.baidu.com/*",
+)
+
+# (拦截的资源类型, 是否拦截第三方, URL 模式)
+PRESETS: Dict[str, Tuple[FrozenSet[str], bool, Tuple[str, ...]]] = {
+    PRESET_FULL: (frozenset(), False, ()),
+    PRESET_NO_MEDIA: (frozenset({"image", "media"}), False, ()),
+    PRESET_TEXT_ONLY: (frozenset({"image", "media", "font", "texttrack"}), True, TRACKER_PATTERNS),
+}
+
+# 还没有观察到同类响应时，估算节省字节所用的平均大小
+DEFAULT_RESOURCE_BYTES = {
+    "image": 40 * 1024,
+    "media": 500 * 1024,
+    "font": 40 * 1024,
+    "stylesheet": 20 * 1024,
+    "script": 60 * 1024,
+}
+DEFAULT_OTHER_BYTES = 4 * 1024
+
+# 重新请求被拦截的样式表与加载失败的图片，等待完成或超时
+RESTORE_VISUAL_JS = """
+async (timeout) => {
+    const pending = [];
+    const wait = (el) => new Promise((resolve) => {
+        el.addEventListener('load', resolve, { once: true });
+        el.addEventListener('error', resolve, { once: true });
+    });
+    for (const link of document.querySelectorAll('link[rel~="stylesheet"]')) {
+        if (link.sheet) continue;
+        const clone = link.cloneNode();
+        pending.push(wait(clone));
+        link.replaceWith(clone);
+    }
+    for (const img of document.images) {
+        if (!img.complete || img.naturalWidth > 0 || !img.currentSrc) continue;
+        pending.push(wait(img));
+        if (img.srcset) img.srcset = img.srcset;
+        const src = img.src;
+        img.src = '';
+        img.src = src;
+    }
+    await Promise.race([Promise.all(pending), new Promise((resolve) => setTimeout(resolve, timeout))]);
+    if (document.fonts) await Promise.race([document.fonts.ready, new Promise((resolve) => setTimeout(resolve, timeout))]);
+    return pending.length;
+}
+"""
+
+
+def compile_url_patterns(patterns: Tuple[str, ...]) -> "re.Pattern[str]":
+    """把 URL 通配模式（* 匹配任意字符，? 匹配单个字符）编译为一个正则；只用 JS 也支持的语法，可直接交给 Playwright 路由"""
+    parts = []
+    for pattern in patterns:
+        parts.append("".join(".*" if c == "*" else "." if c == "?" else re.escape(c) for c in pattern))
+    return re.compile("^(?:" + "|".join(parts) + ")$")
+
+
+@dataclass
+class ResourceBlockingSettings:
+    """资源拦截配置；显式设置的字段覆盖预设"""
+    preset: str = PRESET_FULL
+    block_types: Optional[List[str]] = None  # Playwright resource_type，如 image、media、font
+    block_patterns: Optional[List[str]] = None  # URL 通配模式，如 "*://*.example-ads.com/*"
+    block_third_party: Optional[bool] = None  # 拦截第三方的非必要请求（文档、脚本、样式表除外）
+    restore_timeout_ms: int = 3000  # 视觉步骤前等待被拦截资源重新加载的上限
+    # 注意：启用任何拦截都会关闭该上下文的浏览器 HTTP 缓存，重复访问较多时配合 HttpCacheSettings 使用
+
+    def resolve(self) -> Tuple[FrozenSet[str], bool, Tuple[str, ...]]:
+        if self.preset not in PRESETS:
+            raise ValueError(f"Unknown resource blocking preset: {self.preset}")
+        types, third_party, patterns = PRESETS[self.preset]
+        if self.block_types is not None:
+            types = frozenset(self.block_types)
+        if self.block_third_party is not None:
+            third_party = self.block_third_party
+        if self.block_patterns is not None:
+            patterns = tuple(self.block_patterns)
+        return types, third_party, patterns
+
+    def is_active(self) -> bool:
+        types, third_party, patterns = self.resolve()
+        return bool(types or third_party or patterns)
+
+
+@dataclass
+class ResourceBlockingStats:
+    """拦截统计；节省字节按已放行的同类响应平均大小估算"""
+    requests: int = 0
+    blocked: int = 0
+    bytes_saved: int = 0
+    blocked_by_reason: Dict[str, int] = field(default_factory=dict)
+    visual_restores: int = 0  # 视觉步骤前重新加载视觉资源的次数
+
+    def summary(self) -> str:
+        reasons = ", ".join(f"{reason} {count}" for reason, count in self.blocked_by_reason.items()) or "无"
+        return (
+            f"请求 {self.requests} 个, 拦截 {self.blocked} 个 ({reasons}), "
+            f"节省约 {self.bytes_saved / 1024:.0f} KB, 视觉资源恢复 {self.visual_restores} 次"
+        )
+
+
+class ResourceBlocker:
+    """
+    挂在 Playwright 上下文上的请求拦截器。vision=True 时放行全部视觉资源（每步都发送截图的 agent）；
+    否则只对调用过 restore_visual_resources 的页面的当前文档放行，主框架导航后重新拦截
+    """
+
+    def __init__(self, settings: ResourceBlockingSettings):
+        self.settings = settings
+        self.stats = ResourceBlockingStats()
+        self.vision = False
+        self.block_types, self.block_third_party, patterns = settings.resolve()
+        self._pattern = compile_url_patterns(patterns) if patterns else None
+        self._sizes: Dict[str, Tuple[int, int]] = {}  # resource_type -> (总字节, 响应数)
+        self._visual_blocked_pages: "weakref.WeakSet[Page]" = weakref.WeakSet()
+        self._visual_pages: "weakref.WeakSet[Page]" = weakref.WeakSet()
+
+    def block_reason(self, url: str, resource_type: str, document_url: Optional[str] = None) -> Optional[str]:
+        """返回拦截原因（资源类型、"pattern" 或 "third_party"），放行时返回 None"""
+        if self._pattern is not None and self._pattern.match(url):
+            return "pattern"
+        if resource_type in self.block_types:
+            return resource_type
+        if self.block_third_party and resource_type not in THIRD_PARTY_ESSENTIAL_TYPES and document_url:
+            host = urlparse(url).hostname
+            document_host = urlparse(document_url).hostname
+            if host and document_host and site_of(host) != site_of(document_host):
+                return "third_party"
+        return None
+
+    def estimated_bytes(self, resource_type: str) -> int:
+        total, count = self._sizes.get(resource_type, (0, 0))
+        if count:
+            return total // count
+        return DEFAULT_RESOURCE_BYTES.get(resource_type, DEFAULT_OTHER_BYTES)
+
+    @property
+    def route_url(self):
+        """注册路由用的 URL 匹配：按类型或第三方拦截需要检查所有请求，只有 URL 模式时只路由匹配的请求"""
+        if self.block_types or self.block_third_party or self._pattern is None:
+            return "**/*"
+        return self._pattern
+
+    async def attach(self, context: PlaywrightBrowserContext) -> None:
+        await context.route(self.route_url, self._handle_route)
+        context.on("response", self._on_response)
+        context.on("page", self._watch_page)
+        for page in context.pages:
+            self._watch_page(page)
+
+    async def detach(self, context: PlaywrightBrowserContext) -> None:
+        await context.unroute(self.route_url, self._handle_route)
+        context.remove_listener("response", self._on_response)
+        context.remove_listener("page", self._watch_page)
+        for page in context.pages:
+            page.remove_listener("framenavigated", self._on_frame_navigated)
+
+    def _watch_page(self, page: Page) -> None:
+        page.on("framenavigated", self._on_frame_navigated)
+
+    def _on_frame_navigated(self, frame: Frame) -> None:
+        # 视觉资源的放行只对截图前恢复过的那个文档有效
+        if frame.parent_frame is None:
+            self._visual_pages.discard(frame.page)
+            self._visual_blocked_pages.discard(frame.page)
+
+    async def _handle_route(self, route: Route, request: Request) -> None:
+        # 放行的请求交给先注册的路由处理（例如共享 HTTP 缓存）
+        self.stats.requests += 1
+        resource_type = request.resource_type
+        page, document_url = None, None
+        try:
+            frame = request.frame
+            page = frame.page
+            # 主框架导航本身从不拦截
+            if request.is_navigation_request() and frame.parent_frame is None:
+                return await route.fallback()
+            document_url = frame.url
+        except Exception:
+            # Service worker 发出的请求没有所属框架
+            pass
+        reason = self.block_reason(request.url, resource_type, document_url)
+        if reason is not None and resource_type in VISUAL_RESOURCE_TYPES and reason != "pattern":
+            if self.vision or (page is not None and page in self._visual_pages):
+                reason = None
+            elif page is not None:
+                self._visual_blocked_pages.add(page)
+        if reason is None:
+            return await route.fallback()
+        self.stats.blocked += 1
+        self.stats.blocked_by_reason[reason] = self.stats.blocked_by_reason.get(reason, 0) + 1
+        self.stats.bytes_saved += self.estimated_bytes(resource_type)
+        await route.abort("blockedbyclient")
+
+    def _on_response(self, response: Response) -> None:
+        try:
+            length = int(response.headers.get("content-length", 0))
+        except ValueError:
+            return
+        if length > 0:
+            resource_type = response.request.resource_type
+            total, count = self._sizes.get(resource_type, (0, 0))
+            self._sizes[resource_type] = (total + length, count + 1)
+
+    async def restore_visual_resources(self, page: Page) -> int:
+        """放行该页面当前文档的视觉资源并重新请求此前被拦截的部分，返回重新加载的元素数"""
+        self._visual_pages.add(page)
+        if page not in self._visual_blocked_pages:
+            return 0
+        self._visual_blocked_pages.discard(page)
+        try:
+            reloaded = await page.evaluate(RESTORE_VISUAL_JS, self.settings.restore_timeout_ms)
+        except Exception as e:
+            logger.debug(f"恢复视觉资源失败: {e}")
+            return 0
+        self.stats.visual_restores += 1
+        logger.debug(f"🖼️ 截图前重新加载了 {reloaded} 个被拦截的视觉资源")
+        return reloaded
@@ -0,0 +1,161 @@
+"""
+实时浏览器画面
+用 CDP Page.startScreencast 的帧流代替定时 take_screenshot：Chrome 只在画面变化时推送 JPEG 帧，
+确认（screencastFrameAck）推迟到下一帧允许的时间，从源头限制帧率；
+只保留一个最新帧槽位，消费慢的客户端会丢弃中间帧而不是排队。CDP 不可用时退回限速的截图轮询
+"""
+
+import asyncio
+import hashlib
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Set
+
+from browser_use.browser.context import BrowserContext
+from playwright.async_api import CDPSession, Page
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ScreencastSettings:
+    """实时画面配置"""
+    fps: float = 5.0  # 推送给界面的最大帧率
+    quality: int = 60  # JPEG 质量 (0-100)
+    max_width: int = 1280
+    max_height: int = 1100
+
+
+@dataclass
+class ScreencastStats:
+    """实时画面统计"""
+    frames_received: int = 0
+    frames_delivered: int = 0
+    frames_unchanged: int = 0  # 与上一帧完全相同，未推送
+    frames_dropped: int = 0  # 客户端来不及取走，被更新的帧覆盖
+    bytes_delivered: int = 0
+    fallback_screenshots: int = 0
+
+    def summary(self) -> str:
+        return (
+            f"收到 {self.frames_received} 帧, 推送 {self.frames_delivered} 帧 "
+            f"({self.bytes_delivered / 1024:.0f} KB), 未变化 {self.frames_unchanged}, 丢弃 {self.frames_dropped}, "
+            f"截图回退 {self.fallback_screenshots}"
+        )
+
+
+class LiveScreencast:
+    """跟随上下文当前页面的帧流；切换标签页或页面关闭后自动重新挂接"""
+
+    def __init__(self, context: BrowserContext, settings: Optional[ScreencastSettings] = None):
+        self.context = context
+        self.settings = settings or ScreencastSettings()
+        self.stats = ScreencastStats()
+        self._page: Optional[Page] = None
+        self._session: Optional[CDPSession] = None
+        self._frame: Optional[str] = None  # 还没有被取走的最新帧（base64 JPEG）
+        self._frame_digest: Optional[bytes] = None
+        self._next_ack_at = 0.0
+        self._last_delivery = 0.0
+        self._fallback = False
+        self._ack_tasks: Set[asyncio.Task] = set()
+
+    @property
+    def interval(self) -> float:
+        return 1.0 / max(self.settings.fps, 0.1)
+
+    async def _attach(self, page: Page) -> None:
+        await self._detach()
+        session = await page.context.new_cdp_session(page)
+        session.on("Page.screencastFrame", lambda params: self._on_frame(session, params))
+        # 先登记会话，startScreencast 返回前就可能收到第一帧
+        self._page, self._session = page, session
+        await session.send("Page.startScreencast", {
+            "format": "jpeg",
+            "quality": self.settings.quality,
+            "maxWidth": self.settings.max_width,
+            "maxHeight": self.settings.max_height,
+        })
+
+    async def _detach(self) -> None:
+        session, self._session, self._page = self._session, None, None
+        if session is None:
+            return
+        try:
+            await session.send("Page.stopScreencast")
+            await session.detach()
+        except Exception as e:
+            logger.debug(f"停止 screencast 失败（页面可能已关闭）: {e}")
+
+    def _on_frame(self, session: CDPSession, params: Dict[str, Any]) -> None:
+        self.stats.frames_received += 1
+        now = time.monotonic()
+        delay = max(0.0, self._next_ack_at - now)
+        self._next_ack_at = now + delay + self.interval
+        task = asyncio.ensure_future(self._ack(session, params["sessionId"], delay))
+        self._ack_tasks.add(task)
+        task.add_done_callback(self._ack_tasks.discard)
+
+        data = params.get("data")
+        if not data or session is not self._session:
+            return
+        digest = hashlib.sha1(data.encode("ascii")).digest()
+        if digest == self._frame_digest:
+            self.stats.frames_unchanged += 1
+            return
+        self._frame_digest = digest
+        if self._frame is not None:
+            self.stats.frames_dropped += 1
+        self._frame = data
+
+    async def _ack(self, session: CDPSession, session_id: int, delay: float) -> None:
+        if delay:
+            await asyncio.sleep(delay)
+        try:
+            await session.send("Page.screencastFrameAck", {"sessionId": session_id})
+        except Exception:
+            pass
+
+    async def _fallback_frame(self) -> Optional[str]:
+        screenshot = await self.context.take_screenshot()
+        if not screenshot:
+            return None
+        self.stats.fallback_screenshots += 1
+        digest = hashlib.sha1(screenshot.encode("ascii")).digest()
+        if digest == self._frame_digest:
+            self.stats.frames_unchanged += 1
+            return None
+        self._frame_digest = digest
+        return screenshot
+
+    async def latest_frame(self) -> Optional[str]:
+        """返回上次取帧以来的最新画面（base64），没有新画面或未到帧间隔时返回 None"""
+        now = time.monotonic()
+        if now - self._last_delivery < self.interval:
+            return None
+        if self._fallback:
+            frame = await self._fallback_frame()
+        else:
+            page = await self.context.get_current_page()
+            if page is not self._page or self._session is None or page.is_closed():
+                try:
+                    await self._attach(page)
+                except Exception as e:
+                    logger.warning(f"⚠️ CDP screencast 不可用，改为截图轮询: {e}")
+                    await self._detach()
+                    self._fallback = True
+                    return None
+            frame, self._frame = self._frame, None
+        if frame is None:
+            return None
+        self._last_delivery = now
+        self.stats.frames_delivered += 1
+        self.stats.bytes_delivered += len(frame)
+        return frame
+
+    async def stop(self) -> None:
+        await self._detach()
+        for task in list(self._ack_tasks):
+            task.cancel()
+        logger.info(f"📺 实时画面: {self.stats.summary()}")
@@ -0,0 +1,126 @@
+"""
+截图聚焦裁剪模块
+把已捕获的视口截图裁剪到最近交互或新出现元素的包围盒（加边距），可附带整页低分辨率缩略图
+"""
+
+import base64
+import io
+import logging
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Box = Tuple[float, float, float, float]  # (left, top, right, bottom)，CSS 像素
+
+
+@dataclass
+class ScreenshotCropSettings:
+    """截图裁剪配置"""
+    enabled: bool = True
+    margin: int = 48  # 包围盒四周的边距（CSS 像素）
+    min_width: int = 320  # 裁剪区域的最小尺寸，避免只剩一个按钮
+    min_height: int = 200
+    max_area_ratio: float = 0.6  # 裁剪区域超过视口该比例时直接发送完整截图
+    thumbnail: bool = True  # 同时附带整页缩略图
+    thumbnail_width: int = 320
+
+
+@dataclass
+class CroppedScreenshot:
+    crop_b64: str
+    box: Box  # 裁剪区域在视口中的位置（CSS 像素）
+    thumbnail_b64: Optional[str]
+    full_pixels: int
+    sent_pixels: int
+
+
+def element_box(node) -> Optional[Box]:
+    """从 DOMElementNode 的视口坐标取包围盒；buildDomTree 未提供坐标时返回 None"""
+    coordinates = getattr(node, "viewport_coordinates", None)
+    if coordinates is None:
+        return None
+    try:
+        left, top = coordinates.top_left.x, coordinates.top_left.y
+        return left, top, left + coordinates.width, top + coordinates.height
+    except AttributeError:
+        return None
+
+
+def union_boxes(boxes: Iterable[Box]) -> Optional[Box]:
+    boxes = list(boxes)
+    if not boxes:
+        return None
+    return (
+        min(b[0] for b in boxes),
+        min(b[1] for b in boxes),
+        max(b[2] for b in boxes),
+        max(b[3] for b in boxes),
+    )
+
+
+def _expand_box(box: Box, settings: ScreenshotCropSettings, viewport: Tuple[int, int]) -> Box:
+    """加边距并扩展到最小尺寸，最后限制在视口内"""
+    vw, vh = viewport
+    left, top = box[0] - settings.margin, box[1] - settings.margin
+    right, bottom = box[2] + settings.margin, box[3] + settings.margin
+    if right - left < settings.min_width:
+        pad = (settings.min_width - (right - left)) / 2
+        left, right = left - pad, right + pad
+    if bottom - top < settings.min_height:
+        pad = (settings.min_height - (bottom - top)) / 2
+        top, bottom = top - pad, bottom + pad
+    return max(0.0, left), max(0.0, top), min(float(vw), right), min(float(vh), bottom)
+
+
+def _encode_png(image) -> str:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+def crop_screenshot(
+        screenshot_b64: str,
+        boxes: List[Box],
+        viewport_width: int,
+        settings: Optional[ScreenshotCropSettings] = None,
+) -> Optional[CroppedScreenshot]:
+    """
+    在已有截图上裁剪目标元素区域，不需要再次访问浏览器。
+    返回: 裁剪结果；没有可见目标或区域过大时返回 None（应发送完整截图）
+    """
+    from PIL import Image
+
+    settings = settings or ScreenshotCropSettings()
+    target = union_boxes(boxes)
+    if target is None:
+        return None
+
+    image = Image.open(io.BytesIO(base64.b64decode(screenshot_b64)))
+    # 截图按设备像素输出，坐标为 CSS 像素
+    scale = image.width / viewport_width if viewport_width else 1.0
+    viewport = (int(image.width / scale), int(image.height / scale))
+    left, top, right, bottom = _expand_box(target, settings, viewport)
+    if right <= left or bottom <= top:
+        return None  # 目标不在视口内
+    if (right - left) * (bottom - top) > settings.max_area_ratio * viewport[0] * viewport[1]:
+        return None
+
+    pixel_box = (int(left * scale), int(top * scale), int(right * scale), int(bottom * scale))
+    crop = image.crop(pixel_box)
+    sent_pixels = crop.width * crop.height
+
+    thumbnail_b64 = None
+    if settings.thumbnail and image.width > settings.thumbnail_width:
+        thumbnail = image.convert("RGB")
+        thumbnail.thumbnail((settings.thumbnail_width, settings.thumbnail_width * image.height // image.width))
+        thumbnail_b64 = _encode_png(thumbnail)
+        sent_pixels += thumbnail.width * thumbnail.height
+
+    return CroppedScreenshot(
+        crop_b64=_encode_png(crop),
+        box=(left, top, right, bottom),
+        thumbnail_b64=thumbnail_b64,
+        full_pixels=image.width * image.height,
+        sent_pixels=sent_pixels,
+    )
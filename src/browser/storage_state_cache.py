@@ -0,0 +1,358 @@
+"""
+按站点缓存的浏览器存储状态（cookies + localStorage）
+运行成功后从上下文读取 storage_state，按可注册域名（站点）拆分，每个站点一个 Fernet 加密文件保存在 cache_dir；
+新建上下文时注入未过期的条目，agent 不必每次重新登录。
+
+过期检测：条目保存超过 max_age、或 cookie 全部过期且没有 localStorage 时丢弃；
+运行结束时若服务端删除了注入的 cookie（登出、会话失效），失败的运行会使该站点失效，成功的运行会覆盖它。
+shared=True 为并行 agent 的只读为主模式：解密后的条目按文件修改时间缓存在内存中共用，
+捕获时只写入缺失、失效或超过 refresh_after 的条目，避免并行子 agent 反复覆盖同一站点。
+
+密钥取自环境变量 STORAGE_STATE_KEY（Fernet.generate_key() 生成），未设置时在 cache_dir/.key 生成本地密钥（权限 600）
+"""
+
+import asyncio
+import hashlib
+import ipaddress
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+from browser_use.browser.context import BrowserContext
+from cryptography.fernet import Fernet, InvalidToken
+
+logger = logging.getLogger(__name__)
+
+KEY_ENV = "STORAGE_STATE_KEY"
+ENTRY_VERSION = 1
+
+# 常见的二级公共后缀（如 co.uk、com.cn），足以区分站点，不引入完整的公共后缀列表
+_SECOND_LEVEL_LABELS = {"ac", "co", "com", "edu", "gov", "net", "org"}
+
+
+@dataclass
+class StorageStateCacheSettings:
+    """存储状态缓存配置"""
+    cache_dir: str = "./tmp/storage_state"
+    max_age: float = 7 * 24 * 3600.0  # 条目保存超过该秒数视为过期
+    shared: bool = False  # 并行 agent 的只读为主模式
+    refresh_after: float = 12 * 3600.0  # 共享模式下条目保存超过该秒数才允许被新的捕获覆盖
+    sites: Optional[List[str]] = None  # 只缓存这些站点，None 表示全部
+    key_path: Optional[str] = None  # 未设置 STORAGE_STATE_KEY 时的密钥文件，默认 cache_dir/.key
+
+
+@dataclass
+class StorageStateCacheStats:
+    """存储状态缓存统计"""
+    injected_sites: int = 0
+    injected_cookies: int = 0
+    captured_sites: int = 0
+    unchanged: int = 0  # 捕获时与已保存条目相同，未重写
+    skipped_fresh: int = 0  # 共享模式下条目仍新鲜，未覆盖
+    expired: int = 0
+    invalidated: int = 0
+    read_errors: int = 0  # 解密或解析失败（密钥更换、文件损坏）
+
+    def summary(self) -> str:
+        return (
+            f"注入 {self.injected_sites} 个站点 ({self.injected_cookies} cookies), 保存 {self.captured_sites} 个站点, "
+            f"未变化 {self.unchanged}, 新鲜跳过 {self.skipped_fresh}, 过期 {self.expired}, "
+            f"失效 {self.invalidated}, 读取失败 {self.read_errors}"
+        )
+
+
+def site_of(host: str) -> str:
+    """cookie 域名或主机名对应的站点，如 .mail.example.co.uk -> example.co.uk，IP 与 localhost 原样返回"""
+    host = (host or "").strip(".").lower()
+    try:
+        ipaddress.ip_address(host)
+        return host
+    except ValueError:
+        pass
+    labels = host.split(".")
+    if len(labels) > 2 and len(labels[-1]) == 2 and labels[-2] in _SECOND_LEVEL_LABELS:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+def split_storage_state(storage_state: Dict[str, Any]) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+    """把 Playwright storage_state 按站点拆分为 {site: {"cookies": [...], "origins": [...]}}"""
+    sites: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+    for cookie in storage_state.get("cookies", []):
+        site = site_of(cookie.get("domain", ""))
+        sites.setdefault(site, {"cookies": [], "origins": []})["cookies"].append(cookie)
+    for origin in storage_state.get("origins", []):
+        if not origin.get("localStorage"):
+            continue
+        site = site_of(urlparse(origin.get("origin", "")).hostname or "")
+        sites.setdefault(site, {"cookies": [], "origins": []})["origins"].append(origin)
+    return sites
+
+
+def _cookie_expired(cookie: Dict[str, Any], now: float) -> bool:
+    # Playwright 中会话 cookie 的 expires 为 -1
+    expires = cookie.get("expires", -1)
+    return expires is not None and expires > 0 and expires <= now
+
+
+def _cookie_sort_key(cookie: Dict[str, Any]) -> Tuple[str, str, str]:
+    return cookie.get("domain", ""), cookie.get("path", ""), cookie.get("name", "")
+
+
+def default_key_path() -> str:
+    return os.path.join(StorageStateCacheSettings.cache_dir, ".key")
+
+
+def load_storage_key(path: str) -> bytes:
+    """返回 STORAGE_STATE_KEY；未设置时读取 path 处的本地密钥，不存在则生成（权限 600）。断点文件的存储状态共用该密钥"""
+    key = os.getenv(KEY_ENV)
+    if key:
+        return key.encode()
+    try:
+        with open(path, "rb") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    key = Fernet.generate_key()
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # 另一个进程刚生成了密钥
+        with open(path, "rb") as f:
+            return f.read().strip()
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    logger.warning(f"⚠️ 未设置 {KEY_ENV}，已生成本地存储状态密钥: {path}")
+    return key
+
+
+class StorageStateCache:
+    """每个站点一个加密文件，写入时原子替换；同一上下文注入了哪些 cookie 记录在内存中用于失效检测"""
+
+    def __init__(self, settings: Optional[StorageStateCacheSettings] = None):
+        self.settings = settings or StorageStateCacheSettings()
+        self.stats = StorageStateCacheStats()
+        self._lock = threading.Lock()
+        self._fernet = Fernet(self._load_key())
+        # 共享模式的内存快照: path -> (mtime, entry)
+        self._snapshot: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        # 上下文 -> {site: 注入的 cookie 名}
+        self._injected: "weakref.WeakKeyDictionary[BrowserContext, Dict[str, Set[str]]]" = weakref.WeakKeyDictionary()
+
+    def _load_key(self) -> bytes:
+        return load_storage_key(self.settings.key_path or os.path.join(self.settings.cache_dir, ".key"))
+
+    def _path(self, site: str) -> str:
+        # 文件名不暴露域名
+        return os.path.join(self.settings.cache_dir, hashlib.sha256(site.encode("utf-8")).hexdigest()[:32] + ".bin")
+
+    def _allowed(self, site: str) -> bool:
+        return self.settings.sites is None or site in self.settings.sites
+
+    def _remove(self, path: str) -> None:
+        self._snapshot.pop(path, None)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _read(self, path: str) -> Optional[Dict[str, Any]]:
+        try:
+            mtime = os.path.getmtime(path)
+        except FileNotFoundError:
+            self._snapshot.pop(path, None)
+            return None
+        cached = self._snapshot.get(path)
+        if self.settings.shared and cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            with open(path, "rb") as f:
+                entry = json.loads(self._fernet.decrypt(f.read()))
+            if entry.get("version") != ENTRY_VERSION or self._path(entry.get("site", "")) != path:
+                raise ValueError("unexpected entry")
+        except (OSError, InvalidToken, ValueError, AttributeError) as e:
+            self.stats.read_errors += 1
+            logger.warning(f"⚠️ 读取存储状态缓存失败，已删除: {os.path.basename(path)} ({type(e).__name__})")
+            self._remove(path)
+            return None
+        if self.settings.shared:
+            self._snapshot[path] = (mtime, entry)
+        return entry
+
+    def _write(self, site: str, cookies: List[Dict[str, Any]], origins: List[Dict[str, Any]]) -> None:
+        path = self._path(site)
+        entry = {"version": ENTRY_VERSION, "site": site, "saved_at": time.time(), "cookies": cookies, "origins": origins}
+        os.makedirs(self.settings.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(self._fernet.encrypt(json.dumps(entry, ensure_ascii=False).encode("utf-8")))
+        os.replace(tmp_path, path)
+        if self.settings.shared:
+            self._snapshot[path] = (os.path.getmtime(path), entry)
+
+    def _valid_entry(self, entry: Dict[str, Any], now: float) -> Optional[Dict[str, Any]]:
+        """去掉已过期的 cookie，整个条目过期时返回 None"""
+        if now - entry.get("saved_at", 0) > self.settings.max_age:
+            return None
+        cookies = [cookie for cookie in entry.get("cookies", []) if not _cookie_expired(cookie, now)]
+        if not cookies and not entry.get("origins"):
+            return None
+        return {**entry, "cookies": cookies}
+
+    def load(self) -> List[Dict[str, Any]]:
+        """读取全部未过期的条目，过期条目从磁盘删除"""
+        if not os.path.isdir(self.settings.cache_dir):
+            return []
+        now = time.time()
+        entries = []
+        with self._lock:
+            for name in sorted(os.listdir(self.settings.cache_dir)):
+                if not name.endswith(".bin"):
+                    continue
+                path = os.path.join(self.settings.cache_dir, name)
+                entry = self._read(path)
+                if entry is None or not self._allowed(entry["site"]):
+                    continue
+                valid = self._valid_entry(entry, now)
+                if valid is None:
+                    self.stats.expired += 1
+                    logger.info(f"⌛ 站点 {entry['site']} 的存储状态已过期")
+                    self._remove(path)
+                    continue
+                entries.append(valid)
+        return entries
+
+    def invalidate(self, site: str) -> bool:
+        """删除站点的缓存条目，返回是否存在"""
+        site = site_of(site)
+        path = self._path(site)
+        with self._lock:
+            existed = os.path.exists(path)
+            self._remove(path)
+            if existed:
+                self.stats.invalidated += 1
+        if existed:
+            logger.info(f"🗑️ 已使站点 {site} 的存储状态失效")
+        return existed
+
+    def clear(self) -> None:
+        for entry in self.load():
+            self.invalidate(entry["site"])
+
+    async def inject(self, context: BrowserContext) -> int:
+        """把缓存的 cookies 与 localStorage 注入上下文，应在打开任何页面之前调用，返回注入的站点数"""
+        entries = await asyncio.to_thread(self.load)
+        if not entries:
+            return 0
+        session = await context.get_session()
+        cookies = [cookie for entry in entries for cookie in entry["cookies"]]
+        if cookies:
+            await session.context.add_cookies(cookies)
+        local_storage = {
+            origin["origin"]: {item["name"]: item["value"] for item in origin.get("localStorage", [])}
+            for entry in entries
+            for origin in entry.get("origins", [])
+        }
+        if local_storage:
+            # 每个标签页只在首次加载该源时写入一次，避免覆盖页面之后的修改
+            await session.context.add_init_script(
+                '(() => { const data = ' + json.dumps(local_storage) + ';'
+                ' const items = data[location.origin];'
+                " if (!items || sessionStorage.getItem('__storage_state_injected')) return;"
+                ' for (const [k, v] of Object.entries(items)) localStorage.setItem(k, v);'
+                " sessionStorage.setItem('__storage_state_injected', '1'); })()"
+            )
+        self._injected[context] = {entry["site"]: {cookie["name"] for cookie in entry["cookies"]} for entry in entries}
+        with self._lock:
+            self.stats.injected_sites += len(entries)
+            self.stats.injected_cookies += len(cookies)
+        logger.info(f"🍪 已注入 {len(entries)} 个站点的存储状态 ({len(cookies)} cookies)")
+        return len(entries)
+
+    async def capture(self, context: BrowserContext, success: bool = True) -> int:
+        """
+        运行结束、关闭上下文之前调用。成功时按站点保存存储状态；
+        失败时不保存，注入的 cookie 被服务端删除的站点视为登录失效。返回保存的站点数
+        """
+        injected = self._injected.pop(context, {})
+        try:
+            session = await context.get_session()
+            storage_state = await session.context.storage_state()
+        except Exception as e:
+            logger.debug(f"读取存储状态失败，跳过保存: {e}")
+            return 0
+        return await asyncio.to_thread(self._store, storage_state, injected, success)
+
+    def _store(self, storage_state: Dict[str, Any], injected: Dict[str, Set[str]], success: bool) -> int:
+        now = time.time()
+        by_site = split_storage_state(storage_state)
+        lost = {
+            site: names - {cookie["name"] for cookie in by_site.get(site, {}).get("cookies", [])}
+            for site, names in injected.items()
+        }
+        for site, names in lost.items():
+            # 成功的运行会用新状态覆盖，只有没有可覆盖内容时才需要删除
+            if names and (not success or site not in by_site):
+                logger.info(f"🔒 站点 {site} 的 cookie 已被清除 ({', '.join(sorted(names))})，登录状态失效")
+                self.invalidate(site)
+        if not success:
+            return 0
+
+        saved = 0
+        with self._lock:
+            for site, state in by_site.items():
+                if not site or not self._allowed(site):
+                    continue
+                cookies = sorted(
+                    (cookie for cookie in state["cookies"] if not _cookie_expired(cookie, now)), key=_cookie_sort_key
+                )
+                existing = self._read(self._path(site))
+                origins = list(state["origins"])
+                if existing is not None:
+                    # 注入的 localStorage 只在页面加载该源时写入，本次没有访问的源保留原来的值
+                    captured = {origin.get("origin") for origin in origins}
+                    origins += [origin for origin in existing.get("origins", []) if origin.get("origin") not in captured]
+                origins.sort(key=lambda origin: origin.get("origin", ""))
+                if not cookies and not origins:
+                    continue
+                if existing is not None:
+                    if existing.get("cookies") == cookies and existing.get("origins") == origins:
+                        self.stats.unchanged += 1
+                        continue
+                    fresh = now - existing.get("saved_at", 0) < self.settings.refresh_after
+                    if self.settings.shared and fresh and not lost.get(site):
+                        self.stats.skipped_fresh += 1
+                        continue
+                try:
+                    self._write(site, cookies, origins)
+                except OSError as e:
+                    logger.warning(f"⚠️ 保存站点 {site} 的存储状态失败: {e}")
+                    continue
+                saved += 1
+            self.stats.captured_sites += saved
+        if saved:
+            logger.info(f"💾 已保存 {saved} 个站点的存储状态")
+        return saved
+
+
+_caches: Dict[Tuple[str, bool], StorageStateCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_storage_state_cache(settings: Optional[StorageStateCacheSettings] = None) -> StorageStateCache:
+    """进程级共享的存储状态缓存，按 (cache_dir, shared) 区分"""
+    settings = settings or StorageStateCacheSettings()
+    key = (os.path.abspath(settings.cache_dir), settings.shared)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = StorageStateCache(settings)
+        return cache
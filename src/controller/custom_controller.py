@@ -1,7 +1,7 @@
 import pdb
 
 import pyperclip
-from typing import Optional, Type, Callable, Dict, Any, Union, Awaitable, TypeVar
+from typing import Optional, Type, Callable, Dict, Any, Union, Awaitable, TypeVar, Tuple
 from pydantic import BaseModel
 from browser_use.agent.views import ActionResult
 from browser_use.browser.context import BrowserContext
@@ -24,10 +24,16 @@ import logging
 import inspect
 import asyncio
 import os
+import time
 from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.prompts import PromptTemplate
 from browser_use.agent.views import ActionModel, ActionResult
 
-from src.utils.mcp_client import create_tool_param_model, setup_mcp_client_and_tools
+from src.agent.browser_use.adaptive_vision import REQUEST_SCREENSHOT_ACTION
+from src.agent.browser_use.tool_selection import REQUEST_TOOLS_ACTION, describe_actions
+from src.utils.content_cache import get_content_cache
+from src.utils.mcp_client import create_tool_param_model
+from src.utils.mcp_pool import get_mcp_pool
 
 from browser_use.utils import time_execution_sync
 
@@ -45,8 +51,12 @@ class CustomController(Controller):
         super().__init__(exclude_actions=exclude_actions, output_model=output_model)
         self._register_custom_actions()
         self.ask_assistant_callback = ask_assistant_callback
+        # Tool subset selector, set through set_tool_selector by BrowserUseAgent.configure_tool_selection
+        self.tool_selector = None
         self.mcp_client = None
         self.mcp_server_config = None
+        # action name -> (server name, tool name); names may themselves contain "."
+        self.mcp_tool_routes: Dict[str, Tuple[str, str]] = {}
 
     def _register_custom_actions(self):
         """Register all custom browser actions"""
@@ -70,6 +80,48 @@ class CustomController(Controller):
                 return ActionResult(extracted_content="Human cannot help you. Please try another way.",
                                     include_in_memory=True)
 
+        @self.registry.action(
+            'Extract page content to retrieve specific information from the page, e.g. all company names, a specific description, all information about, links with companies in structured format or simply links',
+        )
+        async def extract_content(
+                goal: str, should_strip_link_urls: bool, browser: BrowserContext, page_extraction_llm: BaseChatModel
+        ):
+            # Same as the browser_use default, but the HTML conversion runs in a thread pool and is cached by URL + HTML hash
+            page = await browser.get_current_page()
+            cache = get_content_cache()
+            strip = ['a', 'img'] if should_strip_link_urls else []
+            content = await cache.markdown(page.url, await page.content(), strip)
+
+            # manually append iframe text into the content so it's readable by the LLM (includes cross-origin iframes)
+            for iframe in page.frames:
+                if iframe.url != page.url and not iframe.url.startswith('data:'):
+                    content += f'\n\nIFRAME {iframe.url}:\n'
+                    content += await cache.markdown(iframe.url, await iframe.content())
+
+            model_name = getattr(page_extraction_llm, 'model_name', None) or getattr(
+                page_extraction_llm, 'model', None) or type(page_extraction_llm).__name__
+            extraction_key = cache.extraction_key(content, goal, str(model_name))
+            extracted = cache.get_extraction(extraction_key)
+            if extracted is not None:
+                msg = f'📄  Extracted from page\n: {extracted}\n'
+                logger.info(f'{msg} (cached)')
+                return ActionResult(extracted_content=msg, include_in_memory=True)
+
+            prompt = 'Your task is to extract the content of the page. You will be given a page and a goal and you should extract all relevant information around this goal from the page. If the goal is vague, summarize the page. Respond in json format. Extraction goal: {goal}, Page: {page}'
+            template = PromptTemplate(input_variables=['goal', 'page'], template=prompt)
+            try:
+                output = await page_extraction_llm.ainvoke(template.format(goal=goal, page=content))
+                if isinstance(output.content, str):
+                    cache.put_extraction(extraction_key, output.content)
+                msg = f'📄  Extracted from page\n: {output.content}\n'
+                logger.info(msg)
+                return ActionResult(extracted_content=msg, include_in_memory=True)
+            except Exception as e:
+                logger.debug(f'Error extracting content: {e}')
+                msg = f'📄  Extracted from page\n: {content}\n'
+                logger.info(msg)
+                return ActionResult(extracted_content=msg)
+
         @self.registry.action(
             'Upload file to interactive element with file path ',
         )
@@ -123,11 +175,11 @@ class CustomController(Controller):
         try:
             for action_name, params in action.model_dump(exclude_unset=True).items():
                 if params is not None:
-                    if action_name.startswith("mcp"):
+                    if action_name in self.mcp_tool_routes:
                         # this is a mcp tool
                         logger.debug(f"Invoke MCP tool: {action_name}")
-                        mcp_tool = self.registry.registry.actions.get(action_name).function
-                        result = await mcp_tool.ainvoke(params)
+                        server_name, tool_name = self.mcp_tool_routes[action_name]
+                        result = await self.mcp_client.invoke(server_name, tool_name, params)
                     else:
                         result = await self.registry.execute_action(
                             action_name,
@@ -151,11 +203,70 @@ class CustomController(Controller):
         except Exception as e:
             raise e
 
-    async def setup_mcp_client(self, mcp_server_config: Optional[Dict[str, Any]] = None):
+    def set_screenshot_requests(self, enabled: bool) -> None:
+        """
+        Register request_screenshot only for agents running the adaptive-vision policy; everyone else
+        would just pay for a no-op action in every step's schema.
+        """
+        actions = self.registry.registry.actions
+        if not enabled:
+            actions.pop(REQUEST_SCREENSHOT_ACTION, None)
+            return
+        if REQUEST_SCREENSHOT_ACTION in actions:
+            return
+
+        @self.registry.action(
+            "Request a screenshot of the current page in the next step. Use it only when the element list is not "
+            "enough to understand the page, e.g. icons without labels, canvas content, charts or visual layout."
+        )
+        async def request_screenshot():
+            msg = "A screenshot of the page will be attached to the next step."
+            return ActionResult(extracted_content=msg, include_in_memory=False)
+
+    def set_tool_selector(self, tool_selector) -> None:
+        """
+        Share the agent's ToolSelector and register request_tools only while one is configured; without
+        a selector every tool is already in the schema.
+        """
+        self.tool_selector = tool_selector
+        actions = self.registry.registry.actions
+        if tool_selector is None:
+            actions.pop(REQUEST_TOOLS_ACTION, None)
+            return
+        if REQUEST_TOOLS_ACTION in actions:
+            return
+
+        @self.registry.action(
+            "Request additional tools that are not in your current action list. Describe the capability you need "
+            "in a few keywords, e.g. 'read local file', 'query database', 'send email'. Matching tools become "
+            "available from the next step."
+        )
+        async def request_tools(query: str):
+            actions = self.registry.registry.actions
+            names = self.tool_selector.request(actions, query)
+            if not names:
+                msg = f"No additional tools match '{query}'."
+            else:
+                msg = f"These tools are available from the next step:\n{describe_actions(actions, names)}"
+            logger.info(f"🧰 request_tools('{query}'): {names}")
+            return ActionResult(extracted_content=msg, include_in_memory=True)
+
+    async def setup_mcp_client(self, mcp_server_config: Optional[Dict[str, Any]] = None, lazy: Optional[bool] = None):
+        """
+        Lease MCP servers from the process-wide pool; servers that are already running are reused.
+        When lazy is True, tools are registered from the persisted tool manifest and a server only starts on the first call to one of its tools
+        """
         self.mcp_server_config = mcp_server_config
         if self.mcp_server_config:
-            self.mcp_client = await setup_mcp_client_and_tools(self.mcp_server_config)
+            start_time = time.perf_counter()
+            self.mcp_client = await get_mcp_pool().acquire(self.mcp_server_config, lazy=lazy)
             self.register_mcp_tools()
+            if self.mcp_client:
+                deferred = self.mcp_client.deferred_servers
+                logger.info(
+                    f"🔌 MCP setup took {time.perf_counter() - start_time:.2f}s"
+                    + (f", {len(deferred)} server(s) deferred: {deferred}" if deferred else "")
+                )
 
     def register_mcp_tools(self):
         """
@@ -171,6 +282,7 @@ class CustomController(Controller):
                         function=tool,
                         param_model=create_tool_param_model(tool),
                     )
+                    self.mcp_tool_routes[tool_name] = (server_name, tool.name)
                     logger.info(f"Add mcp tool: {tool_name}")
                 logger.debug(
                     f"Registered {len(self.mcp_client.server_name_to_tools[server_name])} mcp tools for {server_name}")
@@ -178,5 +290,7 @@ class CustomController(Controller):
             logger.warning(f"MCP client not started.")
 
     async def close_mcp_client(self):
+        """Return the leased connection; the pool closes the server processes after the idle timeout"""
         if self.mcp_client:
-            await self.mcp_client.__aexit__(None, None, None)
+            await self.mcp_client.release()
+            self.mcp_client = None
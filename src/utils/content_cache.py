@@ -0,0 +1,182 @@
+"""
+页面内容提取缓存
+extract_content 的 HTML -> Markdown 转换按 (规范化 URL, HTML 哈希) 缓存，转换在线程池或进程池中执行，
+不阻塞事件循环；LLM 的提取结果按 (内容, 目标, 模型) 缓存。两类条目共用一个按字节数淘汰的 LRU，
+同一进程内的所有 agent（包括并行的深度研究子 agent）共享
+"""
+
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from src.agent.browser_use.replay import normalize_url
+
+logger = logging.getLogger(__name__)
+
+# 不影响页面内容的跟踪参数，生成缓存键前去掉
+TRACKING_PARAM_PREFIXES = ("utm_",)
+TRACKING_PARAMS = frozenset({"fbclid", "gclid", "dclid", "msclkid", "yclid", "mc_cid", "mc_eid", "_ga", "_gl", "spm"})
+
+
+@dataclass
+class ContentCacheSettings:
+    """内容提取缓存配置"""
+    enabled: bool = True
+    max_bytes: int = 64 * 1024 * 1024  # 缓存内容总字节数上限
+    executor: str = "thread"  # "thread" 或 "process"；大页面较多时进程池可避免转换占用 GIL
+    max_workers: int = 2
+
+
+@dataclass
+class ContentCacheStats:
+    """内容提取缓存统计"""
+    markdown_hits: int = 0
+    markdown_misses: int = 0
+    extraction_hits: int = 0
+    extraction_misses: int = 0
+    evictions: int = 0
+    convert_seconds: float = 0.0
+
+    def summary(self) -> str:
+        return (
+            f"页面转换命中 {self.markdown_hits}/{self.markdown_hits + self.markdown_misses}, "
+            f"LLM 提取命中 {self.extraction_hits}/{self.extraction_hits + self.extraction_misses}, "
+            f"转换耗时 {self.convert_seconds:.2f}s, 淘汰 {self.evictions} 条"
+        )
+
+
+def html_to_markdown(html: str, strip: Optional[List[str]] = None) -> str:
+    """与 browser_use 默认 extract_content 相同的转换；模块级函数以便进程池序列化"""
+    import markdownify
+
+    return markdownify.markdownify(html, strip=strip or [])
+
+
+def normalize_content_url(url: Optional[str]) -> str:
+    """在 replay.normalize_url 的基础上去掉 utm_*、fbclid 等跟踪参数，同一页面的不同来源链接共用缓存"""
+    normalized = normalize_url(url)
+    parts = urlsplit(normalized)
+    if not parts.query:
+        return normalized
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PARAM_PREFIXES)
+    ]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+
+def _hash(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8", errors="replace"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ContentExtractionCache:
+    """按字节数淘汰的 LRU；条目可能在线程池回调中写入，读写加锁"""
+
+    def __init__(self, settings: Optional[ContentCacheSettings] = None):
+        self.settings = settings or ContentCacheSettings()
+        self.stats = ContentCacheStats()
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[Executor] = None
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def _get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def _put(self, key: str, value: str) -> None:
+        size = len(value.encode("utf-8"))
+        if size > self.settings.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old.encode("utf-8"))
+            self._entries[key] = value
+            self._bytes += size
+            while self._bytes > self.settings.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.encode("utf-8"))
+                self.stats.evictions += 1
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.settings.executor == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.settings.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.settings.max_workers,
+                                                    thread_name_prefix="content-extract")
+        return self._executor
+
+    @staticmethod
+    def markdown_key(url: str, html: str, strip: Optional[List[str]] = None) -> str:
+        return "md:" + _hash(normalize_content_url(url), ",".join(sorted(strip or [])), html)
+
+    async def markdown(self, url: str, html: str, strip: Optional[List[str]] = None) -> str:
+        """返回页面的 Markdown；同一 URL 的 HTML 未变化时直接取缓存"""
+        if not self.settings.enabled:
+            return html_to_markdown(html, strip)
+        key = self.markdown_key(url, html, strip)
+        cached = self._get(key)
+        if cached is not None:
+            self.stats.markdown_hits += 1
+            return cached
+        self.stats.markdown_misses += 1
+        start_time = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        content = await loop.run_in_executor(self._get_executor(), html_to_markdown, html, strip)
+        self.stats.convert_seconds += time.perf_counter() - start_time
+        self._put(key, content)
+        return content
+
+    @staticmethod
+    def extraction_key(content: str, goal: str, model_name: str) -> str:
+        return "llm:" + _hash(model_name, goal.strip(), content)
+
+    def get_extraction(self, key: str) -> Optional[str]:
+        if not self.settings.enabled:
+            return None
+        cached = self._get(key)
+        if cached is None:
+            self.stats.extraction_misses += 1
+        else:
+            self.stats.extraction_hits += 1
+        return cached
+
+    def put_extraction(self, key: str, extracted: str) -> None:
+        if self.settings.enabled:
+            self._put(key, extracted)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_content_cache: Optional[ContentExtractionCache] = None
+
+
+def get_content_cache() -> ContentExtractionCache:
+    """进程级共享的内容提取缓存"""
+    global _content_cache
+    if _content_cache is None:
+        _content_cache = ContentExtractionCache()
+    return _content_cache
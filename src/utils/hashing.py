@@ -0,0 +1,14 @@
+"""
+稳定哈希工具
+对可 JSON 序列化的对象（工具 schema、启动配置、调用参数等）做规范化哈希，供各类缓存与连接池作为键
+"""
+
+import hashlib
+import json
+from typing import Any
+
+
+def stable_hash(obj: Any) -> str:
+    """规范化哈希：键排序、无多余空白，与字典书写顺序无关；无法序列化的值按 str() 处理"""
+    canonical = json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
@@ -1,5 +1,7 @@
 import inspect
+import json
 import logging
+import threading
 import uuid
 from datetime import date, datetime, time
 from enum import Enum
@@ -11,8 +13,66 @@ from langchain_mcp_adapters.client import MultiServerMCPClient
 from pydantic import BaseModel, Field, create_model
 from pydantic.v1 import BaseModel, Field
 
+from src.utils.hashing import stable_hash
+
 logger = logging.getLogger(__name__)
 
+# Process-wide param model cache keyed by the canonical hash of the tool schema and shared by all
+# controllers, so setup does not call create_model / build Enums again (slow, and leaks new classes)
+_param_model_cache: Dict[str, Type[BaseModel]] = {}
+_nested_type_cache: Dict[str, Any] = {}
+_cache_stats = {"hits": 0, "misses": 0}
+_cache_lock = threading.RLock()
+
+
+def get_param_model_cache_info() -> Dict[str, int]:
+    """Return statistics of the param model cache"""
+    with _cache_lock:
+        return {
+            "param_models": len(_param_model_cache),
+            "nested_types": len(_nested_type_cache),
+            "hits": _cache_stats["hits"],
+            "misses": _cache_stats["misses"],
+        }
+
+
+def clear_param_model_cache() -> None:
+    with _cache_lock:
+        _param_model_cache.clear()
+        _nested_type_cache.clear()
+        _cache_stats["hits"] = 0
+        _cache_stats["misses"] = 0
+
+
+class _SchemaContext:
+    """Context for resolving one tool schema: the root schema (for $ref) and the refs being resolved (to stop recursion)"""
+
+    def __init__(self, root: Optional[Dict[str, Any]] = None):
+        self.root = root or {}
+        self.root_key = stable_hash(self.root) if root else ""
+        self.resolving: Set[str] = set()
+
+    def lookup_ref(self, ref: str) -> Optional[Dict[str, Any]]:
+        """Resolve a local reference such as #/$defs/Foo or #/definitions/Foo"""
+        if not ref.startswith("#"):
+            return None
+        node: Any = self.root
+        for part in ref.lstrip("#").strip("/").split("/"):
+            if not part:
+                continue
+            part = part.replace("~1", "/").replace("~0", "~")
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node if isinstance(node, dict) else None
+
+    def cache_key(self, prop_details: Dict[str, Any]) -> str:
+        # A sub-schema with $ref depends on the definitions in the root schema, so the root is part of the key
+        key = stable_hash(prop_details)
+        if self.root_key and "$ref" in json.dumps(prop_details, default=str):
+            key = f"{key}:{self.root_key}"
+        return key
+
 
 async def setup_mcp_client_and_tools(mcp_server_config: Dict[str, Any]) -> Optional[MultiServerMCPClient]:
     """
@@ -44,14 +104,34 @@ async def setup_mcp_client_and_tools(mcp_server_config: Dict[str, Any]) -> Optio
 
 
 def create_tool_param_model(tool: BaseTool) -> Type[BaseModel]:
-    """Creates a Pydantic model from a LangChain tool's schema"""
+    """Creates a Pydantic model from a LangChain tool's schema, cached process-wide by schema hash"""
 
     # Get tool schema information
     json_schema = tool.args_schema
     tool_name = tool.name
 
+    if isinstance(json_schema, dict):
+        # The model class name contains the tool name, so the name is hashed too
+        key = stable_hash({"name": tool_name, "schema": json_schema})
+        with _cache_lock:
+            cached = _param_model_cache.get(key)
+            if cached is not None:
+                _cache_stats["hits"] += 1
+                return cached
+        model = _build_param_model(tool, json_schema)
+        with _cache_lock:
+            _cache_stats["misses"] += 1
+            return _param_model_cache.setdefault(key, model)
+
+    return _build_param_model(tool, json_schema)
+
+
+def _build_param_model(tool: BaseTool, json_schema: Any) -> Type[BaseModel]:
+    tool_name = tool.name
+
     # If the tool already has a schema defined, convert it to a new param_model
     if json_schema is not None:
+        context = _SchemaContext(json_schema)
 
         # Create new parameter model
         params = {}
@@ -62,7 +142,7 @@ def create_tool_param_model(tool: BaseTool) -> Type[BaseModel]:
             required_fields: Set[str] = set(json_schema.get('required', []))
 
             for prop_name, prop_details in json_schema['properties'].items():
-                field_type = resolve_type(prop_details, f"{tool_name}_{prop_name}")
+                field_type = _resolve_type(prop_details, f"{tool_name}_{prop_name}", context)
 
                 # Check if parameter is required
                 is_required = prop_name in required_fields
@@ -131,24 +211,50 @@ def create_tool_param_model(tool: BaseTool) -> Type[BaseModel]:
     )
 
 
-def resolve_type(prop_details: Dict[str, Any], prefix: str = "") -> Any:
-    """Recursively resolves JSON schema type to Python/Pydantic type"""
+# Basic type mapping
+_TYPE_MAPPING = {
+    'string': str,
+    'integer': int,
+    'number': float,
+    'boolean': bool,
+    'array': List,
+    'object': Dict,
+    'null': type(None),
+}
 
+
+def resolve_type(prop_details: Dict[str, Any], prefix: str = "", root: Optional[Dict[str, Any]] = None) -> Any:
+    """Recursively resolves JSON schema type to Python/Pydantic type, $ref is resolved against root"""
+    return _resolve_type(prop_details, prefix, _SchemaContext(root))
+
+
+def _cached_type(prop_details: Dict[str, Any], context: _SchemaContext, build) -> Any:
+    """Dynamic Enums / nested models are cached by sub-schema hash, so identical structures share one class across tools"""
+    key = context.cache_key(prop_details)
+    with _cache_lock:
+        cached = _nested_type_cache.get(key)
+    if cached is not None:
+        return cached
+    created = build()
+    with _cache_lock:
+        return _nested_type_cache.setdefault(key, created)
+
+
+def _resolve_type(prop_details: Dict[str, Any], prefix: str, context: _SchemaContext) -> Any:
     # Handle reference types
     if '$ref' in prop_details:
-        # In a real application, reference resolution would be needed
-        return Any
-
-    # Basic type mapping
-    type_mapping = {
-        'string': str,
-        'integer': int,
-        'number': float,
-        'boolean': bool,
-        'array': List,
-        'object': Dict,
-        'null': type(None),
-    }
+        ref = prop_details['$ref']
+        target = context.lookup_ref(ref)
+        if target is None:
+            return Any
+        if ref in context.resolving:
+            # Recursive reference: the inner occurrence falls back to a plain dict
+            return Dict if target.get('type', 'object') == 'object' else Any
+        context.resolving.add(ref)
+        try:
+            return _resolve_type(target, f"{prefix}_{ref.rsplit('/', 1)[-1]}", context)
+        finally:
+            context.resolving.discard(ref)
 
     # Handle formatted strings
     if prop_details.get('type') == 'string' and 'format' in prop_details:
@@ -181,41 +287,24 @@ def resolve_type(prop_details: Dict[str, Any], prefix: str = "") -> Any:
 
         # Only create enum if we have values
         if enum_dict:
-            return Enum(f"{prefix}_Enum", enum_dict)
+            return _cached_type(prop_details, context, lambda: Enum(f"{prefix}_Enum", enum_dict))
         return str  # Fallback
 
     # Handle array types
     if prop_details.get('type') == 'array' and 'items' in prop_details:
-        item_type = resolve_type(prop_details['items'], f"{prefix}_item")
+        item_type = _resolve_type(prop_details['items'], f"{prefix}_item", context)
         return List[item_type]  # type: ignore
 
     # Handle object types with properties
     if prop_details.get('type') == 'object' and 'properties' in prop_details:
-        nested_params = {}
-        for nested_name, nested_details in prop_details['properties'].items():
-            nested_type = resolve_type(nested_details, f"{prefix}_{nested_name}")
-            # Get required field info
-            required_fields = prop_details.get('required', [])
-            is_required = nested_name in required_fields
-            default_value = nested_details.get('default', ... if is_required else None)
-            description = nested_details.get('description', '')
-
-            field_kwargs = {'default': default_value}
-            if description:
-                field_kwargs['description'] = description
-
-            nested_params[nested_name] = (nested_type, Field(**field_kwargs))
-
-        # Create nested model
-        nested_model = create_model(f"{prefix}_Model", **nested_params)
-        return nested_model
+        return _cached_type(prop_details, context, lambda: _build_object_model(prop_details, prefix, context))
 
     # Handle union types (oneOf, anyOf)
     if 'oneOf' in prop_details or 'anyOf' in prop_details:
         union_schema = prop_details.get('oneOf') or prop_details.get('anyOf')
         union_types = []
         for i, t in enumerate(union_schema):
-            union_types.append(resolve_type(t, f"{prefix}_{i}"))
+            union_types.append(_resolve_type(t, f"{prefix}_{i}", context))
 
         if union_types:
             return Union.__getitem__(tuple(union_types))  # type: ignore
@@ -223,21 +312,7 @@ def resolve_type(prop_details: Dict[str, Any], prefix: str = "") -> Any:
 
     # Handle allOf (intersection types)
     if 'allOf' in prop_details:
-        nested_params = {}
-        for i, schema_part in enumerate(prop_details['allOf']):
-            if 'properties' in schema_part:
-                for nested_name, nested_details in schema_part['properties'].items():
-                    nested_type = resolve_type(nested_details, f"{prefix}_allOf_{i}_{nested_name}")
-                    # Check if required
-                    required_fields = schema_part.get('required', [])
-                    is_required = nested_name in required_fields
-                    nested_params[nested_name] = (nested_type, ... if is_required else None)
-
-        # Create composite model
-        if nested_params:
-            composite_model = create_model(f"{prefix}_CompositeModel", **nested_params)
-            return composite_model
-        return Dict
+        return _cached_type(prop_details, context, lambda: _build_all_of_model(prop_details, prefix, context))
 
     # Default to basic types
     schema_type = prop_details.get('type', 'string')
@@ -245,10 +320,49 @@ def resolve_type(prop_details: Dict[str, Any], prefix: str = "") -> Any:
         # Handle multiple types (e.g., ["string", "null"])
         non_null_types = [t for t in schema_type if t != 'null']
         if non_null_types:
-            primary_type = type_mapping.get(non_null_types[0], Any)
+            primary_type = _TYPE_MAPPING.get(non_null_types[0], Any)
             if 'null' in schema_type:
                 return Optional[primary_type]  # type: ignore
             return primary_type
         return Any
 
-    return type_mapping.get(schema_type, Any)
+    return _TYPE_MAPPING.get(schema_type, Any)
+
+
+def _build_object_model(prop_details: Dict[str, Any], prefix: str, context: _SchemaContext) -> Any:
+    nested_params = {}
+    for nested_name, nested_details in prop_details['properties'].items():
+        nested_type = _resolve_type(nested_details, f"{prefix}_{nested_name}", context)
+        # Get required field info
+        required_fields = prop_details.get('required', [])
+        is_required = nested_name in required_fields
+        default_value = nested_details.get('default', ... if is_required else None)
+        description = nested_details.get('description', '')
+
+        field_kwargs = {'default': default_value}
+        if description:
+            field_kwargs['description'] = description
+
+        nested_params[nested_name] = (nested_type, Field(**field_kwargs))
+
+    # Create nested model
+    return create_model(f"{prefix}_Model", **nested_params)
+
+
+def _build_all_of_model(prop_details: Dict[str, Any], prefix: str, context: _SchemaContext) -> Any:
+    nested_params = {}
+    for i, schema_part in enumerate(prop_details['allOf']):
+        if '$ref' in schema_part:
+            schema_part = context.lookup_ref(schema_part['$ref']) or {}
+        if 'properties' in schema_part:
+            for nested_name, nested_details in schema_part['properties'].items():
+                nested_type = _resolve_type(nested_details, f"{prefix}_allOf_{i}_{nested_name}", context)
+                # Check if required
+                required_fields = schema_part.get('required', [])
+                is_required = nested_name in required_fields
+                nested_params[nested_name] = (nested_type, ... if is_required else None)
+
+    # Create composite model
+    if nested_params:
+        return create_model(f"{prefix}_CompositeModel", **nested_params)
+    return Dict
@@ -0,0 +1,115 @@
+"""
+MCP 工具清单缓存
+把每个服务器的工具 schema（名称、描述、输入 JSON Schema）按 (服务器名, 配置) 持久化到本地 JSON，
+延迟启动模式下据此注册工具，服务器进程直到第一次调用其工具时才启动；
+服务器每次真正启动都会刷新清单，过期的清单在后台单独启动一次服务器刷新
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from langchain.tools import BaseTool
+from langchain_core.tools import StructuredTool
+
+from src.utils.hashing import stable_hash
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+@dataclass
+class MCPManifestSettings:
+    """工具清单配置"""
+    path: str = "./tmp/mcp_manifest.json"
+    max_age: float = 24 * 3600.0  # 清单超过该秒数后在后台刷新
+    refresh_concurrency: int = 2  # 同时进行的后台刷新数
+
+
+def manifest_key(server_name: str, config: Dict[str, Any]) -> str:
+    return stable_hash({"name": server_name, "config": config})
+
+
+def tool_spec(tool: BaseTool) -> Dict[str, Any]:
+    schema = tool.args_schema
+    if schema is not None and not isinstance(schema, dict):
+        schema = schema.model_json_schema()
+    return {"name": tool.name, "description": tool.description or "", "input_schema": schema or {}}
+
+
+async def _not_started(**kwargs):
+    raise RuntimeError("MCP server is not started yet, call the tool through MCPLease.invoke")
+
+
+def tools_from_specs(specs: List[Dict[str, Any]]) -> List[BaseTool]:
+    """由清单构造只含 schema 的工具对象，用于注册动作与 bind_tools，调用需经过连接池"""
+    return [
+        StructuredTool(
+            name=spec["name"],
+            description=spec.get("description", ""),
+            args_schema=spec.get("input_schema") or {"type": "object", "properties": {}},
+            coroutine=_not_started,
+        )
+        for spec in specs
+    ]
+
+
+class MCPToolManifest:
+    """单个 JSON 文件保存全部服务器的工具清单，写入时原子替换"""
+
+    def __init__(self, settings: Optional[MCPManifestSettings] = None):
+        self.settings = settings or MCPManifestSettings()
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            entries = {}
+            try:
+                with open(self.settings.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == MANIFEST_VERSION:
+                    entries = data.get("servers", {})
+            except FileNotFoundError:
+                pass
+            except (OSError, json.JSONDecodeError, AttributeError) as e:
+                logger.warning(f"⚠️ 读取 MCP 工具清单失败，将重新生成: {e}")
+            self._entries = entries
+        return self._entries
+
+    def _save(self) -> None:
+        directory = os.path.dirname(self.settings.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.settings.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "servers": self._entries}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.settings.path)
+
+    def get(self, server_name: str, config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """返回 {"name", "updated_at", "tools": [spec, ...]}，没有清单时返回 None"""
+        with self._lock:
+            return self._load().get(manifest_key(server_name, config))
+
+    def is_stale(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry.get("updated_at", 0) > self.settings.max_age
+
+    def update(self, server_name: str, config: Dict[str, Any], tools: List[BaseTool]) -> bool:
+        """用服务器当前的工具刷新清单，返回工具 schema 是否有变化"""
+        specs = [tool_spec(tool) for tool in tools]
+        key = manifest_key(server_name, config)
+        with self._lock:
+            entries = self._load()
+            old = entries.get(key)
+            changed = old is None or old.get("tools") != specs
+            entries[key] = {"name": server_name, "updated_at": time.time(), "tools": specs}
+            try:
+                self._save()
+            except OSError as e:
+                logger.warning(f"⚠️ 保存 MCP 工具清单失败: {e}")
+        return changed
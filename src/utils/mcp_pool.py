@@ -0,0 +1,502 @@
+"""
+进程级 MCP 连接池
+按服务器配置复用 MCP 会话：任务、controller 与 agent 之间共享同一个服务器连接，
+租用前做健康检查，连接失效时自动重连，长时间无人租用的服务器会被关闭。
+工具调用按服务器限制并发并带超时，可在服务器配置中用 tool_timeout / max_concurrency 单独设置：
+
+    {"mcpServers": {"search": {"command": "...", "args": [...], "tool_timeout": 30, "max_concurrency": 2}}}
+
+标记为幂等的工具（idempotent_tools / cache_ttl，见 mcp_result_cache）的结果会被缓存。
+延迟启动模式（lazy）下，已有工具清单（见 mcp_manifest）的服务器只注册清单中的工具，第一次调用时才启动进程
+"""
+
+import asyncio
+import logging
+import time
+import weakref
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from langchain.tools import BaseTool
+from langchain_core.tools import StructuredTool
+from langchain_mcp_adapters.client import MultiServerMCPClient
+
+from src.utils.hashing import stable_hash
+from src.utils.mcp_manifest import MCPManifestSettings, MCPToolManifest, tools_from_specs
+from src.utils.mcp_result_cache import MCPResultCache, MCPResultCacheSettings
+
+logger = logging.getLogger(__name__)
+
+# 连接池自己的服务器配置项，传给 MultiServerMCPClient 前需要去掉
+POOL_OPTION_KEYS = ("tool_timeout", "max_concurrency", "idempotent_tools", "cache_ttl")
+
+
+class MCPToolTimeoutError(TimeoutError):
+    """MCP 工具调用超时"""
+
+
+@dataclass
+class MCPPoolSettings:
+    """MCP 连接池配置"""
+    idle_timeout: float = 600.0  # 无租用超过该秒数后关闭服务器进程
+    health_check_interval: float = 30.0  # 距上次确认健康超过该秒数时，租用前先 ping
+    ping_timeout: float = 5.0
+    reap_interval: float = 30.0  # 空闲检查周期
+    shutdown_timeout: float = 10.0
+    tool_timeout: float = 120.0  # 服务器未单独配置 tool_timeout 时的默认超时（秒），0 表示不限制
+    max_concurrency: int = 4  # 服务器未单独配置 max_concurrency 时的默认并发上限
+    result_cache: MCPResultCacheSettings = field(default_factory=MCPResultCacheSettings)
+    lazy_start: bool = False  # acquire 未指定 lazy 时的默认值
+    manifest: MCPManifestSettings = field(default_factory=MCPManifestSettings)
+
+
+@dataclass
+class MCPPoolStats:
+    """连接池统计"""
+    connects: int = 0
+    reuses: int = 0
+    reconnects: int = 0
+    failed_connects: int = 0
+    idle_shutdowns: int = 0
+    tool_calls: int = 0
+    tool_timeouts: int = 0
+    lazy_deferred: int = 0  # 按清单注册、未启动的服务器数
+    lazy_started: int = 0  # 其中因工具调用而启动的服务器数
+    manifest_refreshes: int = 0
+
+    def summary(self) -> str:
+        return (
+            f"启动 {self.connects} 次, 复用 {self.reuses} 次, 重连 {self.reconnects} 次, "
+            f"启动失败 {self.failed_connects} 次, 空闲关闭 {self.idle_shutdowns} 次, "
+            f"工具调用 {self.tool_calls} 次 (超时 {self.tool_timeouts} 次), "
+            f"延迟启动 {self.lazy_started}/{self.lazy_deferred}, 清单后台刷新 {self.manifest_refreshes} 次"
+        )
+
+
+class _ServerConnection:
+    """
+    单个 MCP 服务器的长连接。
+    MultiServerMCPClient 在独立的后台任务中进入和退出，stdio 子进程与 anyio 作用域始终归属同一任务，
+    不会因为由其他任务关闭而报错
+    """
+
+    def __init__(self, name: str, config: Dict[str, Any], settings: MCPPoolSettings):
+        self.name = name
+        self.raw_config = config  # 含连接池配置项，重新租用时使用
+        self.config = {key: value for key, value in config.items() if key not in POOL_OPTION_KEYS}
+        self.tool_timeout = float(config.get("tool_timeout", settings.tool_timeout))
+        self.semaphore = asyncio.Semaphore(max(int(config.get("max_concurrency", settings.max_concurrency)), 1))
+        # idempotent_tools 为工具名列表，或 true 表示该服务器的全部工具都是只读的
+        self.idempotent_tools = config.get("idempotent_tools") or []
+        self.cache_ttl = float(config.get("cache_ttl", settings.result_cache.default_ttl))
+        self.client: Optional[MultiServerMCPClient] = None
+        self.tools: List[BaseTool] = []
+        # 最近一次已知的工具 schema（来自清单或上次连接），服务器未启动时用于注册
+        self.known_tools: List[BaseTool] = []
+        self.deferred = False
+        self.leases = 0
+        self.last_used = time.monotonic()
+        self.last_healthy = 0.0
+        self.ever_connected = False
+        # 被空闲回收或随连接池关闭后置位，之后不能再在该对象上重连，否则子进程脱离连接池管理
+        self.closed = False
+        self.lock = asyncio.Lock()
+        self._runner: Optional[asyncio.Task] = None
+        self._ready: Optional[asyncio.Event] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._error: Optional[BaseException] = None
+
+    @property
+    def connected(self) -> bool:
+        return self.client is not None and self._runner is not None and not self._runner.done()
+
+    @property
+    def schema_tools(self) -> List[BaseTool]:
+        return self.tools if self.connected else self.known_tools
+
+    async def _run(self) -> None:
+        client = MultiServerMCPClient({self.name: self.config})
+        try:
+            async with client:
+                self.client = client
+                self.tools = list(client.server_name_to_tools.get(self.name, []))
+                self._ready.set()
+                await self._stop.wait()
+        except Exception as e:
+            self._error = e
+            logger.warning(f"⚠️ MCP 服务器 {self.name} 连接中断: {e}")
+        finally:
+            self.client = None
+            self.tools = []
+            self._ready.set()
+
+    async def connect(self) -> None:
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._error = None
+        self._runner = asyncio.create_task(self._run(), name=f"mcp-server-{self.name}")
+        await self._ready.wait()
+        if self.client is None:
+            raise RuntimeError(f"MCP server {self.name} failed to start: {self._error}")
+        self.ever_connected = True
+        self.known_tools = list(self.tools)
+        self.last_healthy = time.monotonic()
+        logger.info(f"🔌 MCP 服务器 {self.name} 已启动, {len(self.tools)} 个工具")
+
+    async def close(self, timeout: float) -> None:
+        runner, self._runner = self._runner, None
+        if runner is None:
+            return
+        self._stop.set()
+        try:
+            await asyncio.wait_for(runner, timeout=timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            runner.cancel()
+        except Exception as e:
+            logger.debug(f"关闭 MCP 服务器 {self.name} 出错: {e}")
+
+    def is_idempotent(self, tool_name: str) -> bool:
+        if self.idempotent_tools is True:
+            return True
+        return isinstance(self.idempotent_tools, list) and tool_name in self.idempotent_tools
+
+    async def is_healthy(self, timeout: float) -> bool:
+        if not self.connected:
+            return False
+        session = self.client.sessions.get(self.name)
+        if session is None:
+            return False
+        try:
+            await asyncio.wait_for(session.send_ping(), timeout=timeout)
+        except Exception as e:
+            logger.warning(f"⚠️ MCP 服务器 {self.name} 健康检查失败: {e}")
+            return False
+        self.last_healthy = time.monotonic()
+        return True
+
+
+class MCPLease:
+    """
+    一次租用的服务器集合，接口与 MultiServerMCPClient 的常用部分保持一致
+    （server_name_to_tools / get_tools / __aexit__），可直接替换原来的 mcp_client
+    """
+
+    def __init__(self, pool: "MCPConnectionPool", connections: List[_ServerConnection]):
+        self._pool = pool
+        self._connections = {conn.name: conn for conn in connections}
+        self._released = False
+
+    @property
+    def server_name_to_tools(self) -> Dict[str, List[BaseTool]]:
+        """工具 schema；延迟启动且尚未启动的服务器返回清单中的工具"""
+        return {name: conn.schema_tools for name, conn in self._connections.items()}
+
+    def get_tools(self) -> List[BaseTool]:
+        return [tool for conn in self._connections.values() for tool in conn.schema_tools]
+
+    @property
+    def deferred_servers(self) -> List[str]:
+        return [name for name, conn in self._connections.items() if not conn.connected]
+
+    @property
+    def result_cache_stats(self):
+        return self._pool.result_cache.stats
+
+    def get_tool(self, server_name: str, tool_name: str) -> Optional[BaseTool]:
+        conn = self._connections.get(server_name)
+        if conn is None:
+            return None
+        return next((tool for tool in conn.tools if tool.name == tool_name), None)
+
+    def get_managed_tools(self) -> List[BaseTool]:
+        """
+        返回包装后的工具：调用经过 invoke，带并发限制、超时与自动重连。
+        包装工具不绑定具体会话，服务器重连后仍然有效，可直接交给 llm.bind_tools
+        """
+        managed = []
+        for conn in self._connections.values():
+            for tool in conn.schema_tools:
+                async def call(_server=conn.name, _tool=tool.name, **kwargs):
+                    return await self.invoke(_server, _tool, kwargs)
+
+                managed.append(StructuredTool(
+                    name=tool.name,
+                    description=tool.description,
+                    args_schema=tool.args_schema,
+                    coroutine=call,
+                ))
+        return managed
+
+    async def _invoke_once(self, conn: _ServerConnection, tool_name: str, params: Dict[str, Any]) -> Any:
+        tool = self.get_tool(conn.name, tool_name)
+        if tool is None:
+            raise ValueError(f"MCP tool {conn.name}.{tool_name} is not available")
+        async with conn.semaphore:
+            conn.last_used = time.monotonic()
+            self._pool.stats.tool_calls += 1
+            try:
+                if conn.tool_timeout > 0:
+                    # 超时会取消正在等待的请求，不会占住并发名额
+                    result = await asyncio.wait_for(tool.ainvoke(params), timeout=conn.tool_timeout)
+                else:
+                    result = await tool.ainvoke(params)
+            except asyncio.TimeoutError:
+                self._pool.stats.tool_timeouts += 1
+                raise MCPToolTimeoutError(
+                    f"MCP tool {conn.name}.{tool_name} timed out after {conn.tool_timeout:.0f}s"
+                ) from None
+        conn.last_healthy = time.monotonic()
+        return result
+
+    async def invoke(self, server_name: str, tool_name: str, params: Dict[str, Any]) -> Any:
+        """调用工具；幂等工具先查结果缓存"""
+        conn = self._connections.get(server_name)
+        if conn is None:
+            raise ValueError(f"MCP server {server_name} is not available")
+        cache = self._pool.result_cache
+        if cache.settings.enabled and conn.is_idempotent(tool_name):
+            return await cache.get_or_call(
+                server_name, tool_name, params, conn.cache_ttl,
+                lambda: self._invoke_with_reconnect(conn, tool_name, params),
+            )
+        return await self._invoke_with_reconnect(conn, tool_name, params)
+
+    async def _renew(self, conn: _ServerConnection) -> _ServerConnection:
+        """连接已被空闲回收（租约释放后仍在调用工具）时，从连接池重新租用同一服务器"""
+        fresh = await self._pool._lease_connection(conn.name, conn.raw_config)
+        if fresh is None:
+            raise RuntimeError(f"MCP server {conn.name} failed to start")
+        self._connections[conn.name] = fresh
+        self._pool._ensure_reaper()
+        if self._released:
+            await self._pool.release([fresh])
+        return fresh
+
+    async def _invoke_with_reconnect(self, conn: _ServerConnection, tool_name: str, params: Dict[str, Any]) -> Any:
+        """连接已失效时重连并重试一次，重连后使用新会话上的工具对象"""
+        if conn.closed:
+            conn = await self._renew(conn)
+        if not conn.connected and not await self._pool.ensure_started(conn):
+            conn = await self._renew(conn)
+        try:
+            return await self._invoke_once(conn, tool_name, params)
+        except MCPToolTimeoutError:
+            raise
+        except Exception:
+            if await conn.is_healthy(self._pool.settings.ping_timeout):
+                raise  # 工具自身报错，不是连接问题
+            if not await self._pool.reconnect(conn):
+                if not conn.closed:
+                    raise
+                conn = await self._renew(conn)
+            return await self._invoke_once(conn, tool_name, params)
+
+    async def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        await self._pool.release(list(self._connections.values()))
+
+    async def __aenter__(self) -> "MCPLease":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.release()
+
+
+class MCPConnectionPool:
+    """按 (服务器名, 配置) 复用连接的进程级连接池"""
+
+    def __init__(self, settings: Optional[MCPPoolSettings] = None):
+        self.settings = settings or MCPPoolSettings()
+        self.stats = MCPPoolStats()
+        self.result_cache = MCPResultCache(self.settings.result_cache)
+        self.manifest = MCPToolManifest(self.settings.manifest)
+        self._connections: Dict[str, _ServerConnection] = {}
+        self._reaper: Optional[asyncio.Task] = None
+        self._refresh_tasks: Dict[str, asyncio.Task] = {}
+        self._refresh_semaphore = asyncio.Semaphore(max(self.settings.manifest.refresh_concurrency, 1))
+
+    async def acquire(self, mcp_server_config: Dict[str, Any], lazy: Optional[bool] = None) -> Optional[MCPLease]:
+        """
+        租用配置中的全部服务器；启动失败的服务器会被跳过，全部失败时返回 None。
+        lazy 为 True 时，有工具清单的服务器不启动进程，第一次调用其工具时再启动
+        """
+        if not mcp_server_config:
+            logger.error("No MCP server configuration provided.")
+            return None
+        lazy = self.settings.lazy_start if lazy is None else lazy
+        servers = mcp_server_config.get("mcpServers", mcp_server_config)
+        leased = await asyncio.gather(*(
+            self._lease_connection(name, config, lazy) for name, config in servers.items()
+        ))
+        connections = [conn for conn in leased if conn is not None]
+        self._ensure_reaper()
+        if not connections:
+            return None
+        return MCPLease(self, connections)
+
+    async def _lease_connection(self, name: str, config: Dict[str, Any], lazy: bool = False) -> Optional[_ServerConnection]:
+        key = stable_hash({"name": name, "config": config})
+        while True:
+            conn = self._connections.get(key)
+            if conn is None:
+                conn = self._connections[key] = _ServerConnection(name, config, self.settings)
+            async with conn.lock:
+                if conn.closed:
+                    continue  # 等锁期间被空闲回收，重新从连接池取
+                if conn.connected and (
+                        time.monotonic() - conn.last_healthy < self.settings.health_check_interval
+                        or await conn.is_healthy(self.settings.ping_timeout)
+                ):
+                    self.stats.reuses += 1
+                    logger.debug(f"♻️ 复用 MCP 服务器连接 {name}")
+                elif lazy and self._defer(conn):
+                    logger.debug(f"💤 MCP 服务器 {name} 按清单注册 {len(conn.known_tools)} 个工具，延迟启动")
+                elif not await self._connect(conn):
+                    return None
+                conn.leases += 1
+                conn.last_used = time.monotonic()
+            return conn
+
+    def _defer(self, conn: _ServerConnection) -> bool:
+        """从清单加载工具 schema 而不启动服务器；没有清单时返回 False"""
+        if not conn.known_tools:
+            entry = self.manifest.get(conn.name, conn.config)
+            if entry is None:
+                return False
+            conn.known_tools = tools_from_specs(entry["tools"])
+            if self.manifest.is_stale(entry):
+                self._schedule_refresh(conn)
+        if not conn.deferred:
+            conn.deferred = True
+            self.stats.lazy_deferred += 1
+        return True
+
+    async def ensure_started(self, conn: _ServerConnection) -> bool:
+        """延迟启动的服务器在第一次调用工具时启动；连接已被回收时返回 False，由调用方重新租用"""
+        async with conn.lock:
+            if conn.closed:
+                return False
+            if conn.connected:
+                return True
+            start_time = time.perf_counter()
+            if not await self._connect(conn):
+                raise RuntimeError(f"MCP server {conn.name} failed to start")
+            if conn.deferred:
+                conn.deferred = False
+                self.stats.lazy_started += 1
+                logger.info(f"🚀 MCP 服务器 {conn.name} 按需启动, 耗时 {time.perf_counter() - start_time:.2f}s")
+            return True
+
+    async def _connect(self, conn: _ServerConnection) -> bool:
+        reconnect = conn.ever_connected
+        await conn.close(self.settings.shutdown_timeout)
+        try:
+            await conn.connect()
+        except Exception as e:
+            self.stats.failed_connects += 1
+            logger.error(f"❌ MCP 服务器 {conn.name} 启动失败: {e}", exc_info=True)
+            return False
+        if reconnect:
+            self.stats.reconnects += 1
+            logger.info(f"🔄 MCP 服务器 {conn.name} 已重连")
+        else:
+            self.stats.connects += 1
+        if self.manifest.update(conn.name, conn.config, conn.tools):
+            logger.info(f"📋 已更新 MCP 服务器 {conn.name} 的工具清单")
+        return True
+
+    def _schedule_refresh(self, conn: _ServerConnection) -> None:
+        key = stable_hash({"name": conn.name, "config": conn.config})
+        task = self._refresh_tasks.get(key)
+        if task is None or task.done():
+            self._refresh_tasks[key] = asyncio.create_task(
+                self._refresh_manifest(conn), name=f"mcp-manifest-{conn.name}"
+            )
+
+    async def _refresh_manifest(self, conn: _ServerConnection) -> None:
+        """后台单独启动一次服务器读取工具列表后关闭，不占用连接池中的连接"""
+        async with self._refresh_semaphore:
+            if conn.connected:
+                return  # 已按需启动，启动时已刷新清单
+            try:
+                async with MultiServerMCPClient({conn.name: conn.config}) as client:
+                    tools = list(client.server_name_to_tools.get(conn.name, []))
+            except Exception as e:
+                logger.warning(f"⚠️ 后台刷新 MCP 服务器 {conn.name} 的工具清单失败: {e}")
+                return
+            self.stats.manifest_refreshes += 1
+            if self.manifest.update(conn.name, conn.config, tools):
+                # 已注册的动作保持本次的 schema，新清单从下次租用开始生效
+                logger.info(f"📋 MCP 服务器 {conn.name} 的工具有变化，清单已更新")
+            if not conn.connected:
+                conn.known_tools = tools_from_specs(self.manifest.get(conn.name, conn.config)["tools"])
+
+    async def reconnect(self, conn: _ServerConnection) -> bool:
+        async with conn.lock:
+            if conn.closed:
+                return False
+            # 等锁期间其他租用者可能已经完成重连
+            if await conn.is_healthy(self.settings.ping_timeout):
+                return True
+            return await self._connect(conn)
+
+    async def release(self, connections: List[_ServerConnection]) -> None:
+        now = time.monotonic()
+        for conn in connections:
+            conn.leases = max(conn.leases - 1, 0)
+            conn.last_used = now
+
+    def _ensure_reaper(self) -> None:
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap_idle(), name="mcp-pool-reaper")
+
+    async def _reap_idle(self) -> None:
+        while self._connections:
+            await asyncio.sleep(self.settings.reap_interval)
+            now = time.monotonic()
+            for key, conn in list(self._connections.items()):
+                if conn.leases or now - conn.last_used < self.settings.idle_timeout:
+                    continue
+                async with conn.lock:
+                    if conn.leases:
+                        continue
+                    conn.closed = True
+                    self._connections.pop(key, None)
+                    if conn.connected:
+                        self.stats.idle_shutdowns += 1
+                        logger.info(f"💤 MCP 服务器 {conn.name} 空闲 {now - conn.last_used:.0f}s, 已关闭")
+                    await conn.close(self.settings.shutdown_timeout)
+
+    async def close(self) -> None:
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        for task in self._refresh_tasks.values():
+            task.cancel()
+        self._refresh_tasks = {}
+        connections, self._connections = list(self._connections.values()), {}
+        for conn in connections:
+            conn.closed = True
+            await conn.close(self.settings.shutdown_timeout)
+        logger.info(f"🔌 MCP 连接池已关闭: {self.stats.summary()}; 结果缓存: {self.result_cache.stats.summary()}")
+
+
+# 会话与后台任务绑定在创建它们的事件循环上，因此每个事件循环一个连接池
+_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, MCPConnectionPool]" = weakref.WeakKeyDictionary()
+
+
+def get_mcp_pool(settings: Optional[MCPPoolSettings] = None) -> MCPConnectionPool:
+    """返回当前事件循环的 MCP 连接池；settings 只在首次创建时生效"""
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = _pools[loop] = MCPConnectionPool(settings)
+    return pool
+
+
+async def close_mcp_pool() -> None:
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.close()
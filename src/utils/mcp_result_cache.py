@@ -0,0 +1,223 @@
+"""
+幂等 MCP 工具的结果缓存
+在服务器配置中把只读工具标记为幂等后，结果按 (服务器, 工具, 规范化参数) 缓存，带 TTL：
+
+    {"mcpServers": {"search": {"command": "...", "idempotent_tools": ["search", "fetch"], "cache_ttl": 600}}}
+
+内存中是有条目上限的 LRU，磁盘上每个结果一个 JSON 文件并限制总字节数，跨任务与子 agent 共享；
+同一时刻相同的调用只会真正执行一次，其余调用等待同一个结果
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from src.utils.hashing import stable_hash
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MCPResultCacheSettings:
+    """结果缓存配置"""
+    enabled: bool = True
+    default_ttl: float = 3600.0  # 服务器未配置 cache_ttl 时的默认 TTL（秒）
+    max_memory_entries: int = 1000
+    cache_dir: Optional[str] = "./tmp/mcp_cache"  # None 表示只用内存
+    max_disk_bytes: int = 200 * 1024 * 1024
+
+
+@dataclass
+class MCPResultCacheStats:
+    """结果缓存统计"""
+    memory_hits: int = 0
+    disk_hits: int = 0
+    coalesced: int = 0
+    misses: int = 0
+    expired: int = 0
+    disk_evictions: int = 0
+
+    @property
+    def lookups(self) -> int:
+        return self.memory_hits + self.disk_hits + self.coalesced + self.misses
+
+    def hit_rate(self) -> float:
+        if not self.lookups:
+            return 0.0
+        return (self.memory_hits + self.disk_hits + self.coalesced) / self.lookups
+
+    def summary(self) -> str:
+        return (
+            f"查询 {self.lookups} 次, 命中率 {self.hit_rate():.0%} (内存 {self.memory_hits}, 磁盘 {self.disk_hits}, "
+            f"合并并发 {self.coalesced}), 未命中 {self.misses}, 过期 {self.expired}"
+        )
+
+
+def cache_key(server_name: str, tool_name: str, params: Dict[str, Any]) -> str:
+    return stable_hash({"server": server_name, "tool": tool_name, "args": params})
+
+
+class MCPResultCache:
+    """内存 LRU + 磁盘 TTL 缓存，并合并同时发生的相同调用"""
+
+    def __init__(self, settings: Optional[MCPResultCacheSettings] = None):
+        self.settings = settings or MCPResultCacheSettings()
+        self.stats = MCPResultCacheStats()
+        self._memory: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._disk_bytes: Optional[int] = None
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.settings.cache_dir, key[:2], f"{key}.json")
+
+    def _memory_get(self, key: str) -> Tuple[bool, Any]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at < time.time():
+            del self._memory[key]
+            self.stats.expired += 1
+            return False, None
+        self._memory.move_to_end(key)
+        return True, value
+
+    def _memory_put(self, key: str, expires_at: float, value: Any) -> None:
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.settings.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key: str) -> Tuple[bool, float, Any]:
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return False, 0.0, None
+        if record.get("expires_at", 0) < time.time():
+            self.stats.expired += 1
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                self._disk_bytes = max((self._disk_bytes or size) - size, 0)
+            except OSError:
+                pass
+            return False, 0.0, None
+        return True, record["expires_at"], record["result"]
+
+    def _scan_disk(self) -> int:
+        total = 0
+        for root, _, files in os.walk(self.settings.cache_dir):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+
+    def _disk_put(self, key: str, record: Dict[str, Any]) -> None:
+        try:
+            data = json.dumps(record, ensure_ascii=False)
+        except (TypeError, ValueError):
+            return  # 结果不可 JSON 序列化时只缓存在内存
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, path)  # 原子替换，其他进程不会读到半个文件
+        if self._disk_bytes is None:
+            self._disk_bytes = self._scan_disk()
+        else:
+            self._disk_bytes += len(data.encode("utf-8"))
+        if self._disk_bytes > self.settings.max_disk_bytes:
+            self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        """按修改时间从旧到新删除，直到低于上限的 90%"""
+        files = []
+        for root, _, names in os.walk(self.settings.cache_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        target = self.settings.max_disk_bytes * 0.9
+        for _, size, path in sorted(files):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                self.stats.disk_evictions += 1
+            except OSError:
+                pass
+        self._disk_bytes = total
+
+    async def get_or_call(
+            self,
+            server_name: str,
+            tool_name: str,
+            params: Dict[str, Any],
+            ttl: float,
+            call: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        key = cache_key(server_name, tool_name, params)
+        found, value = self._memory_get(key)
+        if found:
+            self.stats.memory_hits += 1
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stats.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            if self.settings.cache_dir:
+                found, expires_at, value = await asyncio.to_thread(self._disk_get, key)
+                if found:
+                    self.stats.disk_hits += 1
+                    self._memory_put(key, expires_at, value)
+                    future.set_result(value)
+                    return value
+
+            self.stats.misses += 1
+            value = await call()
+            expires_at = time.time() + ttl
+            self._memory_put(key, expires_at, value)
+            future.set_result(value)
+            if self.settings.cache_dir:
+                record = {"server": server_name, "tool": tool_name, "args": params,
+                          "expires_at": expires_at, "result": value}
+                try:
+                    await asyncio.to_thread(self._disk_put, key, record)
+                except OSError as e:
+                    logger.warning(f"⚠️ 写入 MCP 结果缓存失败: {e}")
+            return value
+        except BaseException as e:
+            # 失败不缓存；等待中的调用收到同样的异常
+            if not future.done():
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+                    future.exception()  # 标记已读取，没有等待者时不告警
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def clear(self) -> None:
+        """清空内存缓存；磁盘条目按 TTL 过期"""
+        self._memory.clear()
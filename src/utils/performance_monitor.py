@@ -3,15 +3,49 @@
 跟踪Agent执行的性能指标
 """
 
+import json
+import os
 import time
 import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
 
+# 步骤阶段名称
+PHASE_POST_ACTION_WAIT = "post_action_wait"
+PHASE_DOM_EXTRACTION = "dom_extraction"
+PHASE_SCREENSHOT = "screenshot"
+PHASE_PROMPT_ASSEMBLY = "prompt_assembly"
+PHASE_PLANNER = "planner"
+PHASE_LLM = "llm"
+PHASE_ACTION_EXECUTION = "action_execution"
+PHASE_OTHER = "other"
+
+
+@dataclass
+class PhaseSpan:
+    """步骤内的一个计时阶段，支持嵌套；self_time 为扣除子阶段后的耗时"""
+    name: str
+    start: float  # 相对步骤开始的秒数
+    duration: float = 0.0
+    self_time: float = 0.0
+    parent: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "start": round(self.start, 4),
+            "duration": round(self.duration, 4),
+            "self_time": round(self.self_time, 4),
+            "parent": self.parent,
+        }
+
+
 @dataclass
 class StepMetrics:
     """单步执行的性能指标"""
@@ -22,7 +56,40 @@ class StepMetrics:
     error_type: Optional[str] = None
     duration: float = 0.0
     action_count: int = 0
-    
+    spans: List[PhaseSpan] = field(default_factory=list)
+    _open_spans: List[PhaseSpan] = field(default_factory=list, repr=False)
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[PhaseSpan]:
+        """记录一个阶段；嵌套阶段的耗时从外层阶段的 self_time 中扣除，避免重复计算"""
+        start = time.time()
+        parent = self._open_spans[-1] if self._open_spans else None
+        phase = PhaseSpan(name=name, start=start - self.start_time, parent=parent.name if parent else None)
+        self._open_spans.append(phase)
+        try:
+            yield phase
+        finally:
+            phase.duration = time.time() - start
+            phase.self_time += phase.duration
+            self._open_spans.remove(phase)
+            if parent is not None:
+                parent.self_time -= phase.duration
+            self.spans.append(phase)
+
+    def phase_durations(self) -> Dict[str, float]:
+        """按阶段汇总耗时（self_time），未被任何阶段覆盖的时间计入 other"""
+        durations: Dict[str, float] = {}
+        for phase in self.spans:
+            durations[phase.name] = durations.get(phase.name, 0.0) + phase.self_time
+        covered = sum(durations.values())
+        if self.duration > covered:
+            durations[PHASE_OTHER] = self.duration - covered
+        return durations
+
+    def format_phases(self) -> str:
+        durations = sorted(self.phase_durations().items(), key=lambda item: item[1], reverse=True)
+        return ", ".join(f"{name} {seconds:.2f}s" for name, seconds in durations)
+
     def finish(self, status: str, error_type: Optional[str] = None):
         """完成步骤测量"""
         self.end_time = time.time()
@@ -30,6 +97,19 @@ class StepMetrics:
         self.status = status
         self.error_type = error_type
 
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "step_number": self.step_number,
+            "start_time": self.start_time,
+            "end_time": self.end_time,
+            "status": self.status,
+            "error_type": self.error_type,
+            "duration": round(self.duration, 4),
+            "action_count": self.action_count,
+            "phases": {name: round(seconds, 4) for name, seconds in self.phase_durations().items()},
+            "spans": [phase.to_dict() for phase in self.spans],
+        }
+
 
 @dataclass
 class TaskMetrics:
@@ -73,6 +153,37 @@ class TaskMetrics:
             return 0.0
         return (self.successful_steps / self.total_steps) * 100
 
+    def get_phase_totals(self) -> Dict[str, float]:
+        """获取所有步骤各阶段的累计耗时"""
+        totals: Dict[str, float] = {}
+        for step in self.step_metrics:
+            for name, seconds in step.phase_durations().items():
+                totals[name] = totals.get(name, 0.0) + seconds
+        return totals
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "task_id": self.task_id,
+            "start_time": self.start_time.isoformat(),
+            "end_time": self.end_time.isoformat() if self.end_time else None,
+            "total_steps": self.total_steps,
+            "successful_steps": self.successful_steps,
+            "failed_steps": self.failed_steps,
+            "total_duration": round(self.total_duration, 4),
+            "success": self.success,
+            "error_summary": self.error_summary,
+            "phase_totals": {name: round(seconds, 4) for name, seconds in self.get_phase_totals().items()},
+            "steps": [step.to_dict() for step in self.step_metrics],
+        }
+
+    def save_to_file(self, filepath: str):
+        """保存为 JSON，用于跨任务比较慢阶段"""
+        dirname = os.path.dirname(filepath)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        with open(filepath, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
+
 
 class PerformanceMonitor:
     """性能监控器"""
@@ -104,9 +215,14 @@ class PerformanceMonitor:
         self.current_task.add_step(step_metrics)
         
         if status == "success":
-            logger.info(f"  ✅ 步骤 {step_metrics.step_number} 完成 ({step_metrics.duration:.2f}s)")
+            logger.info(
+                f"  ✅ 步骤 {step_metrics.step_number} 完成 ({step_metrics.duration:.2f}s): {step_metrics.format_phases()}"
+            )
         else:
-            logger.warning(f"  ⚠️ 步骤 {step_metrics.step_number} 失败 ({step_metrics.duration:.2f}s) - {error_type}")
+            logger.warning(
+                f"  ⚠️ 步骤 {step_metrics.step_number} 失败 ({step_metrics.duration:.2f}s) - {error_type}: "
+                f"{step_metrics.format_phases()}"
+            )
     
     def finish_task(self, success: bool, error_summary: Optional[str] = None):
         """完成任务监控"""
@@ -136,6 +252,8 @@ class PerformanceMonitor:
         if task.step_metrics:
             slowest_step = max(task.step_metrics, key=lambda s: s.duration)
             logger.info(f"最慢步骤: 步骤 {slowest_step.step_number} ({slowest_step.duration:.2f}s)")
+            phase_totals = sorted(task.get_phase_totals().items(), key=lambda item: item[1], reverse=True)
+            logger.info("阶段耗时: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in phase_totals))
         
         if task.error_summary:
             logger.info(f"错误摘要: {task.error_summary}")
@@ -165,6 +283,29 @@ class PerformanceMonitor:
 # 全局性能监控实例
 _global_monitor = PerformanceMonitor()
 
+# 当前协程正在测量的步骤；浏览器上下文、消息管理器等通过 phase_span 向其记录阶段
+_current_step: ContextVar[Optional[StepMetrics]] = ContextVar("current_step_metrics", default=None)
+
+
+def set_current_step(step_metrics: Optional[StepMetrics]):
+    """设置当前步骤，返回用于 reset_current_step 的 token"""
+    return _current_step.set(step_metrics)
+
+
+def reset_current_step(token) -> None:
+    _current_step.reset(token)
+
+
+@contextmanager
+def phase_span(name: str) -> Iterator[Optional[PhaseSpan]]:
+    """在当前步骤上记录一个阶段；不在步骤内（如 UI 轮询截图）时不做任何记录"""
+    step_metrics = _current_step.get()
+    if step_metrics is None:
+        yield None
+        return
+    with step_metrics.span(name) as phase:
+        yield phase
+
 
 def get_performance_monitor() -> PerformanceMonitor:
     """获取全局性能监控实例"""
@@ -0,0 +1,206 @@
+"""
+任务录像生成模块
+在独立进程池中把 agent 历史渲染为 GIF / MP4 / WebM，避免阻塞事件循环
+"""
+
+import asyncio
+import base64
+import importlib.util
+import io
+import json
+import logging
+import multiprocessing
+import os
+import textwrap
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional, Tuple
+
+from src.utils.screenshot_store import load_screenshot
+
+logger = logging.getLogger(__name__)
+
+RECORDING_FORMATS = ("gif", "mp4", "webm")
+VIDEO_CODECS = {"mp4": "libx264", "webm": "libvpx-vp9"}
+VIDEO_FPS = 2  # 视频帧率；每个截图按 frame_duration 重复，静止帧几乎不占体积
+
+_recording_pool: Optional[ProcessPoolExecutor] = None
+
+
+def available_recording_formats() -> Tuple[str, ...]:
+    """当前环境可生成的录像格式；MP4/WebM 需要 imageio 与 imageio-ffmpeg"""
+    if all(importlib.util.find_spec(name) for name in ("imageio", "imageio_ffmpeg", "numpy")):
+        return RECORDING_FORMATS
+    return ("gif",)
+
+
+def recording_format_from_path(output_path: str) -> str:
+    """根据输出文件扩展名判断录像格式，未知扩展名按 GIF 处理"""
+    ext = os.path.splitext(output_path)[1].lower().lstrip(".")
+    return ext if ext in RECORDING_FORMATS else "gif"
+
+
+def _iter_history_frames(history_path: str) -> Iterator[Tuple[str, str]]:
+    """逐步产出 (截图 base64, 步骤目标)，跳过没有截图的步骤"""
+    with open(history_path, "r", encoding="utf-8") as f:
+        history = json.load(f).get("history", [])
+
+    for item in history:
+        state = item.get("state") or {}
+        # 截图可能是存储路径引用，在这里才按需从磁盘加载
+        screenshot = load_screenshot(state.get("screenshot"))
+        if not screenshot:
+            continue
+        model_output = item.get("model_output") or {}
+        goal = (model_output.get("current_state") or {}).get("next_goal") or ""
+        yield screenshot, goal
+
+
+def _render_frame(screenshot_b64: str, caption: str, step: int, size: Optional[Tuple[int, int]]):
+    """解码单帧截图并叠加步骤说明；只在需要时持有这一帧"""
+    from PIL import Image, ImageDraw
+
+    image = Image.open(io.BytesIO(base64.b64decode(screenshot_b64))).convert("RGB")
+    if size and image.size != size:
+        image = image.resize(size)
+
+    text = f"{step}. {caption}" if caption else str(step)
+    lines = textwrap.wrap(text, width=max(20, image.width // 12))[:3]
+    if lines:
+        draw = ImageDraw.Draw(image, "RGBA")
+        band_height = 18 * len(lines) + 16
+        draw.rectangle([(0, image.height - band_height), (image.width, image.height)], fill=(0, 0, 0, 160))
+        for i, line in enumerate(lines):
+            draw.text((12, image.height - band_height + 8 + i * 18), line, fill=(255, 255, 255))
+    return image
+
+
+def _iter_rendered_frames(history_path: str):
+    size = None
+    for step, (screenshot_b64, goal) in enumerate(_iter_history_frames(history_path), start=1):
+        try:
+            frame = _render_frame(screenshot_b64, goal, step, size)
+        except Exception as e:
+            logger.warning(f"⚠️ 跳过无法解码的截图 (步骤 {step}): {e}")
+            continue
+        size = frame.size
+        yield frame
+
+
+def _write_gif_stream(history_path: str, output_path: str, frame_duration: float) -> int:
+    """逐帧写入 GIF，每帧独立调色板，不在内存中累积全部帧"""
+    from PIL import GifImagePlugin, Image
+
+    frame_count = 0
+    with open(output_path, "wb") as fp:
+        for frame in _iter_rendered_frames(history_path):
+            frame = frame.quantize(colors=256, method=Image.Quantize.MEDIANCUT)
+            if frame_count == 0:
+                header, _ = GifImagePlugin.getheader(frame, info={"loop": 0})
+                for chunk in header:
+                    fp.write(chunk)
+            for chunk in GifImagePlugin.getdata(
+                    frame, duration=int(frame_duration * 1000), include_color_table=True
+            ):
+                fp.write(chunk)
+            frame_count += 1
+        fp.write(b";")  # GIF trailer
+
+    if frame_count == 0:
+        os.remove(output_path)
+    return frame_count
+
+
+def _write_video_stream(history_path: str, output_path: str, fmt: str, frame_duration: float) -> int:
+    """通过 imageio-ffmpeg 逐帧编码 MP4/WebM，体积远小于 GIF"""
+    import imageio.v2 as imageio
+    import numpy as np
+
+    repeat = max(1, round(frame_duration * VIDEO_FPS))
+    frame_count = 0
+    writer = None
+    try:
+        for frame in _iter_rendered_frames(history_path):
+            if writer is None:
+                writer = imageio.get_writer(
+                    output_path, format="FFMPEG", mode="I", fps=VIDEO_FPS, codec=VIDEO_CODECS[fmt],
+                    macro_block_size=16,
+                )
+            data = np.asarray(frame)
+            for _ in range(repeat):
+                writer.append_data(data)
+            frame_count += 1
+    finally:
+        if writer is not None:
+            writer.close()
+    return frame_count
+
+
+def render_history_recording(history_path: str, output_path: str, frame_duration: float = 3.0) -> Optional[str]:
+    """
+    在工作进程中把历史 JSON 渲染为录像文件。
+    返回: 生成的文件路径，没有可用截图时返回 None
+    """
+    fmt = recording_format_from_path(output_path)
+    if fmt in VIDEO_CODECS:
+        try:
+            frame_count = _write_video_stream(history_path, output_path, fmt, frame_duration)
+        except ImportError:
+            output_path = os.path.splitext(output_path)[0] + ".gif"
+            logger.warning(f"⚠️ 未安装 imageio/imageio-ffmpeg，{fmt} 录像改为输出 GIF: {output_path}")
+            frame_count = _write_gif_stream(history_path, output_path, frame_duration)
+    else:
+        frame_count = _write_gif_stream(history_path, output_path, frame_duration)
+
+    if frame_count == 0:
+        logger.info("没有可用的截图，未生成录像")
+        return None
+    return output_path
+
+
+def _get_recording_pool() -> ProcessPoolExecutor:
+    global _recording_pool
+    if _recording_pool is None:
+        # 使用 spawn，避免在持有浏览器连接和线程的进程中 fork
+        _recording_pool = ProcessPoolExecutor(
+            max_workers=max(1, min(2, (os.cpu_count() or 2) // 2)),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _recording_pool
+
+
+async def _run_recording_job(history_path: str, output_path: str, frame_duration: float,
+                             keep_history_file: bool) -> Optional[str]:
+    loop = asyncio.get_running_loop()
+    try:
+        result = await loop.run_in_executor(
+            _get_recording_pool(), render_history_recording, history_path, output_path, frame_duration
+        )
+        if result:
+            logger.info(f"🎞️ 录像已生成: {result}")
+        return result
+    except Exception as e:
+        logger.error(f"❌ 生成录像失败: {e}", exc_info=True)
+        return None
+    finally:
+        if not keep_history_file and os.path.exists(history_path):
+            os.remove(history_path)
+
+
+def schedule_history_recording(
+        history_path: str,
+        output_path: str,
+        frame_duration: float = 3.0,
+        keep_history_file: bool = False,
+) -> "asyncio.Task[Optional[str]]":
+    """
+    把录像生成提交到后台进程池，立即返回 asyncio.Task。
+    Task 完成时结果为录像路径（失败或无截图时为 None），调用方可 await 或注册回调获知完成。
+    """
+    return asyncio.create_task(_run_recording_job(history_path, output_path, frame_duration, keep_history_file))
+
+
+def shutdown_recording_pool() -> None:
+    global _recording_pool
+    if _recording_pool is not None:
+        _recording_pool.shutdown(wait=False, cancel_futures=True)
+        _recording_pool = None
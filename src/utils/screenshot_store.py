@@ -0,0 +1,67 @@
+"""
+截图内容寻址存储模块
+截图按内容哈希写入磁盘一次，历史记录中只保留文件路径，相同画面自动去重
+"""
+
+import base64
+import hashlib
+import logging
+import os
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+SCREENSHOT_EXT = ".png"
+
+
+def is_screenshot_ref(value: Optional[str]) -> bool:
+    """判断字符串是存储路径引用还是 base64 截图（base64 字母表不含 '.'）"""
+    return bool(value) and len(value) < 1024 and value.endswith(SCREENSHOT_EXT)
+
+
+def load_screenshot(value: Optional[str]) -> Optional[str]:
+    """按需加载截图：引用则从磁盘读取并编码为 base64，否则原样返回"""
+    if not is_screenshot_ref(value):
+        return value
+    try:
+        with open(value, "rb") as f:
+            return base64.b64encode(f.read()).decode("utf-8")
+    except OSError as e:
+        logger.warning(f"⚠️ 无法读取截图 {value}: {e}")
+        return None
+
+
+class ScreenshotStore:
+    """以 sha256 为文件名的截图存储，同一内容只写一次"""
+
+    def __init__(self, root_dir: str = "./tmp/agent_history/screenshots"):
+        self.root_dir = root_dir
+        os.makedirs(self.root_dir, exist_ok=True)
+        self.stored_count = 0  # 实际写入的截图数
+        self.deduplicated_count = 0  # 命中已有内容、未重复写入的截图数
+
+    def path_for(self, digest: str) -> str:
+        return os.path.join(self.root_dir, digest[:2], f"{digest}{SCREENSHOT_EXT}")
+
+    def put(self, screenshot_b64: str) -> str:
+        """写入 base64 截图，返回可替代原字符串保存在历史中的路径引用"""
+        if is_screenshot_ref(screenshot_b64):
+            return screenshot_b64
+
+        digest = hashlib.sha256(screenshot_b64.encode("ascii")).hexdigest()
+        path = self.path_for(digest)
+        if os.path.exists(path):
+            self.deduplicated_count += 1
+            return path
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(base64.b64decode(screenshot_b64))
+        os.replace(tmp_path, path)  # 原子替换，并发写入同一内容也安全
+        self.stored_count += 1
+        return path
+
+    def get(self, ref: Optional[str]) -> Optional[str]:
+        """读取引用对应的 base64 截图"""
+        return load_screenshot(ref)
@@ -58,6 +58,12 @@ def create_agent_settings_tab(webui_manager: WebuiManager):
     with gr.Group():
         mcp_json_file = gr.File(label="MCP server json", interactive=True, file_types=[".json"])
         mcp_server_config = gr.Textbox(label="MCP server", lines=6, interactive=True, visible=False)
+        lazy_mcp_startup = gr.Checkbox(
+            label="Lazy MCP Startup",
+            value=False,
+            info="Register MCP tools from the cached tool manifest and start each server on its first tool call",
+            interactive=True
+        )
 
     with gr.Group():
         with gr.Row():
@@ -175,6 +181,16 @@ def create_agent_settings_tab(webui_manager: WebuiManager):
                 info="Your API key (leave blank to use .env)"
             )
 
+        with gr.Row():
+            planner_interval = gr.Number(
+                label="Planner Interval",
+                value=4,
+                precision=0,
+                minimum=1,
+                info="Re-plan every N steps, or earlier on failures, new domains and stalled subgoals",
+                interactive=True
+            )
+
     with gr.Row():
         max_steps = gr.Slider(
             minimum=1,
@@ -210,6 +226,56 @@ def create_agent_settings_tab(webui_manager: WebuiManager):
             choices=['function_calling', 'json_mode', 'raw', 'auto', 'tools', "None"],
             visible=True
         )
+    with gr.Row():
+        enable_replay = gr.Checkbox(
+            label="Record & Replay",
+            value=False,
+            info="Replay recorded successful actions for repeated tasks, fall back to LLM on divergence",
+            interactive=True
+        )
+        history_compaction = gr.Checkbox(
+            label="History Compaction",
+            value=False,
+            info="Summarize older steps into a memory block to keep long runs within the token budget",
+            interactive=True
+        )
+        dom_delta = gr.Checkbox(
+            label="DOM Delta Encoding",
+            value=False,
+            info="Send only changed interactive elements when a step changes a small part of the page",
+            interactive=True
+        )
+        adaptive_vision = gr.Checkbox(
+            label="Adaptive Vision",
+            value=False,
+            info="With vision on, send screenshots only on new pages, after failures, for unlabelled UIs or on request",
+            interactive=True
+        )
+        screenshot_crop = gr.Checkbox(
+            label="Focused Screenshot Crop",
+            value=False,
+            info="With vision on, crop screenshots to recently interacted or newly shown elements plus a thumbnail",
+            interactive=True
+        )
+        tool_selection = gr.Checkbox(
+            label="Tool Subset Selection",
+            value=False,
+            info="Send only core browser actions plus the tools most relevant to the task and page; the agent can request more",
+            interactive=True
+        )
+        loop_detection = gr.Checkbox(
+            label="Loop Detection",
+            value=True,
+            info="Detect repeated page/action cycles, inject a recovery prompt, then stop early",
+            interactive=True
+        )
+        compaction_keep_steps = gr.Number(
+            label="Keep Recent Steps",
+            value=4,
+            precision=0,
+            info="Number of most recent steps kept in full when compacting",
+            interactive=True
+        )
     tab_components.update(dict(
         override_system_prompt=override_system_prompt,
         extend_system_prompt=extend_system_prompt,
@@ -227,12 +293,22 @@ def create_agent_settings_tab(webui_manager: WebuiManager):
         planner_ollama_num_ctx=planner_ollama_num_ctx,
         planner_llm_base_url=planner_llm_base_url,
         planner_llm_api_key=planner_llm_api_key,
+        planner_interval=planner_interval,
         max_steps=max_steps,
         max_actions=max_actions,
         max_input_tokens=max_input_tokens,
         tool_calling_method=tool_calling_method,
+        enable_replay=enable_replay,
+        history_compaction=history_compaction,
+        compaction_keep_steps=compaction_keep_steps,
+        dom_delta=dom_delta,
+        loop_detection=loop_detection,
+        adaptive_vision=adaptive_vision,
+        screenshot_crop=screenshot_crop,
+        tool_selection=tool_selection,
         mcp_json_file=mcp_json_file,
         mcp_server_config=mcp_server_config,
+        lazy_mcp_startup=lazy_mcp_startup,
     ))
     webui_manager.add_components("agent_settings", tab_components)
 
@@ -4,8 +4,10 @@ import gradio as gr
 import logging
 from gradio.components import Component
 
+from src.browser.browser_pool import close_browser_pools
 from src.webui.webui_manager import WebuiManager
 from src.utils import config
+from src.utils.recording import available_recording_formats
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +29,10 @@ async def close_browser(webui_manager: WebuiManager):
         await webui_manager.bu_browser.close()
         webui_manager.bu_browser = None
 
+    # Pooled browsers were launched with the previous settings; a running deep research task still holds leases
+    if not (webui_manager.dr_current_task and not webui_manager.dr_current_task.done()):
+        await close_browser_pools()
+
 def create_browser_settings_tab(webui_manager: WebuiManager):
     """
     Creates a browser settings tab.
@@ -74,6 +80,18 @@ def create_browser_settings_tab(webui_manager: WebuiManager):
                 info="Disable browser security",
                 interactive=True
             )
+            reuse_logins = gr.Checkbox(
+                label="Reuse Logins",
+                value=False,
+                info="Restore encrypted cookies/localStorage saved by earlier successful runs",
+                interactive=True
+            )
+            http_cache = gr.Checkbox(
+                label="Shared HTTP Cache",
+                value=False,
+                info="Share cacheable static assets between contexts through a bounded disk cache",
+                interactive=True
+            )
 
     with gr.Group():
         with gr.Row():
@@ -89,6 +107,27 @@ def create_browser_settings_tab(webui_manager: WebuiManager):
                 info="Browser window height",
                 interactive=True
             )
+            live_view_fps = gr.Number(
+                label="Live View FPS",
+                value=5,
+                info="Max frame rate of the headless live view",
+                interactive=True
+            )
+            live_view_quality = gr.Slider(
+                label="Live View JPEG Quality",
+                minimum=10,
+                maximum=100,
+                step=5,
+                value=60,
+                interactive=True
+            )
+            resource_blocking = gr.Dropdown(
+                label="Resource Blocking",
+                choices=["full", "no-media", "text-only"],
+                value="full",
+                info="Block images/media/fonts/trackers for DOM-only agents; vision steps still get what they need",
+                interactive=True,
+            )
     with gr.Group():
         with gr.Row():
             cdp_url = gr.Textbox(
@@ -131,6 +170,16 @@ def create_browser_settings_tab(webui_manager: WebuiManager):
                 info="Specify the directory where downloaded files should be saved.",
                 interactive=True,
             )
+        with gr.Row():
+            recording_formats = available_recording_formats()
+            recording_format = gr.Dropdown(
+                label="Task Recording Format",
+                choices=list(recording_formats),
+                value="gif",
+                info="Recording generated from agent history; mp4/webm are much smaller"
+                if len(recording_formats) > 1 else "Install imageio[ffmpeg] to record mp4/webm",
+                interactive=True,
+            )
     tab_components.update(
         dict(
             browser_binary_path=browser_binary_path,
@@ -139,14 +188,20 @@ def create_browser_settings_tab(webui_manager: WebuiManager):
             keep_browser_open=keep_browser_open,
             headless=headless,
             disable_security=disable_security,
+            reuse_logins=reuse_logins,
+            http_cache=http_cache,
             save_recording_path=save_recording_path,
             save_trace_path=save_trace_path,
             save_agent_history_path=save_agent_history_path,
             save_download_path=save_download_path,
+            recording_format=recording_format,
             cdp_url=cdp_url,
             wss_url=wss_url,
             window_h=window_h,
             window_w=window_w,
+            resource_blocking=resource_blocking,
+            live_view_fps=live_view_fps,
+            live_view_quality=live_view_quality,
         )
     )
     webui_manager.add_components("browser_settings", tab_components)
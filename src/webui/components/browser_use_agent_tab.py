@@ -19,9 +19,24 @@ from gradio.components import Component
 from langchain_core.language_models.chat_models import BaseChatModel
 
 from src.agent.browser_use.browser_use_agent import BrowserUseAgent
+from src.agent.browser_use.adaptive_vision import AdaptiveVisionSettings
+from src.agent.browser_use.checkpoint import checkpoint_path_for, find_latest_checkpoint, load_checkpoint
+from src.agent.browser_use.history_compaction import HistoryCompactionSettings
+from src.agent.browser_use.loop_detection import LoopDetectionSettings
+from src.agent.browser_use.planner_scheduler import PlannerScheduleSettings, summarize_planner_runs
+from src.agent.browser_use.message_manager import DomDeltaSettings
+from src.agent.browser_use.replay import ReplayStore
+from src.agent.browser_use.tool_selection import ToolSelectionSettings
 from src.browser.custom_browser import CustomBrowser
+from src.browser.http_cache import HttpCacheSettings
+from src.browser.resource_blocking import ResourceBlockingSettings
+from src.browser.screencast import LiveScreencast, ScreencastSettings
+from src.browser.screenshot_crop import ScreenshotCropSettings
+from src.browser.storage_state_cache import get_storage_state_cache
 from src.controller.custom_controller import CustomController
 from src.utils import llm_provider
+from src.utils.screenshot_store import ScreenshotStore
+from src.utils.performance_monitor import TaskMetrics
 from src.webui.webui_manager import WebuiManager
 
 logger = logging.getLogger(__name__)
@@ -273,6 +288,18 @@ async def _handle_new_step(
     await asyncio.sleep(0.05)
 
 
+def _format_step_timing(task_metrics: TaskMetrics) -> str:
+    """把最近一步与累计的分阶段耗时格式化为 Markdown"""
+    if not task_metrics.step_metrics:
+        return ""
+    last_step = task_metrics.step_metrics[-1]
+    totals = sorted(task_metrics.get_phase_totals().items(), key=lambda item: item[1], reverse=True)
+    return (
+        f"**步骤 {last_step.step_number} 耗时 {last_step.duration:.2f}s**: {last_step.format_phases()}  \n"
+        f"**累计**: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in totals)
+    )
+
+
 def _handle_done(webui_manager: WebuiManager, history: AgentHistoryList):
     """Callback when the agent finishes the task (success or failure)."""
     logger.info(
@@ -282,6 +309,64 @@ def _handle_done(webui_manager: WebuiManager, history: AgentHistoryList):
     final_summary += f"- Duration: {history.total_duration_seconds():.2f} seconds\n"
     final_summary += f"- Total Input Tokens: {history.total_input_tokens()}\n"  # Or total tokens if available
 
+    compactor = getattr(webui_manager.bu_agent, "history_compactor", None)
+    if compactor and compactor.stats.compactions:
+        final_summary += (
+            f"- History Compactions: {compactor.stats.compactions} "
+            f"(input tokens saved: {compactor.stats.tokens_saved()})\n"
+        )
+
+    planner_scheduler = getattr(webui_manager.bu_agent, "planner_scheduler", None)
+    if planner_scheduler and webui_manager.bu_agent.settings.planner_llm:
+        final_summary += (
+            f"- Planner Calls: {planner_scheduler.stats.planner_calls} "
+            f"(avoided: {planner_scheduler.stats.planner_calls_avoided})\n"
+        )
+        stats_path = webui_manager.bu_agent.planner_stats_path
+        for interval, summary in summarize_planner_runs(stats_path).items() if stats_path else []:
+            final_summary += (
+                f"  - Interval {interval}: {summary['runs']} runs, "
+                f"success {summary['success_rate']:.0f}%, "
+                f"avg planner calls {summary['avg_planner_calls']:.1f}\n"
+            )
+
+    vision_policy = getattr(webui_manager.bu_agent, "vision_policy", None)
+    if vision_policy and webui_manager.bu_agent.settings.use_vision:
+        vision_stats = vision_policy.stats
+        final_summary += (
+            f"- Screenshots Sent: {vision_stats.screenshots_sent}, skipped: {vision_stats.screenshots_skipped} "
+            f"(~{vision_stats.bytes_saved() / 1024:.0f} KB, {vision_stats.latency_saved():.2f}s saved)\n"
+        )
+
+    tool_selector = getattr(webui_manager.bu_agent, "tool_selector", None)
+    if tool_selector and tool_selector.stats.steps:
+        selection_stats = tool_selector.stats
+        final_summary += (
+            f"- Action Schema: {selection_stats.full_schema_chars // selection_stats.steps} -> "
+            f"{selection_stats.sent_schema_chars // selection_stats.steps} chars/step "
+            f"({selection_stats.reduction_ratio():.0%} smaller, tools requested: {selection_stats.tools_requested})\n"
+        )
+
+    mcp_client = getattr(webui_manager.bu_controller, "mcp_client", None)
+    cache_stats = getattr(mcp_client, "result_cache_stats", None)
+    if cache_stats and cache_stats.lookups:
+        final_summary += (
+            f"- MCP Result Cache: {cache_stats.hit_rate():.0%} hit rate "
+            f"({cache_stats.lookups} lookups, {cache_stats.coalesced} coalesced)\n"
+        )
+
+    loop_detector = getattr(webui_manager.bu_agent, "loop_detector", None)
+    if loop_detector and loop_detector.stats.loops_detected:
+        final_summary += (
+            f"- Loops Detected: {loop_detector.stats.loops_detected} "
+            f"(recovery prompts: {loop_detector.stats.recoveries}, "
+            f"steps saved: {loop_detector.stats.steps_saved})\n"
+        )
+
+    replayed_steps = getattr(webui_manager.bu_agent, "replayed_steps", 0)
+    if replayed_steps:
+        final_summary += f"- Steps Served From Replay: {replayed_steps}/{len(history.history)}\n"
+
     final_result = history.final_result()
     if final_result:
         final_summary += f"- Final Result: {final_result}\n"
@@ -349,9 +434,14 @@ async def _ask_assistant_callback(
 
 
 async def run_agent_task(
-        webui_manager: WebuiManager, components: Dict[gr.components.Component, Any]
+        webui_manager: WebuiManager,
+        components: Dict[gr.components.Component, Any],
+        resume_checkpoint: Optional[str] = None,
 ) -> AsyncGenerator[Dict[gr.components.Component, Any], None]:
-    """Handles the entire lifecycle of initializing and running the agent."""
+    """
+    Handles the entire lifecycle of initializing and running the agent.
+    With resume_checkpoint, the task, task id and progress are restored from an interrupted run.
+    """
 
     # --- Get Components ---
     # Need handles to specific UI components to update them
@@ -371,6 +461,7 @@ async def run_agent_task(
         "browser_use_agent.agent_history_file"
     )
     gif_comp = webui_manager.get_component_by_id("browser_use_agent.recording_gif")
+    video_comp = webui_manager.get_component_by_id("browser_use_agent.recording_video")
     browser_view_comp = webui_manager.get_component_by_id(
         "browser_use_agent.browser_view"
     )
@@ -380,9 +471,11 @@ async def run_agent_task(
     max_steps_display_comp = webui_manager.get_component_by_id("browser_use_agent.max_steps_display")
     failure_counter_comp = webui_manager.get_component_by_id("browser_use_agent.failure_counter")
     step_status_comp = webui_manager.get_component_by_id("browser_use_agent.step_status")
+    step_timing_comp = webui_manager.get_component_by_id("browser_use_agent.step_timing")
 
     # --- 1. Get Task and Initial UI Update ---
-    task = components.get(user_input_comp, "").strip()
+    checkpoint = load_checkpoint(resume_checkpoint) if resume_checkpoint else None
+    task = checkpoint.task if checkpoint else components.get(user_input_comp, "").strip()
     if not task:
         gr.Warning("Please enter a task.")
         yield {run_button_comp: gr.update(interactive=True)}
@@ -417,6 +510,20 @@ async def run_agent_task(
     max_input_tokens = get_setting("max_input_tokens", 128000)
     tool_calling_str = get_setting("tool_calling_method", "auto")
     tool_calling_method = tool_calling_str if tool_calling_str != "None" else None
+    enable_replay = get_setting("enable_replay", False)
+    dom_delta = DomDeltaSettings() if get_setting("dom_delta", False) else None
+    loop_detection = LoopDetectionSettings(enabled=get_setting("loop_detection", True))
+    adaptive_vision = AdaptiveVisionSettings() if get_setting("adaptive_vision", False) else None
+    screenshot_crop = ScreenshotCropSettings() if get_setting("screenshot_crop", False) else None
+    planner_schedule = PlannerScheduleSettings(interval=int(get_setting("planner_interval", 4) or 1))
+    tool_selection = ToolSelectionSettings() if get_setting("tool_selection", False) else None
+    history_compaction = None
+    if get_setting("history_compaction", False):
+        history_compaction = HistoryCompactionSettings(
+            keep_recent_steps=int(get_setting("compaction_keep_steps", 4) or 4),
+            # Start compacting well before the hard max_input_tokens cut-off
+            target_tokens=int(max_input_tokens * 0.25),
+        )
     
     # ✅ 对于 zkh 提供商，强制使用 function_calling 以支持工具调用
     if llm_provider_name == "zkh":
@@ -486,6 +593,15 @@ async def run_agent_task(
         "save_agent_history_path", "./tmp/agent_history"
     )
     save_download_path = get_browser_setting("save_download_path", "./tmp/downloads")
+    recording_format = get_browser_setting("recording_format", "gif") or "gif"
+    storage_cache = get_storage_state_cache() if get_browser_setting("reuse_logins", False) else None
+    resource_blocking = get_browser_setting("resource_blocking", "full") or "full"
+    screencast_settings = ScreencastSettings(
+        fps=float(get_browser_setting("live_view_fps", 5) or 5),
+        quality=int(get_browser_setting("live_view_quality", 60)),
+        max_width=window_w,
+        max_height=window_h,
+    )
 
     stream_vw = 70
     stream_vh = int(70 * window_h // window_w)
@@ -502,10 +618,12 @@ async def run_agent_task(
         chatbot_comp: gr.update(value=webui_manager.bu_chat_history),
         history_file_comp: gr.update(value=None),
         gif_comp: gr.update(value=None),
+        video_comp: gr.update(value=None, visible=False),
         step_progress_comp: gr.update(value=0),
         max_steps_display_comp: gr.update(value=max_steps),
         failure_counter_comp: gr.update(value=0),
         step_status_comp: gr.update(value="启动中..."),
+        step_timing_comp: gr.update(value=""),
     }
 
     os.makedirs(save_agent_history_path, exist_ok=True)
@@ -536,7 +654,9 @@ async def run_agent_task(
         webui_manager.bu_controller = CustomController(
             ask_assistant_callback=ask_callback_wrapper
         )
-        await webui_manager.bu_controller.setup_mcp_client(mcp_server_config)
+        await webui_manager.bu_controller.setup_mcp_client(
+            mcp_server_config, lazy=get_setting("lazy_mcp_startup", False)
+        )
 
     # --- 4. Initialize Browser and Context ---
     should_close_browser_on_finish = not keep_browser_open
@@ -581,6 +701,8 @@ async def run_agent_task(
                     )
                 )
             )
+            if get_browser_setting("http_cache", False):
+                webui_manager.bu_browser.configure_http_cache(HttpCacheSettings())
 
         # Create Context if needed
         if not webui_manager.bu_browser_context:
@@ -599,9 +721,20 @@ async def run_agent_task(
             webui_manager.bu_browser_context = (
                 await webui_manager.bu_browser.new_context(config=context_config)
             )
+            if storage_cache is not None:
+                await storage_cache.inject(webui_manager.bu_browser_context)
+        # 每次任务按当前设置重新安装，保持打开的上下文也会生效
+        await webui_manager.bu_browser_context.configure_resource_blocking(
+            ResourceBlockingSettings(preset=resource_blocking)
+        )
 
         # --- 5. Initialize or Update Agent ---
-        webui_manager.bu_agent_task_id = str(uuid.uuid4())  # New ID for this task run
+        if checkpoint:
+            # Resume into the interrupted run's directory with a fresh agent restored from the checkpoint
+            webui_manager.bu_agent_task_id = checkpoint.agent_id or str(uuid.uuid4())
+            webui_manager.bu_agent = None
+        else:
+            webui_manager.bu_agent_task_id = str(uuid.uuid4())  # New ID for this task run
         os.makedirs(
             os.path.join(save_agent_history_path, webui_manager.bu_agent_task_id),
             exist_ok=True,
@@ -614,7 +747,7 @@ async def run_agent_task(
         gif_path = os.path.join(
             save_agent_history_path,
             webui_manager.bu_agent_task_id,
-            f"{webui_manager.bu_agent_task_id}.gif",
+            f"{webui_manager.bu_agent_task_id}.{recording_format}",
         )
 
         # Pass the webui_manager to callbacks when wrapping them
@@ -626,6 +759,15 @@ async def run_agent_task(
         def done_callback_wrapper(history: AgentHistoryList):
             _handle_done(webui_manager, history)
 
+        replay_store = (
+            ReplayStore(os.path.join(save_agent_history_path, "replay_cache"))
+            if enable_replay
+            else None
+        )
+        screenshot_store = ScreenshotStore(
+            os.path.join(save_agent_history_path, "screenshots")
+        )
+
         if not webui_manager.bu_agent:
             logger.info(f"Initializing new agent for task: {task}")
             if not webui_manager.bu_browser or not webui_manager.bu_browser_context:
@@ -657,6 +799,16 @@ async def run_agent_task(
                 planner_llm=planner_llm,
                 use_vision_for_planner=planner_use_vision if planner_llm else False,
                 source="webui",
+                replay_store=replay_store,
+                screenshot_store=screenshot_store,
+                history_compaction=history_compaction,
+                dom_delta=dom_delta,
+                loop_detection=loop_detection,
+                adaptive_vision=adaptive_vision,
+                screenshot_crop=screenshot_crop,
+                planner_schedule=planner_schedule,
+                tool_selection=tool_selection,
+                planner_stats_path=os.path.join(save_agent_history_path, "planner_stats.jsonl"),
             )
             webui_manager.bu_agent.state.agent_id = webui_manager.bu_agent_task_id
             webui_manager.bu_agent.settings.generate_gif = gif_path
@@ -667,6 +819,23 @@ async def run_agent_task(
             webui_manager.bu_agent.browser = webui_manager.bu_browser
             webui_manager.bu_agent.browser_context = webui_manager.bu_browser_context
             webui_manager.bu_agent.controller = webui_manager.bu_controller
+            webui_manager.bu_agent.replay_store = replay_store
+            webui_manager.bu_agent.screenshot_store = screenshot_store
+            webui_manager.bu_agent.configure_dom_delta(dom_delta)
+            webui_manager.bu_agent.configure_loop_detection(loop_detection)
+            webui_manager.bu_agent.configure_adaptive_vision(adaptive_vision)
+            webui_manager.bu_agent.configure_screenshot_crop(screenshot_crop)
+            webui_manager.bu_agent.configure_planner_schedule(planner_schedule)
+            webui_manager.bu_agent.configure_tool_selection(tool_selection)
+        webui_manager.bu_agent.checkpoint_path = checkpoint_path_for(history_file)
+
+        if checkpoint:
+            restored = await webui_manager.bu_agent.restore_checkpoint(resume_checkpoint)
+            if restored:
+                webui_manager.bu_chat_history.append({
+                    "role": "assistant",
+                    "content": f"♻️ Resumed from checkpoint after step {restored.completed_steps} ({restored.url})",
+                })
 
         # --- 6. Run Agent Task and Stream Updates ---
         agent_run_coro = webui_manager.bu_agent.run(max_steps=max_steps)
@@ -674,6 +843,10 @@ async def run_agent_task(
         webui_manager.bu_current_task = agent_task  # Store the task
 
         last_chat_len = len(webui_manager.bu_chat_history)
+        last_timed_steps = 0
+        # Headless live view follows the CDP screencast; unchanged or unconsumed frames are never queued
+        live_view = LiveScreencast(webui_manager.bu_browser_context, screencast_settings) if headless else None
+        live_view_shown = False
         while not agent_task.done():
             is_paused = webui_manager.bu_agent.state.paused
             is_stopped = webui_manager.bu_agent.state.stopped
@@ -687,13 +860,17 @@ async def run_agent_task(
                     stop_button_comp: gr.update(interactive=True),
                 }
                 # Wait until pause is released or task is stopped/done
-                while is_paused and not agent_task.done():
-                    # Re-check agent state in loop
-                    is_paused = webui_manager.bu_agent.state.paused
-                    is_stopped = webui_manager.bu_agent.state.stopped
-                    if is_stopped:  # Stop signal received while paused
-                        break
-                    await asyncio.sleep(0.2)
+                resume_waiter = asyncio.ensure_future(
+                    webui_manager.bu_agent.wait_until_resumed()
+                )
+                try:
+                    await asyncio.wait(
+                        {resume_waiter, agent_task},
+                        return_when=asyncio.FIRST_COMPLETED,
+                    )
+                finally:
+                    resume_waiter.cancel()
+                is_stopped = webui_manager.bu_agent.state.stopped
 
                 if (
                         agent_task.done() or is_stopped
@@ -789,24 +966,30 @@ async def run_agent_task(
                     update_dict[step_status_comp] = gr.update(value=step_status)
                     logger.info(f"📊 进度: 步骤 {current_step}/{max_steps}, 失败次数: {failure_count}")
 
-            # Update Browser View
-            if headless and webui_manager.bu_browser_context:
+            # 更新最近一步的分阶段耗时
+            task_metrics = webui_manager.bu_agent.task_metrics if webui_manager.bu_agent else None
+            if task_metrics and len(task_metrics.step_metrics) != last_timed_steps:
+                last_timed_steps = len(task_metrics.step_metrics)
+                update_dict[step_timing_comp] = gr.update(value=_format_step_timing(task_metrics))
+
+            # Update Browser View (only when a new frame arrived)
+            if live_view is not None:
                 try:
-                    screenshot_b64 = (
-                        await webui_manager.bu_browser_context.take_screenshot()
-                    )
-                    if screenshot_b64:
-                        html_content = f'<img src="data:image/jpeg;base64,{screenshot_b64}" style="width:{stream_vw}vw; height:{stream_vh}vh ; border:1px solid #ccc;">'
+                    frame_b64 = await live_view.latest_frame()
+                    if frame_b64:
+                        html_content = f'<img src="data:image/jpeg;base64,{frame_b64}" style="width:{stream_vw}vw; height:{stream_vh}vh ; border:1px solid #ccc;">'
                         update_dict[browser_view_comp] = gr.update(
                             value=html_content, visible=True
                         )
-                    else:
+                        live_view_shown = True
+                    elif not live_view_shown:
                         html_content = f"<h1 style='width:{stream_vw}vw; height:{stream_vh}vh'>Waiting for browser session...</h1>"
                         update_dict[browser_view_comp] = gr.update(
                             value=html_content, visible=True
                         )
+                        live_view_shown = True
                 except Exception as e:
-                    logger.debug(f"Failed to capture screenshot: {e}")
+                    logger.debug(f"Failed to read live view frame: {e}")
                     update_dict[browser_view_comp] = gr.update(
                         value="<div style='...'>Error loading view...</div>",
                         visible=True,
@@ -818,12 +1001,15 @@ async def run_agent_task(
             if update_dict:
                 yield update_dict
 
-            await asyncio.sleep(0.1)  # Polling interval
+            # Refresh interval for chat/browser view; pause/resume/stop wake up immediately
+            await webui_manager.bu_agent.wait_for_control_change(
+                timeout=min(0.1, live_view.interval) if live_view is not None else 0.1
+            )
 
         # --- 7. Task Finalization ---
-        webui_manager.bu_agent.state.paused = False
-        webui_manager.bu_agent.state.stopped = False
+        webui_manager.bu_agent.reset_control()
         final_update = {}
+        recording_task = None
         try:
             logger.info("Agent task completing...")
             # Await the task ensure completion and catch exceptions if not already caught
@@ -833,15 +1019,33 @@ async def run_agent_task(
                 agent_task.result()  # Raise the exception to be caught below
             logger.info("Agent task completed processing.")
 
+            resource_blocker = getattr(webui_manager.bu_browser_context, "resource_blocker", None)
+            if resource_blocker is not None:
+                logger.info(f"🚫 资源拦截 ({resource_blocking}): {resource_blocker.stats.summary()}")
+
+            if storage_cache is not None and webui_manager.bu_browser_context:
+                # 成功时保存登录状态供后续任务复用，失败时检查注入的登录是否已失效
+                await storage_cache.capture(
+                    webui_manager.bu_browser_context,
+                    success=bool(webui_manager.bu_agent.state.history.is_successful()),
+                )
+
             logger.info(f"Explicitly saving agent history to: {history_file}")
             webui_manager.bu_agent.save_history(history_file)
 
             if os.path.exists(history_file):
                 final_update[history_file_comp] = gr.File(value=history_file)
 
-            if gif_path and os.path.exists(gif_path):
-                logger.info(f"GIF found at: {gif_path}")
-                final_update[gif_comp] = gr.Image(value=gif_path)
+            # 分阶段计时与历史 JSON 放在同一目录，便于跨任务查找慢阶段
+            timing_file = os.path.splitext(history_file)[0] + ".timing.json"
+            webui_manager.bu_agent.save_step_timings(timing_file)
+            if webui_manager.bu_agent.task_metrics:
+                final_update[step_timing_comp] = gr.update(
+                    value=_format_step_timing(webui_manager.bu_agent.task_metrics)
+                )
+
+            # Recording is generated in a background process pool; picked up after the final update
+            recording_task = webui_manager.bu_agent.recording_task
 
         except asyncio.CancelledError:
             logger.info("Agent task was cancelled.")
@@ -872,6 +1076,8 @@ async def run_agent_task(
 
         finally:
             webui_manager.bu_current_task = None  # Clear the task reference
+            if live_view is not None:
+                await live_view.stop()
 
             # Close browser/context if requested
             if should_close_browser_on_finish:
@@ -906,6 +1112,16 @@ async def run_agent_task(
             )
             yield final_update
 
+            # Notify the UI once the background recording is ready
+            if recording_task is not None:
+                recording_path = await recording_task
+                if recording_path and os.path.exists(recording_path):
+                    logger.info(f"Recording ready at: {recording_path}")
+                    if recording_path.endswith(".gif"):
+                        yield {gif_comp: gr.update(value=recording_path)}
+                    else:
+                        yield {video_comp: gr.update(value=recording_path, visible=True)}
+
     except Exception as e:
         # Catch errors during setup (before agent run starts)
         logger.error(f"Error setting up agent task: {e}", exc_info=True)
@@ -968,6 +1184,28 @@ async def handle_submit(
             yield update
 
 
+async def handle_resume_checkpoint(
+        webui_manager: WebuiManager, components: Dict[gr.components.Component, Any]
+):
+    """Handles clicks on the 'Resume Interrupted' button: continue the latest unfinished checkpoint."""
+    if webui_manager.bu_current_task and not webui_manager.bu_current_task.done():
+        gr.Info("Agent is currently running. Please wait or use Stop/Pause.")
+        yield {}
+        return
+
+    history_comp = webui_manager.id_to_component.get("browser_settings.save_agent_history_path")
+    history_dir = components.get(history_comp, "./tmp/agent_history") if history_comp else "./tmp/agent_history"
+    checkpoint_path = find_latest_checkpoint(history_dir)
+    if not checkpoint_path:
+        gr.Info("No interrupted task found to resume.")
+        yield {}
+        return
+
+    logger.info(f"Resuming interrupted task from checkpoint: {checkpoint_path}")
+    async for update in run_agent_task(webui_manager, components, resume_checkpoint=checkpoint_path):
+        yield update
+
+
 async def handle_stop(webui_manager: WebuiManager):
     """Handles clicks on the 'Stop' button."""
     logger.info("Stop button clicked.")
@@ -975,9 +1213,8 @@ async def handle_stop(webui_manager: WebuiManager):
     task = webui_manager.bu_current_task
 
     if agent and task and not task.done():
-        # Signal the agent to stop by setting its internal flag
-        agent.state.stopped = True
-        agent.state.paused = False  # Ensure not paused if stopped
+        # Signal the agent to stop; this also wakes it up if it is paused
+        agent.stop()
         return {
             webui_manager.get_component_by_id(
                 "browser_use_agent.stop_button"
@@ -1083,6 +1320,9 @@ async def handle_clear(webui_manager: WebuiManager):
         webui_manager.get_component_by_id("browser_use_agent.recording_gif"): gr.update(
             value=None
         ),
+        webui_manager.get_component_by_id("browser_use_agent.recording_video"): gr.update(
+            value=None, visible=False
+        ),
         webui_manager.get_component_by_id("browser_use_agent.browser_view"): gr.update(
             value="<div style='...'>Browser Cleared</div>"
         ),
@@ -1139,6 +1379,7 @@ def create_browser_use_agent_tab(webui_manager: WebuiManager):
                     value="等待中...",
                     visible=True
                 )
+            step_timing = gr.Markdown(value="")
         
         chatbot = gr.Chatbot(
             lambda: webui_manager.bu_chat_history,  # Load history dynamically
@@ -1165,6 +1406,9 @@ def create_browser_use_agent_tab(webui_manager: WebuiManager):
             clear_button = gr.Button(
                 "🗑️ Clear", interactive=True, variant="secondary", scale=2
             )
+            resume_button = gr.Button(
+                "🔄 Resume Interrupted", interactive=True, variant="secondary", scale=2
+            )
             run_button = gr.Button("▶️ Submit Task", variant="primary", scale=3)
 
         browser_view = gr.HTML(
@@ -1182,6 +1426,11 @@ def create_browser_use_agent_tab(webui_manager: WebuiManager):
                 interactive=False,
                 type="filepath",
             )
+            recording_video = gr.Video(
+                label="Task Recording Video",
+                interactive=False,
+                visible=False,
+            )
 
     # --- Store Components in Manager ---
     tab_components.update(
@@ -1190,15 +1439,18 @@ def create_browser_use_agent_tab(webui_manager: WebuiManager):
             user_input=user_input,
             clear_button=clear_button,
             run_button=run_button,
+            resume_button=resume_button,
             stop_button=stop_button,
             pause_resume_button=pause_resume_button,
             agent_history_file=agent_history_file,
             recording_gif=recording_gif,
+            recording_video=recording_video,
             browser_view=browser_view,
             step_progress=step_progress,
             max_steps_display=max_steps_display,
             failure_counter=failure_counter,
             step_status=step_status,
+            step_timing=step_timing,
         )
     )
     webui_manager.add_components(
@@ -1217,6 +1469,13 @@ def create_browser_use_agent_tab(webui_manager: WebuiManager):
         async for update in handle_submit(webui_manager, components_dict):
             yield update
 
+    async def resume_wrapper(
+            components_dict: Dict[Component, Any],
+    ) -> AsyncGenerator[Dict[Component, Any], None]:
+        """Wrapper for handle_resume_checkpoint that yields its results."""
+        async for update in handle_resume_checkpoint(webui_manager, components_dict):
+            yield update
+
     async def stop_wrapper() -> AsyncGenerator[Dict[Component, Any], None]:
         """Wrapper for handle_stop."""
         update_dict = await handle_stop(webui_manager)
@@ -1239,6 +1498,9 @@ def create_browser_use_agent_tab(webui_manager: WebuiManager):
     user_input.submit(
         fn=submit_wrapper, inputs=all_managed_components, outputs=run_tab_outputs
     )
+    resume_button.click(
+        fn=resume_wrapper, inputs=all_managed_components, outputs=run_tab_outputs
+    )
     stop_button.click(fn=stop_wrapper, inputs=None, outputs=run_tab_outputs)
     pause_resume_button.click(
         fn=pause_resume_wrapper, inputs=None, outputs=run_tab_outputs
@@ -69,6 +69,9 @@ async def run_deep_research(webui_manager: WebuiManager, components: Dict[Compon
     markdown_display_comp = webui_manager.get_component_by_id("deep_research_agent.markdown_display")
     markdown_download_comp = webui_manager.get_component_by_id("deep_research_agent.markdown_download")
     mcp_server_config_comp = webui_manager.get_component_by_id("deep_research_agent.mcp_server_config")
+    browser_pool_comp = webui_manager.get_component_by_id("deep_research_agent.use_browser_pool")
+    contexts_per_browser_comp = webui_manager.get_component_by_id("deep_research_agent.contexts_per_browser")
+    warm_http_cache_comp = webui_manager.get_component_by_id("deep_research_agent.warm_http_cache")
 
     # --- 1. Get Task and Settings ---
     task_topic = components.get(research_task_comp, "").strip()
@@ -143,6 +146,12 @@ async def run_deep_research(webui_manager: WebuiManager, components: Dict[Compon
             "user_data_dir": get_setting("browser_settings", "browser_user_data_dir"),
             "window_width": int(get_setting("browser_settings", "window_w", 1280)),
             "window_height": int(get_setting("browser_settings", "window_h", 1100)),
+            "use_browser_pool": bool(components.get(browser_pool_comp, False)),
+            "contexts_per_browser": int(components.get(contexts_per_browser_comp, 1) or 1),
+            "storage_state_cache": get_setting("browser_settings", "reuse_logins", False),
+            "resource_blocking": get_setting("browser_settings", "resource_blocking", "full"),
+            "http_cache": get_setting("browser_settings", "http_cache", False),
+            "warm_http_cache": bool(components.get(warm_http_cache_comp, False)),
             # Add other relevant fields if DeepResearchAgent accepts them
         }
 
@@ -154,6 +163,8 @@ async def run_deep_research(webui_manager: WebuiManager, components: Dict[Compon
                 mcp_server_config=mcp_config
             )
             logger.info("DeepResearchAgent initialized.")
+        else:
+            webui_manager.dr_agent.browser_config = browser_config_dict
 
         # --- 5. Start Agent Run ---
         agent_run_coro = webui_manager.dr_agent.run(
@@ -397,6 +408,15 @@ def create_deep_research_agent_tab(webui_manager: WebuiManager):
                                      interactive=True)
             max_query = gr.Textbox(label="Research Save Dir", value="./tmp/deep_research",
                                    interactive=True)
+            use_browser_pool = gr.Checkbox(label="Browser Pool", value=False,
+                                           info="Reuse pre-warmed browsers with a fresh context per search",
+                                           interactive=True)
+            contexts_per_browser = gr.Number(label="Contexts per Browser", value=1, precision=0,
+                                             info="With the browser pool, run up to this many agents in one browser process",
+                                             interactive=True)
+            warm_http_cache = gr.Checkbox(label="Warm HTTP Cache", value=False,
+                                          info="Keep the shared HTTP disk cache across research runs",
+                                          interactive=True)
     with gr.Row():
         stop_button = gr.Button("⏹️ Stop", variant="stop", scale=2)
         start_button = gr.Button("▶️ Run", variant="primary", scale=3)
@@ -408,6 +428,9 @@ def create_deep_research_agent_tab(webui_manager: WebuiManager):
             research_task=research_task,
             parallel_num=parallel_num,
             max_query=max_query,
+            use_browser_pool=use_browser_pool,
+            contexts_per_browser=contexts_per_browser,
+            warm_http_cache=warm_http_cache,
             start_button=start_button,
             stop_button=stop_button,
             markdown_display=markdown_display,
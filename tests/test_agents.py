@@ -394,7 +394,309 @@ async def test_deep_research_agent():
         print(e)
 
 
+def _replay_fixture():
+    """合成的 AgentOutput 模型与录制历史，每步一个 click_element 动作，最后一步 done"""
+    from browser_use.agent.views import ActionResult, AgentBrain, AgentHistory, AgentOutput
+    from browser_use.browser.views import BrowserStateHistory
+    from browser_use.controller.service import Controller
+
+    action_model = Controller().registry.create_action_model()
+    output_model = AgentOutput.type_with_custom_actions(action_model)
+
+    def item(url, title, action):
+        return AgentHistory(
+            model_output=output_model(
+                current_state=AgentBrain(evaluation_previous_goal="", memory="", next_goal=f"open {title}"),
+                action=[action_model(**action)],
+            ),
+            result=[ActionResult(extracted_content=f"visited {title}", include_in_memory=True)],
+            state=BrowserStateHistory(url=url, title=title, tabs=[], interacted_element=[None], screenshot=None),
+        )
+
+    pages = [(f"https://example.com/{name}", name.upper()) for name in "abc"]
+    recorded = AgentHistoryList(history=[
+        *(item(url, title, {"click_element": {"index": i}}) for i, (url, title) in enumerate(pages)),
+        item("https://example.com/c", "C", {"done": {"text": "finished", "success": True}}),
+    ])
+    return output_model, recorded, pages
+
+
+def _fake_agent(current_pages, failing_step=None):
+    """只带回放所需属性的 agent 替身，浏览器状态按 current_pages 依次返回"""
+    import types
+    from types import SimpleNamespace
+
+    from browser_use.agent.message_manager.service import MessageManager
+    from browser_use.agent.views import ActionResult, AgentState
+    from langchain_core.messages import SystemMessage
+
+    from src.agent.browser_use.browser_use_agent import BrowserUseAgent
+
+    pages = iter(current_pages)
+    agent = SimpleNamespace(state=AgentState(), callback_steps=[], made_items=[])
+
+    async def get_state(cache_clickable_elements_hashes=False):
+        url, title = next(pages)
+        return SimpleNamespace(url=url, title=title)
+
+    async def update_action_indices(historical_element, action, state):
+        return action
+
+    async def multi_act(actions):
+        step = len(agent.made_items) + 1
+        if step == failing_step:
+            return [ActionResult(error="element detached", include_in_memory=True)]
+        return [ActionResult(extracted_content=f"replayed {step}", include_in_memory=True)]
+
+    agent.browser_context = SimpleNamespace(get_state=get_state)
+    agent._update_action_indices = update_action_indices
+    agent.multi_act = multi_act
+    agent.register_new_step_callback = lambda state, output, n: agent.callback_steps.append(n)
+    agent._make_history_item = lambda output, state, result, metadata: agent.made_items.append(result)
+    agent._message_manager = MessageManager(task="replay", system_message=SystemMessage(content="system"))
+    agent._add_replayed_step_to_memory = types.MethodType(BrowserUseAgent._add_replayed_step_to_memory, agent)
+    return agent
+
+
+def test_replay_stops_on_divergence():
+    """
+    回放在页面偏离录制时停止；已回放步骤的结果按正常顺序进入消息历史，并逐步通知界面
+    """
+    from langchain_core.messages import AIMessage
+
+    from src.agent.browser_use.browser_use_agent import BrowserUseAgent
+
+    _, recorded, pages = _replay_fixture()
+    agent = _fake_agent(pages[:2] + [("https://example.com/other", "Other")])
+    replayed = asyncio.run(BrowserUseAgent._replay_recorded_steps(agent, recorded, max_steps=10))
+
+    assert replayed == 2 and agent.state.n_steps == 3
+    assert agent.callback_steps == [2, 3]
+    managed = agent._message_manager.state.history.messages
+    messages = [m.message for m in managed if m.metadata.message_type != "init"]
+    assert sum(isinstance(m, AIMessage) for m in messages) == 2
+    # 第一步的结果在第二步的模型输出之前；最后一步的结果留给 LLM 的第一步写入
+    assert any(m.content == "Action result: replayed 1" for m in messages)
+    assert not any(m.content == "Action result: replayed 2" for m in messages)
+    assert agent.state.last_result[0].extracted_content == "replayed 2"
+    assert "前 2 步" in agent.state.last_result[-1].extracted_content
+
+    # 执行失败的步骤同样计入回放步数，LLM 循环不会超出 max_steps
+    agent = _fake_agent(pages, failing_step=2)
+    replayed = asyncio.run(BrowserUseAgent._replay_recorded_steps(agent, recorded, max_steps=10))
+    assert replayed == 2 and len(agent.made_items) == 2
+    assert agent.state.last_result[0].error == "element detached"
+
+    # 至少给 LLM 留一步
+    agent = _fake_agent(pages)
+    assert asyncio.run(BrowserUseAgent._replay_recorded_steps(agent, recorded, max_steps=2)) == 1
+
+
+def test_replay_store_round_trip():
+    """
+    回放录制按规范化任务与起始 URL 命中，URL 与标题偏离时给出原因
+    """
+    import tempfile
+    from types import SimpleNamespace
+
+    from src.agent.browser_use.replay import ReplayStore, verify_replay_step
+
+    output_model, recorded, _ = _replay_fixture()
+    with tempfile.TemporaryDirectory() as store_dir:
+        store = ReplayStore(store_dir)
+        assert store.save("Open  the Pages", "https://Example.com/#top", recorded)
+        loaded = store.load("open the pages", "https://example.com", output_model)
+        assert loaded is not None and len(loaded.history) == len(recorded.history)
+        assert store.load("another task", "https://example.com", output_model) is None
+
+    first = recorded.history[0]
+    assert verify_replay_step(first, SimpleNamespace(url="https://example.com/a/", title="A")) is None
+    assert "URL" in verify_replay_step(first, SimpleNamespace(url="https://example.com/b", title="A"))
+    assert "标题" in verify_replay_step(first, SimpleNamespace(url="https://example.com/a", title="Login"))
+
+
+def test_loop_detection():
+    """
+    长度 1-4 的周期在第 3 次重复时被检测到；恢复提示无效时提前停止并记录节省的步数
+    """
+    from types import SimpleNamespace
+
+    from browser_use.agent.views import AgentState
+
+    from src.agent.browser_use.browser_use_agent import BrowserUseAgent
+    from src.agent.browser_use.loop_detection import LoopDetectionSettings, LoopDetector
+
+    def state(i):
+        return SimpleNamespace(url=f"https://example.com/{i}", selector_map={})
+
+    for period in range(1, 5):
+        detector = LoopDetector(LoopDetectionSettings(min_repeats=3))
+        detections = [
+            detector.observe(state(i % period), [{"click_element": {"index": i % period}}]) for i in range(3 * period)
+        ]
+        assert all(d is None for d in detections[:-1])
+        assert detections[-1].cycle_length == period and detections[-1].repeats == 3
+        assert detections[-1].step == 3 * period
+        assert detector.stats.cycle_lengths == [period]
+
+    # 没有重复的步骤、超过 max_cycle_length 的周期都不算循环
+    detector = LoopDetector(LoopDetectionSettings(max_cycle_length=3))
+    assert all(detector.observe(state(i % 5), [{"scroll_down": {}}]) is None for i in range(30))
+    assert all(detector.observe(state(100 + i), [{"scroll_down": {}}]) is None for i in range(30))
+
+    detector = LoopDetector(LoopDetectionSettings(max_recoveries=1))
+    agent = SimpleNamespace(loop_detector=detector, state=AgentState())
+    detection = next(filter(None, (detector.observe(state(0), [{"go_back": {}}]) for _ in range(3))))
+    assert BrowserUseAgent._handle_detected_loop(agent, detection, step=2, max_steps=20) is False
+    assert "检测到循环" in agent.state.last_result[-1].extracted_content
+    assert BrowserUseAgent._handle_detected_loop(agent, detection, step=5, max_steps=20) is True
+    assert detector.stats.stopped_early and detector.stats.steps_saved == 14
+    assert agent.state.history.history[-1].result[0].error
+
+
+def test_planner_schedule():
+    """
+    初次、动作失败、进入新域名、子目标停滞与到达间隔时重新规划，其余步骤复用计划
+    """
+    from browser_use.agent.views import ActionResult
+
+    from src.agent.browser_use.planner_scheduler import (
+        REASON_FAILURE, REASON_INITIAL, REASON_INTERVAL, REASON_NEW_DOMAIN, REASON_STALLED,
+        PlannerScheduler, PlannerScheduleSettings,
+    )
+
+    scheduler = PlannerScheduler(PlannerScheduleSettings(interval=3, stall_steps=2))
+    url = "https://example.com/a"
+    assert scheduler.replan_reason(1, None, url, []) == REASON_INITIAL
+    scheduler.record_plan(1, url, REASON_INITIAL)
+    assert scheduler.replan_reason(2, [ActionResult(extracted_content="ok")], url, ["a"]) is None
+    scheduler.record_skip()
+    assert scheduler.replan_reason(2, [ActionResult(error="boom")], url, ["a"]) == REASON_FAILURE
+    assert scheduler.replan_reason(2, None, "https://other.org/", ["a"]) == REASON_NEW_DOMAIN
+    assert scheduler.replan_reason(2, None, url, ["Find price", " find  PRICE "]) == REASON_STALLED
+    # 同一个停滞子目标只触发一次
+    assert scheduler.replan_reason(3, None, url, ["find price", "find price"]) is None
+    assert scheduler.replan_reason(4, None, url, ["b"]) == REASON_INTERVAL
+    assert scheduler.stats.planner_calls == 1 and scheduler.stats.planner_calls_avoided == 1
+
+
+def test_history_compaction():
+    """
+    超过预算时旧步骤被压缩为记忆块，只保留最近 N 步，tool_call 与 ToolMessage 保持成对
+    """
+    from browser_use.agent.message_manager.service import MessageManager
+    from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, ToolMessage
+
+    from src.agent.browser_use.history_compaction import (
+        MEMORY_MESSAGE_TYPE, HistoryCompactionSettings, HistoryCompactor,
+    )
+
+    output_model, recorded, _ = _replay_fixture()
+    manager = MessageManager(task="compact", system_message=SystemMessage(content="system"))
+    for step in range(8):
+        manager._add_message_with_tokens(HumanMessage(content=f"Action result: page {step} " + "lorem " * 200))
+        manager.add_model_output(recorded.history[step % 3].model_output)
+
+    compactor = HistoryCompactor(None, HistoryCompactionSettings(keep_recent_steps=2, target_tokens=1000))
+    tokens_before = manager.state.history.current_tokens
+    assert asyncio.run(compactor.maybe_compact(manager, step_number=9))
+
+    managed = manager.state.history.messages
+    messages = [m.message for m in managed]
+    assert sum(m.metadata.message_type == MEMORY_MESSAGE_TYPE for m in managed) == 1
+    # 初始消息中的示例 tool_call 不参与压缩
+    assert sum(isinstance(m.message, AIMessage) and m.metadata.message_type != "init" for m in managed) == 2
+    for i, message in enumerate(messages):
+        if isinstance(message, AIMessage):
+            assert isinstance(messages[i + 1], ToolMessage)
+    assert compactor.stats.token_curve == [(9, tokens_before, manager.state.history.current_tokens)]
+    assert compactor.stats.tokens_saved() > 0
+
+    # 只剩最近 N 步时不再压缩，只记录曲线
+    assert not asyncio.run(compactor.maybe_compact(manager, step_number=10))
+    assert compactor.stats.compactions == 1 and len(compactor.stats.token_curve) == 2
+
+
+def test_checkpoint_round_trip():
+    """
+    写入三步断点后从文件恢复：历史、步数与消息管理器状态与写入时一致，崩溃残留的半行被忽略；
+    每步只追加新增消息（压缩改写旧消息时从变化处重写），存储状态加密保存
+    """
+    import json
+    import tempfile
+    from types import SimpleNamespace
+
+    from browser_use.agent.message_manager.service import MessageManager
+    from browser_use.agent.views import ActionResult, AgentState
+    from cryptography.fernet import Fernet
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    from src.agent.browser_use.browser_use_agent import BrowserUseAgent
+    from src.agent.browser_use.checkpoint import CheckpointWriter, load_checkpoint, storage_path_for
+
+    output_model, recorded, _ = _replay_fixture()
+    manager = MessageManager(task="checkpoint", system_message=SystemMessage(content="system"))
+    storage_state = {"cookies": [{"name": "sid", "value": "secret-session", "domain": "example.com", "path": "/"}],
+                     "origins": []}
+
+    previous_key = os.environ.get("STORAGE_STATE_KEY")
+    os.environ["STORAGE_STATE_KEY"] = Fernet.generate_key().decode()
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "run.checkpoint.jsonl")
+            writer = CheckpointWriter(path)
+            writer.start("checkpoint", "agent-1", max_steps=10)
+            for step in range(3):
+                if step == 2:
+                    # 模拟历史压缩：最后一条消息被改写
+                    manager.state.history.messages[-1].message = HumanMessage(content="compacted")
+                manager.add_model_output(recorded.history[step].model_output)
+                history = AgentHistoryList(history=recorded.history[:step + 1])
+                writer.write_step(history, manager.state, step + 2, 0, [ActionResult(extracted_content="ok")],
+                                  f"https://example.com/{step}", [], storage_state)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write('{"type": "step", "n_st')
+
+            with open(path, encoding="utf-8") as f:
+                records = [json.loads(line) for line in f.read().splitlines()[1:-1]]
+            assert [len(r["messages_added"]) for r in records] == [len(manager.state.history.messages) - 4, 2, 3]
+            assert all("storage_state" not in r for r in records)
+            with open(storage_path_for(path), "rb") as f:
+                assert b"secret-session" not in f.read()
+
+            checkpoint = load_checkpoint(path)
+            assert checkpoint.task == "checkpoint" and not checkpoint.finished
+            assert len(checkpoint.history_items) == 3 and checkpoint.completed_steps == 3
+            assert checkpoint.url == "https://example.com/2" and checkpoint.storage_state == storage_state
+
+            restored = MessageManager(task="checkpoint", system_message=SystemMessage(content="system"))
+
+            async def restore_browser_state(checkpoint):
+                pass
+
+            agent = SimpleNamespace(AgentOutput=output_model, state=AgentState(), _message_manager=restored,
+                                    _restore_browser_state=restore_browser_state)
+            assert asyncio.run(BrowserUseAgent.restore_checkpoint(agent, path)) is not None
+    finally:
+        if previous_key is None:
+            os.environ.pop("STORAGE_STATE_KEY", None)
+        else:
+            os.environ["STORAGE_STATE_KEY"] = previous_key
+
+    assert agent._resumed_steps == 3 and agent.state.n_steps == 4
+    assert agent.state.history.history[2].model_output.action == recorded.history[2].model_output.action
+    assert agent._message_manager.state is agent.state.message_manager_state
+    assert [m.message for m in restored.state.history.messages] == [m.message for m in manager.state.history.messages]
+    assert restored.state.tool_id == manager.state.tool_id
+
+
 if __name__ == "__main__":
     asyncio.run(test_browser_use_agent())
     # asyncio.run(test_browser_use_parallel())
     # asyncio.run(test_deep_research_agent())
+    # test_replay_stops_on_divergence()
+    # test_replay_store_round_trip()
+    # test_loop_detection()
+    # test_planner_schedule()
+    # test_history_compaction()
+    # test_checkpoint_round_trip()
@@ -0,0 +1,642 @@
+import asyncio
+import functools
+import http.server
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.append(".")
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+FIXTURE_HTML = """<!DOCTYPE html>
+<html>
+<head><title>Fixture Shop</title></head>
+<body>
+  <nav>{nav}</nav>
+  <form id="search">
+    <input name="q" placeholder="Search products">
+    <button type="button" onclick="document.getElementById('status').innerHTML='<a href=#done>Results ready</a>'">Search</button>
+  </form>
+  <div id="status"></div>
+  <ul>{items}</ul>
+</body>
+</html>
+"""
+
+
+def start_fixture_server():
+    """Serve a local fixture site from a temp dir, returns (base_url, server)"""
+    fixture_dir = tempfile.mkdtemp(prefix="webui_fixture_")
+    nav = "".join(f'<a href="/category/{i}">Category {i}</a>' for i in range(20))
+    items = "".join(
+        f'<li><a href="/item/{i}">Item {i}</a> <button type="button">Add to cart {i}</button></li>' for i in range(60)
+    )
+    with open(os.path.join(fixture_dir, "index.html"), "w", encoding="utf-8") as f:
+        f.write(FIXTURE_HTML.format(nav=nav, items=items))
+
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=fixture_dir)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}", server
+
+
+async def test_dom_delta_token_reduction():
+    from browser_use.browser.browser import BrowserConfig
+    from browser_use.browser.context import BrowserContextConfig
+
+    from src.browser.custom_browser import CustomBrowser
+
+    base_url, server = start_fixture_server()
+    browser = CustomBrowser(config=BrowserConfig(headless=True))
+    context = await browser.new_context(config=BrowserContextConfig(window_width=1280, window_height=1100))
+    try:
+        page = await context.get_current_page()
+        await page.goto(f"{base_url}/index.html")
+        state = await context.get_state(cache_clickable_elements_hashes=False)
+        context.dom_delta_tracker.set_baseline(state)
+        full_tokens_first = len(state.element_tree.clickable_elements_to_string()) // 3
+
+        # Small change: the search button only fills the status div
+        await page.click("text=Search")
+        state = await context.get_state(cache_clickable_elements_hashes=False)
+        delta = context.last_dom_delta
+        full_tokens = len(state.element_tree.clickable_elements_to_string()) // 3
+        delta_tokens = len(delta.to_text()) // 3
+
+        print(f"Elements: {delta.total_elements}, delta size: {delta.size}")
+        print(f"Full element list: {full_tokens_first} -> {full_tokens} tokens")
+        print(f"Delta: {delta_tokens} tokens ({1 - delta_tokens / max(full_tokens, 1):.0%} reduction)")
+        print(delta.to_text())
+        assert delta.is_small(max_ratio=0.3, max_elements=40)
+    finally:
+        await context.close()
+        await browser.close()
+        server.shutdown()
+
+
+async def test_content_extraction_cache():
+    import time
+
+    from src.utils.content_cache import ContentCacheSettings, ContentExtractionCache
+
+    rows = "".join(f"<tr><td>Row {i}</td><td><a href='/r/{i}'>detail {i}</a></td></tr>" for i in range(5000))
+    html = f"<html><body><h1>Report</h1><table>{rows}</table></body></html>"
+    cache = ContentExtractionCache(ContentCacheSettings(max_bytes=8 * 1024 * 1024))
+
+    start = time.perf_counter()
+    first = await cache.markdown("https://example.com/report?utm_source=x", html, ["a", "img"])
+    miss_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    second = await cache.markdown("https://example.com/report", html, ["a", "img"])
+    hit_seconds = time.perf_counter() - start
+    print(f"Markdown: {len(first)} chars, miss {miss_seconds * 1000:.1f}ms, hit {hit_seconds * 1000:.3f}ms")
+    assert first == second
+    assert cache.stats.markdown_hits == 1 and cache.stats.markdown_misses == 1
+    # 只去掉跟踪参数，其余查询参数仍区分页面
+    assert cache.markdown_key("https://example.com/report?page=2&fbclid=y", html) != cache.markdown_key(
+        "https://example.com/report", html)
+
+    # 页面内容变化后重新转换
+    await cache.markdown("https://example.com/report", html.replace("Report", "Report v2"), ["a", "img"])
+    assert cache.stats.markdown_misses == 2
+
+    key = cache.extraction_key(first, "list all rows", "gpt-4o")
+    assert cache.get_extraction(key) is None
+    cache.put_extraction(key, "5000 rows")
+    assert cache.get_extraction(key) == "5000 rows"
+    assert cache.get_extraction(cache.extraction_key(first, "list all rows", "other-model")) is None
+
+    # 字节上限内按 LRU 淘汰
+    small = ContentExtractionCache(ContentCacheSettings(max_bytes=len(first.encode("utf-8")) + 100))
+    await small.markdown("https://example.com/a", html, ["a", "img"])
+    await small.markdown("https://example.com/b", html.replace("Report", "Other"), ["a", "img"])
+    assert small.stats.evictions == 1 and small.size_bytes <= small.settings.max_bytes
+    print(cache.stats.summary())
+    cache.shutdown()
+    small.shutdown()
+
+
+async def test_browser_pool_latency():
+    """
+    每个“查询”打开一个独立上下文访问本地页面后关闭，比较每次新启动浏览器与使用预热浏览器池的单次耗时
+    """
+    import time
+
+    from browser_use.browser.browser import BrowserConfig
+    from browser_use.browser.context import BrowserContextConfig
+
+    from src.browser.browser_pool import BrowserPool, BrowserPoolSettings
+    from src.browser.custom_browser import CustomBrowser
+
+    base_url, server = start_fixture_server()
+    browser_config = BrowserConfig(headless=True)
+    context_config = BrowserContextConfig(window_width=1280, window_height=1100)
+    queries = 5
+
+    async def visit(context):
+        page = await context.get_current_page()
+        await page.goto(f"{base_url}/index.html")
+        return await page.title()
+
+    cold = []
+    for _ in range(queries):
+        start = time.perf_counter()
+        browser = CustomBrowser(config=browser_config)
+        context = await browser.new_context(config=context_config)
+        try:
+            assert await visit(context) == "Fixture Shop"
+        finally:
+            await context.close()
+            await browser.close()
+        cold.append(time.perf_counter() - start)
+
+    pool = BrowserPool(browser_config, BrowserPoolSettings(min_size=1, max_size=2, max_uses=3))
+    await pool.start()
+    pooled = []
+    try:
+        for i in range(queries):
+            start = time.perf_counter()
+            async with await pool.acquire(context_config) as lease:
+                assert await visit(lease.context) == "Fixture Shop"
+                # 上下文相互隔离：上一次租用写入的 cookie 不可见
+                page = await lease.context.get_current_page()
+                assert "visited" not in await page.evaluate("document.cookie")
+                await page.evaluate("document.cookie = 'visited=1'")
+            pooled.append(time.perf_counter() - start)
+        print(f"Per query without pool: {sum(cold) / queries:.2f}s, with pool: {sum(pooled) / queries:.2f}s")
+        print(pool.stats.summary())
+        # 每个浏览器最多租用 3 次，5 次查询至少回收一次
+        assert pool.stats.recycled >= 1
+        assert sum(pooled) < sum(cold)
+    finally:
+        await pool.close()
+        server.shutdown()
+
+
+async def test_context_multiplexing_memory():
+    """
+    模拟 6 个并发 agent 各自打开本地页面，比较每个 agent 一个浏览器进程与共享一个进程时的每 agent 内存（PSS）
+    """
+    from browser_use.browser.browser import BrowserConfig
+    from browser_use.browser.context import BrowserContextConfig
+
+    from src.browser.browser_pool import BrowserPool, BrowserPoolSettings
+
+    base_url, server = start_fixture_server()
+    browser_config = BrowserConfig(headless=True)
+    context_config = BrowserContextConfig(window_width=1280, window_height=1100)
+    agents = 6
+
+    async def measure(contexts_per_browser: int) -> float:
+        pool = BrowserPool(browser_config, BrowserPoolSettings(
+            min_size=1, max_size=agents, contexts_per_browser=contexts_per_browser))
+        leases = await asyncio.gather(*(pool.acquire(context_config) for _ in range(agents)))
+        try:
+            for lease in leases:
+                page = await lease.context.get_current_page()
+                await page.goto(f"{base_url}/index.html")
+                await page.evaluate(f"localStorage.setItem('agent', '{lease.context.context_id}')")
+            # 同一进程内的上下文存储互相隔离
+            for lease in leases:
+                page = await lease.context.get_current_page()
+                assert await page.evaluate("localStorage.getItem('agent')") == lease.context.context_id
+            usages = await asyncio.gather(*(p.browser.memory_usage_mb(proportional=True) for p in pool._browsers))
+            total = sum(usage or 0 for usage in usages)
+            print(f"contexts_per_browser={contexts_per_browser}: {pool.size} browser process(es), "
+                  f"{total:.0f}MB total, {total / agents:.0f}MB per agent")
+            return total / agents
+        finally:
+            for lease in leases:
+                await lease.release()
+            await pool.close()
+
+    try:
+        separate = await measure(1)
+        shared = await measure(agents)
+        print(f"Memory per concurrent agent: {separate:.0f}MB -> {shared:.0f}MB")
+        assert shared < separate
+    finally:
+        server.shutdown()
+
+
+async def test_storage_state_cache():
+    """
+    在本地页面写入 cookie 与 localStorage，成功运行后保存；新上下文注入后直接可见，
+    服务端（此处用脚本模拟）清除 cookie 且运行失败时该站点失效
+    """
+    from browser_use.browser.browser import BrowserConfig
+    from browser_use.browser.context import BrowserContextConfig
+
+    from src.browser.custom_browser import CustomBrowser
+    from src.browser.storage_state_cache import StorageStateCache, StorageStateCacheSettings
+
+    base_url, server = start_fixture_server()
+    cache_dir = tempfile.mkdtemp(prefix="webui_storage_state_")
+    cache = StorageStateCache(StorageStateCacheSettings(cache_dir=cache_dir))
+    browser = CustomBrowser(config=BrowserConfig(headless=True))
+    context_config = BrowserContextConfig(window_width=1280, window_height=1100)
+
+    async def open_page():
+        context = await browser.new_context(config=context_config)
+        await cache.inject(context)
+        page = await context.get_current_page()
+        await page.goto(f"{base_url}/index.html")
+        return context, page
+
+    try:
+        context, page = await open_page()
+        await page.evaluate("document.cookie = 'session=secret-token; max-age=3600'; localStorage.setItem('user', 'alice')")
+        assert await cache.capture(context, success=True) == 1
+        await context.close()
+        for name in os.listdir(cache_dir):
+            with open(os.path.join(cache_dir, name), "rb") as f:
+                assert b"secret-token" not in f.read()
+
+        # 新上下文无需再次“登录”
+        context, page = await open_page()
+        assert "session=secret-token" in await page.evaluate("document.cookie")
+        assert await page.evaluate("localStorage.getItem('user')") == "alice"
+        # 状态未变化时不重写
+        assert await cache.capture(context, success=True) == 0 and cache.stats.unchanged == 1
+        await context.close()
+
+        # 登录失效：注入的 cookie 被清除且运行失败
+        context, page = await open_page()
+        await page.evaluate("document.cookie = 'session=; max-age=0'")
+        await cache.capture(context, success=False)
+        await context.close()
+        assert cache.stats.invalidated == 1 and cache.load() == []
+
+        # 条目超过 max_age 视为过期
+        context, page = await open_page()
+        await page.evaluate("document.cookie = 'session=secret-token; max-age=3600'")
+        await cache.capture(context, success=True)
+        await context.close()
+        cache.settings.max_age = 0
+        assert cache.load() == [] and cache.stats.expired == 1
+        print(cache.stats.summary())
+    finally:
+        await browser.close()
+        server.shutdown()
+
+
+def _noise_png(width: int, height: int) -> bytes:
+    """Uncompressible PNG so blocked images have a realistic size"""
+    import struct
+    import zlib
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    rows = b"".join(b"\x00" + os.urandom(width * 3) for _ in range(height))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b"")
+
+
+async def test_resource_blocking():
+    """
+    本地媒体页面（30 张图片、样式表、一张经 localhost 加载的第三方图片），比较 full 与 text-only 的加载耗时与拦截数，
+    并检查截图前恢复后图片全部可见、导航到新页面后重新拦截
+    """
+    import time
+
+    from browser_use.browser.browser import BrowserConfig
+    from browser_use.browser.context import BrowserContextConfig
+
+    from src.browser.custom_browser import CustomBrowser
+    from src.browser.resource_blocking import ResourceBlockingSettings
+
+    base_url, server = start_fixture_server()
+    fixture_dir = server.RequestHandlerClass.keywords["directory"]
+    os.makedirs(os.path.join(fixture_dir, "img"), exist_ok=True)
+    for i in range(30):
+        with open(os.path.join(fixture_dir, "img", f"{i}.png"), "wb") as f:
+            f.write(_noise_png(256, 256))
+    with open(os.path.join(fixture_dir, "style.css"), "w", encoding="utf-8") as f:
+        f.write("img { width: 64px; height: 64px; }")
+    images = "".join(f'<img src="/img/{i}.png">' for i in range(30))
+    with open(os.path.join(fixture_dir, "media.html"), "w", encoding="utf-8") as f:
+        f.write(
+            f'<html><head><link rel="stylesheet" href="/style.css"></head><body>{images}'
+            "<script>const img = new Image(); img.src = location.origin.replace('127.0.0.1', 'localhost') + '/img/0.png';"
+            " document.body.appendChild(img);</script></body></html>"
+        )
+    # 第二个页面使用不同的图片 URL，避免命中恢复后已加载的图片
+    next_images = "".join(f'<img src="/img/{i}.png?page=2">' for i in range(30))
+    with open(os.path.join(fixture_dir, "media2.html"), "w", encoding="utf-8") as f:
+        f.write(f"<html><body>{next_images}</body></html>")
+
+    browser = CustomBrowser(config=BrowserConfig(headless=True))
+    context_config = BrowserContextConfig(window_width=1280, window_height=1100)
+
+    async def load(settings):
+        context = await browser.new_context(config=context_config)
+        await context.configure_resource_blocking(settings)
+        page = await context.get_current_page()
+        start = time.perf_counter()
+        await page.goto(f"{base_url}/media.html", wait_until="networkidle")
+        return context, page, time.perf_counter() - start
+
+    try:
+        context, _, full_seconds = await load(ResourceBlockingSettings(preset="full"))
+        assert context.resource_blocker is None
+        await context.close()
+
+        context, page, text_seconds = await load(ResourceBlockingSettings(preset="text-only"))
+        stats = context.resource_blocker.stats
+        print(f"networkidle load: full {full_seconds * 1000:.0f}ms, text-only {text_seconds * 1000:.0f}ms")
+        print(stats.summary())
+        assert stats.blocked >= 31 and stats.bytes_saved > 0
+        assert await page.evaluate("[...document.images].every(i => i.naturalWidth === 0)")
+
+        # 视觉步骤前恢复被拦截的图片
+        await context.prepare_for_screenshot()
+        assert await page.evaluate("[...document.images].every(i => i.naturalWidth > 0)")
+        assert stats.visual_restores == 1
+
+        # 恢复只对当前文档有效，导航后图片重新被拦截
+        blocked = stats.blocked
+        await page.goto(f"{base_url}/media2.html", wait_until="networkidle")
+        assert stats.blocked >= blocked + 30
+        assert await page.evaluate("[...document.images].every(i => i.naturalWidth === 0)")
+        await context.close()
+
+        context, _, _ = await load(ResourceBlockingSettings(preset="full", block_third_party=True))
+        assert context.resource_blocker.stats.blocked_by_reason == {"third_party": 1}
+        await context.close()
+
+        # 只有 URL 模式时只为这些模式注册路由
+        context, page, _ = await load(ResourceBlockingSettings(block_patterns=["*://localhost:*/img/*"]))
+        assert context.resource_blocker.route_url != "**/*"
+        assert context.resource_blocker.stats.blocked_by_reason == {"pattern": 1}
+        assert context.resource_blocker.stats.requests == 1
+        await context.close()
+    finally:
+        await browser.close()
+        server.shutdown()
+
+    # 拦截关闭浏览器 HTTP 缓存的代价：同一上下文重复访问带 Cache-Control 的页面
+    static_url, static_server = start_static_fixture_server()
+
+    async def revisit(settings, http_cache=None):
+        revisit_browser = CustomBrowser(config=BrowserConfig(headless=True))
+        revisit_browser.configure_http_cache(http_cache)
+        try:
+            context = await revisit_browser.new_context(config=context_config)
+            await context.configure_resource_blocking(settings)
+            page = await context.get_current_page()
+            await page.goto(f"{static_url}/index.html", wait_until="load")
+            start = time.perf_counter()
+            await page.goto(f"{static_url}/index.html?again", wait_until="load")
+            seconds = time.perf_counter() - start
+            await context.close()
+            return seconds
+        finally:
+            await revisit_browser.close()
+
+    try:
+        from src.browser.http_cache import HttpCacheSettings
+
+        no_media = ResourceBlockingSettings(preset="no-media")
+        plain = await revisit(None)
+        blocked = await revisit(no_media)
+        blocked_cached = await revisit(no_media, HttpCacheSettings(cache_dir=tempfile.mkdtemp(prefix="webui_http_cache_")))
+        print(f"repeat visit: no blocking {plain * 1000:.0f}ms, no-media {blocked * 1000:.0f}ms, "
+              f"no-media + HTTP cache {blocked_cached * 1000:.0f}ms")
+        assert blocked_cached < blocked
+    finally:
+        static_server.shutdown()
+
+
+async def test_live_screencast():
+    """
+    静态页面几乎不推送帧；每 50ms 变化的页面在 5fps 限制下由 Chrome 限速，慢客户端只拿到最新帧，
+    并与每 100ms 调用 take_screenshot 的旧方式比较传输量
+    """
+    import time
+
+    from browser_use.browser.browser import BrowserConfig
+    from browser_use.browser.context import BrowserContextConfig
+
+    from src.browser.custom_browser import CustomBrowser
+    from src.browser.screencast import LiveScreencast, ScreencastSettings
+
+    base_url, server = start_fixture_server()
+    browser = CustomBrowser(config=BrowserConfig(headless=True))
+    context = await browser.new_context(config=BrowserContextConfig(window_width=1280, window_height=1100))
+    duration = 3.0
+
+    async def consume(live_view, poll_interval):
+        frames = 0
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            if await live_view.latest_frame():
+                frames += 1
+            await asyncio.sleep(poll_interval)
+        return frames
+
+    try:
+        page = await context.get_current_page()
+        await page.goto(f"{base_url}/index.html")
+
+        static_view = LiveScreencast(context, ScreencastSettings(fps=5))
+        static_frames = await consume(static_view, 0.1)
+        await static_view.stop()
+        print(f"Static page: {static_view.stats.summary()}")
+        assert static_frames <= 3
+
+        await page.evaluate("setInterval(() => { document.getElementById('status').textContent = Date.now(); }, 50)")
+        live_view = LiveScreencast(context, ScreencastSettings(fps=5, quality=50))
+        slow_frames = await consume(live_view, 0.5)
+        await live_view.stop()
+        print(f"Animated page, slow client: {live_view.stats.summary()}")
+        assert slow_frames <= duration / 0.5 + 1
+        assert live_view.stats.frames_received <= duration * 5 + 3
+
+        polled_bytes = 0
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            polled_bytes += len(await context.take_screenshot())
+            await asyncio.sleep(0.1)
+        print(f"Bytes to client over {duration:.0f}s: polling {polled_bytes / 1024:.0f} KB, "
+              f"screencast {live_view.stats.bytes_delivered / 1024:.0f} KB")
+        assert live_view.stats.bytes_delivered < polled_bytes
+    finally:
+        await context.close()
+        await browser.close()
+        server.shutdown()
+
+
+def start_static_fixture_server(latency: float = 0.05):
+    """Fixture page with 20 scripts/stylesheets/images served with Cache-Control and per-request latency"""
+    import time
+
+    fixture_dir = tempfile.mkdtemp(prefix="webui_static_fixture_")
+    os.makedirs(os.path.join(fixture_dir, "static"), exist_ok=True)
+    assets = []
+    for i in range(20):
+        with open(os.path.join(fixture_dir, "static", f"lib{i}.js"), "w", encoding="utf-8") as f:
+            f.write(f"window.lib{i} = '{'x' * 20000}';")
+        with open(os.path.join(fixture_dir, "static", f"style{i}.css"), "w", encoding="utf-8") as f:
+            f.write(f".c{i} {{ color: #{i:06x}; }}" * 500)
+        with open(os.path.join(fixture_dir, "static", f"img{i}.png"), "wb") as f:
+            f.write(_noise_png(128, 128))
+        assets.append(f'<script src="/static/lib{i}.js"></script><link rel="stylesheet" href="/static/style{i}.css">'
+                      f'<img src="/static/img{i}.png">')
+    with open(os.path.join(fixture_dir, "index.html"), "w", encoding="utf-8") as f:
+        f.write(f"<html><head><title>Static Fixture</title></head><body>{''.join(assets)}</body></html>")
+
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=fixture_dir, **kwargs)
+
+        def do_GET(self):
+            time.sleep(latency)
+            super().do_GET()
+
+        def end_headers(self):
+            if self.path.startswith("/static/"):
+                self.send_header("Cache-Control", "public, max-age=3600")
+            super().end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}", server
+
+
+async def test_http_disk_cache():
+    """
+    每次访问都使用新的上下文，比较无缓存、共享磁盘缓存（同一浏览器）与 warm 缓存（新浏览器、跨运行）下的重复访问加载时间
+    """
+    import time
+
+    from browser_use.browser.browser import BrowserConfig
+    from browser_use.browser.context import BrowserContextConfig
+
+    from src.browser.custom_browser import CustomBrowser
+    from src.browser.http_cache import HttpCacheSettings
+
+    base_url, server = start_static_fixture_server()
+    cache_dir = tempfile.mkdtemp(prefix="webui_http_cache_")
+    context_config = BrowserContextConfig(window_width=1280, window_height=1100)
+
+    async def visit(browser, set_cookie=False):
+        context = await browser.new_context(config=context_config)
+        try:
+            page = await context.get_current_page()
+            start = time.perf_counter()
+            await page.goto(f"{base_url}/index.html", wait_until="load")
+            seconds = time.perf_counter() - start
+            assert await page.title() == "Static Fixture"
+            assert await page.evaluate("window.lib19.length") == 20000
+            # 缓存共享不影响上下文隔离
+            assert "visited" not in await page.evaluate("document.cookie")
+            if set_cookie:
+                await page.evaluate("document.cookie = 'visited=1'")
+            return seconds
+        finally:
+            await context.close()
+
+    async def run(settings, visits=3):
+        browser = CustomBrowser(config=BrowserConfig(headless=True))
+        browser.configure_http_cache(settings)
+        try:
+            timings = [await visit(browser, set_cookie=True) for _ in range(visits)]
+            stats = browser.http_cache.stats.summary() if browser.http_cache else ""
+            return timings, stats
+        finally:
+            await browser.close()
+
+    try:
+        plain, _ = await run(None)
+        shared, shared_stats = await run(HttpCacheSettings(cache_dir=cache_dir, max_bytes=64 * 1024 * 1024))
+        await run(HttpCacheSettings(cache_dir=cache_dir, warm=True), visits=1)
+        warm, warm_stats = await run(HttpCacheSettings(cache_dir=cache_dir, warm=True), visits=1)
+        print(f"No cache:     {', '.join(f'{t * 1000:.0f}ms' for t in plain)}")
+        print(f"Shared cache: {', '.join(f'{t * 1000:.0f}ms' for t in shared)} ({shared_stats})")
+        print(f"Warm cache, new browser first visit: {warm[0] * 1000:.0f}ms ({warm_stats})")
+        assert sum(shared[1:]) / 2 < sum(plain[1:]) / 2
+        assert warm[0] < plain[0]
+        # 临时缓存随浏览器关闭删除，warm 缓存保留
+        assert not [name for name in os.listdir(cache_dir) if name.startswith("run-")]
+        assert any(name.endswith(".entry") for name in os.listdir(cache_dir))
+    finally:
+        server.shutdown()
+
+
+def _solid_png_b64(width: int, height: int, color=(40, 120, 200)) -> str:
+    import base64
+    import io
+
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def test_screenshot_store():
+    """
+    相同截图只写入一次，历史中保存的引用可以还原为原来的 base64
+    """
+    from src.utils.screenshot_store import ScreenshotStore, is_screenshot_ref, load_screenshot
+
+    first, second = _solid_png_b64(64, 64), _solid_png_b64(64, 64, color=(0, 0, 0))
+    with tempfile.TemporaryDirectory() as root_dir:
+        store = ScreenshotStore(root_dir)
+        refs = [store.put(first), store.put(second), store.put(first)]
+        assert refs[0] == refs[2] != refs[1] and all(is_screenshot_ref(ref) for ref in refs)
+        assert store.stored_count == 2 and store.deduplicated_count == 1
+        assert store.put(refs[0]) == refs[0]
+        assert load_screenshot(refs[0]) == first and store.get(refs[1]) == second
+    assert load_screenshot(first) == first
+
+
+def test_screenshot_crop():
+    """
+    裁剪区域加边距后限制在视口内，按设备像素比换算；目标不可见或区域过大时发送完整截图
+    """
+    from src.browser.screenshot_crop import ScreenshotCropSettings, crop_screenshot
+
+    settings = ScreenshotCropSettings(margin=48, min_width=320, min_height=200, thumbnail_width=160)
+    screenshot = _solid_png_b64(1280, 800)
+
+    # 右下角的元素：扩展后的区域被截断在视口边缘
+    cropped = crop_screenshot(screenshot, [(1200, 760, 1270, 790)], 1280, settings)
+    assert cropped.box == (1075.0, 675.0, 1280.0, 800.0)
+    assert cropped.full_pixels == 1280 * 800 and cropped.sent_pixels < cropped.full_pixels
+    assert cropped.thumbnail_b64
+
+    # 多个元素取并集，小目标扩展到最小尺寸
+    cropped = crop_screenshot(screenshot, [(100, 100, 120, 110), (300, 150, 340, 170)], 1280, settings)
+    left, top, right, bottom = cropped.box
+    assert right - left >= 320 and bottom - top >= 200 and left <= 100 and right >= 340
+
+    assert crop_screenshot(screenshot, [(1400, 900, 1500, 950)], 1280, settings) is None
+    assert crop_screenshot(screenshot, [(0, 0, 1100, 700)], 1280, settings) is None
+    assert crop_screenshot(screenshot, [], 1280, settings) is None
+
+    # 2x 设备像素比：坐标为 CSS 像素，裁剪按设备像素进行
+    hidpi = crop_screenshot(_solid_png_b64(2560, 1600), [(1200, 760, 1270, 790)], 1280, settings)
+    assert hidpi.box == (1075.0, 675.0, 1280.0, 800.0)
+    assert hidpi.sent_pixels - 160 * 100 == 4 * (205 * 125)
+
+
+if __name__ == "__main__":
+    asyncio.run(test_dom_delta_token_reduction())
+    # asyncio.run(test_browser_pool_latency())
+    # asyncio.run(test_context_multiplexing_memory())
+    # asyncio.run(test_content_extraction_cache())
+    # asyncio.run(test_storage_state_cache())
+    # asyncio.run(test_resource_blocking())
+    # asyncio.run(test_live_screencast())
+    # asyncio.run(test_http_disk_cache())
+    # test_screenshot_store()
+    # test_screenshot_crop()
@@ -1,4 +1,5 @@
 import asyncio
+import os
 import pdb
 import sys
 import time
@@ -126,6 +127,279 @@ async def test_controller_with_mcp():
     pdb.set_trace()
 
 
+def test_mcp_param_model_cache_benchmark():
+    """
+    Compare cold vs. warm param model build time and memory for 500 synthetic tool schemas
+    """
+    import tracemalloc
+    from types import SimpleNamespace
+    from src.utils.mcp_client import create_tool_param_model, clear_param_model_cache, get_param_model_cache_info
+
+    def synthetic_schema(i):
+        return {
+            "type": "object",
+            "properties": {
+                "path": {"type": "string", "description": "File path"},
+                "mode": {"type": "string", "enum": ["read", "write", "append"]},
+                "limit": {"type": "integer", "minimum": 1, "maximum": 1000},
+                "options": {"$ref": "#/$defs/Options"},
+                "filters": {"type": "array", "items": {"$ref": "#/$defs/Filter"}},
+                "tree": {"$ref": "#/$defs/Node"},
+                f"extra_{i % 50}": {"type": ["string", "null"]},
+            },
+            "required": ["path", "mode"],
+            "$defs": {
+                "Options": {"type": "object", "properties": {"recursive": {"type": "boolean"},
+                                                             "encoding": {"type": "string", "enum": ["utf-8", "gbk"]}}},
+                "Filter": {"type": "object", "properties": {"field": {"type": "string"},
+                                                            "op": {"type": "string", "enum": ["eq", "ne", "gt", "lt"]}}},
+                "Node": {"type": "object", "properties": {"children": {"type": "array",
+                                                                       "items": {"$ref": "#/$defs/Node"}}}},
+            },
+        }
+
+    tools = [SimpleNamespace(name=f"tool_{i}", args_schema=synthetic_schema(i)) for i in range(500)]
+
+    def setup_controller():
+        return [create_tool_param_model(tool) for tool in tools]
+
+    clear_param_model_cache()
+    tracemalloc.start()
+    start = time.perf_counter()
+    cold_models = setup_controller()
+    cold_seconds = time.perf_counter() - start
+    cold_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    warm_models = setup_controller()
+    warm_seconds = time.perf_counter() - start
+    warm_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"cold setup: {cold_seconds * 1000:.1f} ms, {cold_memory / 1024:.0f} KB")
+    print(f"warm setup: {warm_seconds * 1000:.1f} ms, {warm_memory / 1024:.0f} KB")
+    print(get_param_model_cache_info())
+
+    assert all(a is b for a, b in zip(cold_models, warm_models))
+    assert warm_seconds < cold_seconds
+    model = cold_models[0](path="/tmp/a.txt", mode="read", options={"recursive": True},
+                           filters=[{"field": "name", "op": "eq"}], tree={"children": [{"children": []}]})
+    assert model.options.recursive is True
+    assert model.filters[0].op.value == "eq"
+
+
+async def test_mcp_connection_pool():
+    """
+    Two controllers lease the same MCP servers one after another; the second must reuse the running connection
+    """
+    from src.controller.custom_controller import CustomController
+    from src.utils.mcp_pool import get_mcp_pool, close_mcp_pool
+
+    mcp_server_config = {
+        "mcpServers": {
+            "desktop-commander": {
+                "command": "npx",
+                "args": [
+                    "-y",
+                    "@wonderwhy-er/desktop-commander"
+                ]
+            },
+        }
+    }
+
+    timings = []
+    for _ in range(2):
+        controller = CustomController()
+        start = time.perf_counter()
+        await controller.setup_mcp_client(mcp_server_config)
+        timings.append(time.perf_counter() - start)
+        await controller.close_mcp_client()
+
+    stats = get_mcp_pool().stats
+    print(f"first setup: {timings[0]:.2f}s, second setup: {timings[1]:.2f}s")
+    print(stats.summary())
+    assert stats.connects == 1 and stats.reuses == 1
+    await close_mcp_pool()
+
+
+async def test_concurrent_tool_calls():
+    """
+    Tool calls from one LLM response run concurrently and results come back in call order; a slow tool does not hold up the others
+    """
+    from langchain_core.tools import StructuredTool
+    from src.agent.deep_research.deep_research_agent import _execute_tool_call
+
+    async def slow_echo(text: str, delay: float) -> str:
+        await asyncio.sleep(delay)
+        return text
+
+    tools = [StructuredTool.from_function(coroutine=slow_echo, name="slow_echo", description="Echo after a delay")]
+    tool_calls = [
+        {"name": "slow_echo", "args": {"text": f"call_{i}", "delay": 1.0 - i * 0.2}, "id": f"id_{i}"}
+        for i in range(4)
+    ]
+
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(*(_execute_tool_call(tool_call, tools) for tool_call in tool_calls))
+    elapsed = time.perf_counter() - start
+
+    print(f"4 tool calls finished in {elapsed:.2f}s (sequential: 2.80s)")
+    assert [output for _, output, _ in outcomes] == [f"call_{i}" for i in range(4)]
+    assert elapsed < 1.5
+
+
+def test_tool_selection_prompt_size():
+    """
+    Register 200 synthetic MCP tools and compare the action schema size when sending all actions vs. a relevance-selected subset
+    """
+    from types import SimpleNamespace
+    from browser_use.controller.registry.views import RegisteredAction
+    from src.agent.browser_use.tool_selection import ToolSelector, schema_chars
+    from src.controller.custom_controller import CustomController
+    from src.utils.mcp_client import create_tool_param_model
+
+    topics = ["file", "database", "email", "calendar", "weather", "stock", "translate", "image", "map", "news"]
+    controller = CustomController()
+
+    async def noop(**kwargs):
+        return None
+
+    for i in range(200):
+        topic = topics[i % len(topics)]
+        tool = SimpleNamespace(
+            name=f"{topic}_tool_{i}",
+            description=f"Operate on {topic} resources, variant {i}",
+            args_schema={"type": "object", "properties": {"query": {"type": "string", "description": f"{topic} query"}}},
+        )
+        name = f"mcp.server_{i % 5}.{tool.name}"
+        controller.registry.registry.actions[name] = RegisteredAction(
+            name=name, description=tool.description, function=noop, param_model=create_tool_param_model(tool)
+        )
+
+    actions = controller.registry.registry.actions
+    assert "request_tools" not in actions
+    selector = ToolSelector()
+    controller.set_tool_selector(selector)
+    start = time.perf_counter()
+    selected = selector.select(actions, "Check tomorrow's weather in Shanghai and add it to my calendar")
+    selection_ms = (time.perf_counter() - start) * 1000
+
+    full_chars = schema_chars(controller.registry.create_action_model())
+    sent_chars = schema_chars(controller.registry.create_action_model(include_actions=selected))
+    print(f"actions: {len(actions)} -> {len(selected)}, schema chars: {full_chars} -> {sent_chars} "
+          f"({1 - sent_chars / full_chars:.0%} smaller), selection: {selection_ms:.1f}ms")
+
+    assert "done" in selected and "request_tools" in selected
+    assert any("weather" in name for name in selected) and any("calendar" in name for name in selected)
+    assert sent_chars < full_chars / 4
+
+    requested = selector.request(actions, "translate text")
+    assert requested and all("translate" in name for name in requested)
+    assert set(requested) <= set(selector.select(actions, "weather"))
+
+
+async def test_mcp_result_cache():
+    """
+    Identical calls to an idempotent tool: concurrent calls are coalesced into one, later calls hit the memory or disk cache
+    """
+    import tempfile
+    from src.utils.mcp_result_cache import MCPResultCache, MCPResultCacheSettings
+
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.2)
+        return f"content of page (call {calls})"
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = MCPResultCache(MCPResultCacheSettings(cache_dir=cache_dir))
+        args = {"url": "https://example.com", "max_length": 5000}
+        results = await asyncio.gather(*(cache.get_or_call("fetch", "fetch", args, 60, fetch) for _ in range(5)))
+        assert calls == 1 and len(set(results)) == 1
+
+        # A different argument order hits the same cache entry
+        await cache.get_or_call("fetch", "fetch", {"max_length": 5000, "url": "https://example.com"}, 60, fetch)
+        # A new instance (simulating another process) hits the disk cache
+        other = MCPResultCache(MCPResultCacheSettings(cache_dir=cache_dir))
+        assert await other.get_or_call("fetch", "fetch", args, 60, fetch) == results[0]
+        assert calls == 1
+
+        print(cache.stats.summary())
+        print(other.stats.summary())
+
+
+async def test_lazy_mcp_startup():
+    """
+    Configure several MCP servers and compare the setup time before the first agent step with eager start vs. lazy start from the tool manifest
+    """
+    import tempfile
+    from src.controller.custom_controller import CustomController
+    from src.utils.mcp_manifest import MCPManifestSettings
+    from src.utils.mcp_pool import MCPPoolSettings, get_mcp_pool, close_mcp_pool
+
+    server = {"command": "npx", "args": ["-y", "@wonderwhy-er/desktop-commander"]}
+    mcp_server_config = {"mcpServers": {f"desktop-commander-{i}": dict(server) for i in range(6)}}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        settings = MCPPoolSettings(manifest=MCPManifestSettings(path=os.path.join(tmp_dir, "manifest.json")))
+        timings = {}
+        for lazy in (False, True):
+            # Close the pool after each round so the next one does not reuse servers started here
+            pool = get_mcp_pool(settings)
+            controller = CustomController()
+            start = time.perf_counter()
+            await controller.setup_mcp_client(mcp_server_config, lazy=lazy)
+            timings[lazy] = time.perf_counter() - start
+            mcp_actions = [name for name in controller.registry.registry.actions if name.startswith("mcp.")]
+            assert len(mcp_actions) > 0
+
+            if lazy:
+                assert len(controller.mcp_client.deferred_servers) == 6
+                # The server only starts on the first call to its tool
+                action_name = next(name for name in mcp_actions if name.endswith(".get_config"))
+                ActionModel = controller.registry.create_action_model(include_actions=[action_name])
+                result = await controller.act(ActionModel(**{action_name: {}}))
+                print(result.extracted_content[:200] if result.extracted_content else result)
+                assert pool.stats.lazy_started == 1
+                assert len(controller.mcp_client.deferred_servers) == 5
+
+            await controller.close_mcp_client()
+            print(f"lazy={lazy}: setup {timings[lazy]:.2f}s, {len(mcp_actions)} tools; {pool.stats.summary()}")
+            await close_mcp_pool()
+
+        print(f"time before first step: eager {timings[False]:.2f}s -> lazy {timings[True]:.3f}s")
+        assert timings[True] < timings[False]
+
+
+async def test_mcp_idle_reap():
+    """
+    After the lease is released and the idle server is reaped, a tool call on the old lease leases again from the pool instead of restarting the process on the reaped connection
+    """
+    from src.utils.mcp_pool import MCPConnectionPool, MCPPoolSettings
+
+    mcp_server_config = {"mcpServers": {"desktop-commander": {"command": "npx", "args": ["-y", "@wonderwhy-er/desktop-commander"]}}}
+    pool = MCPConnectionPool(MCPPoolSettings(idle_timeout=0.5, reap_interval=0.2))
+    lease = await pool.acquire(mcp_server_config)
+    reaped = lease._connections["desktop-commander"]
+    await lease.release()
+
+    await asyncio.sleep(1.5)
+    assert pool.stats.idle_shutdowns == 1 and reaped.closed and not pool._connections
+
+    result = await lease.invoke("desktop-commander", "get_config", {})
+    print(str(result)[:200])
+    fresh = lease._connections["desktop-commander"]
+    assert fresh is not reaped and fresh.connected and not reaped.connected
+    assert list(pool._connections.values()) == [fresh] and fresh.leases == 0
+    print(pool.stats.summary())
+    await pool.close()
+
+
 if __name__ == '__main__':
     # asyncio.run(test_mcp_client())
     asyncio.run(test_controller_with_mcp())
+    # asyncio.run(test_mcp_idle_reap())